@@ -0,0 +1,155 @@
+"""
+Boot benchmark: how long a new web worker takes to start and to answer its first requests.
+
+Each run starts a fresh Python process that imports video.wsgi (Django setup, every app and
+the middleware, plus the warm start if it is on) and then sends one request to each page
+straight to the WSGI application. The pages haven't been cached yet, so the first request to
+each pays for whatever the worker hasn't done at boot. Three setups are compared:
+
+    cold        - VIDEO_WARM_START=0, everything happens on the first requests
+    warm        - VIDEO_WARM_START=1, templates, URL resolver and static files done at boot
+    public_only - warm, and VIDEO_PUBLIC_ONLY=1 so the admin isn't loaded at all
+
+with production settings (benchmarks/production_settings.py: DEBUG off, plain static file
+names). time_to_first_response is from the start of the process, interpreter start up
+included, to the end of the first response. --import-profile adds the slowest top level
+imports, from python -X importtime, by package.
+
+Run from the project directory:
+
+    python -m benchmarks.bench_boot [--runs 10] [--videos 1000] [--import-profile] [--output results.json]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from . import common
+
+
+SETUPS = {
+    'cold': {'VIDEO_WARM_START': '0'},
+    'warm': {'VIDEO_WARM_START': '1'},
+    'public_only': {'VIDEO_WARM_START': '1', 'VIDEO_PUBLIC_ONLY': '1'},
+}
+
+PATHS = ['/video_list', '/video_details/1', '/', '/popular']
+
+
+def request(application, path):
+    from wsgiref.util import setup_testing_defaults
+
+    environ = {'PATH_INFO': path, 'REQUEST_METHOD': 'GET', 'HTTP_HOST': 'localhost'}
+    setup_testing_defaults(environ)
+    statuses = []
+    body = application(environ, lambda status, headers, exc_info=None: statuses.append(status))
+    try:
+        b''.join(body)
+    finally:
+        getattr(body, 'close', lambda: None)()
+    return statuses[0]
+
+
+def run_worker():
+    # runs in the new process, prints its timings as JSON
+    started = time.perf_counter()
+    from video.wsgi import application
+    setup = time.perf_counter() - started
+
+    first_responses = {}
+    for path in PATHS:
+        elapsed, status = common.timed(request, application, path)
+        if not status.startswith('200'):
+            raise SystemExit(f'{path} answered {status}')
+        first_responses[path] = round(elapsed * 1000, 3)
+    print(json.dumps({'setup_ms': round(setup * 1000, 3), 'first_response_ms': first_responses}))
+
+
+def import_profile(stderr, top=15):
+    """
+    [(package, ms), ...] for the packages whose modules took longest to import, from the self
+    times -X importtime reports. django.contrib apps are listed separately, e.g.
+    django.contrib.admin, since they are what VIDEO_PUBLIC_ONLY can leave out.
+    """
+    totals = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        own, _, name = line[len('import time:'):].split('|')
+        parts = name.strip().split('.')
+        package = '.'.join(parts[:3] if parts[:2] == ['django', 'contrib'] else parts[:2] if parts[0] == 'django' else parts[:1])
+        totals[package] = totals.get(package, 0) + int(own) / 1000
+    return [(package, round(ms, 3)) for package, ms in sorted(totals.items(), key=lambda item: -item[1])[:top]]
+
+
+def run_setup(name, runs, env, profile_imports):
+    setup_times, first_times, process_times, per_path = [], [], [], {path: [] for path in PATHS}
+    env = dict(env, **SETUPS[name], DJANGO_SETTINGS_MODULE='benchmarks.production_settings')
+    profile = None
+    for run in range(runs):
+        command = [sys.executable]
+        if profile_imports and run == 0:
+            command += ['-X', 'importtime']
+        command += ['-m', 'benchmarks.bench_boot', '--worker']
+        started = time.perf_counter()
+        output = subprocess.run(command, env=env, check=True, capture_output=True, text=True)
+        process_times.append(time.perf_counter() - started)
+        timings = json.loads(output.stdout)
+        if profile_imports and run == 0:
+            profile = import_profile(output.stderr)
+            continue  # -X importtime slows everything down, so this run isn't timed
+        setup_times.append(timings['setup_ms'] / 1000)
+        first_path = PATHS[0]
+        first_times.append((timings['setup_ms'] + timings['first_response_ms'][first_path]) / 1000)
+        for path, elapsed in timings['first_response_ms'].items():
+            per_path[path].append(elapsed / 1000)
+
+    results = {
+        'setup': common.summarize(setup_times),
+        'time_to_first_response': common.summarize(first_times),
+        'process': common.summarize(process_times[1:] if profile else process_times),
+        'first_response': {path: common.summarize(times) for path, times in per_path.items()},
+    }
+    if profile:
+        results['slowest_imports_ms'] = profile
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=10, help='Worker processes started per setup')
+    parser.add_argument('--videos', type=int, default=1000, help='Videos in the scratch database')
+    parser.add_argument('--import-profile', action='store_true', help='Also list the slowest imports')
+    parser.add_argument('--output', help='File to write the JSON results to, instead of standard output')
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker()
+        return
+
+    with tempfile.TemporaryDirectory() as scratch:
+        db_path = os.path.join(scratch, 'bench.sqlite3')
+        env = dict(os.environ, VIDEO_DB_PROFILE='sqlite', VIDEO_DB_PATH=db_path)
+        common.setup_django(db_path)
+        common.migrate()
+        common.create_videos(args.videos)
+
+        results = {'runs': args.runs, 'videos': args.videos, 'setups': {}}
+        for name in SETUPS:
+            results['setups'][name] = run_setup(name, args.runs, env, args.import_profile)
+
+    cold = results['setups']['cold']['time_to_first_response']['p50_ms']
+    warm = results['setups']['warm']['time_to_first_response']['p50_ms']
+    results['first_response_speedup_p50'] = {
+        path: round(results['setups']['cold']['first_response'][path]['p50_ms'] / results['setups']['warm']['first_response'][path]['p50_ms'], 2)
+        for path in PATHS
+    }
+    results['time_to_first_response_change_p50_ms'] = round(warm - cold, 3)
+    common.write_results(results, args.output)
+
+
+if __name__ == '__main__':
+    main()
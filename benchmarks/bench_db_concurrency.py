@@ -0,0 +1,124 @@
+"""
+Read/write concurrency benchmark for the SQLite database profile.
+
+Runs reader threads (list pages) alongside writer threads (adding videos) against a scratch
+database, once with SQLite's defaults (rollback journal, synchronous=FULL) and once with the
+tuned SQLITE_PRAGMAS from video/settings.py, and reports throughput, latency percentiles and
+"database is locked" errors for each.
+
+Run from the project directory:
+
+    python -m benchmarks.bench_db_concurrency [--videos 10000] [--seconds 5] [--readers 4] [--writers 2]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from . import common
+
+
+def run_worker(args):
+    common.setup_django()
+    from django.db import OperationalError, connection, connections
+    from video_collection.db import sqlite_pragma
+    from video_collection.models import Video
+    from video_collection.pagination import paginate, video_sort_key
+
+    common.migrate()
+    common.create_videos(args.videos)
+    max_pk = Video.objects.order_by('-pk').values_list('pk', flat=True).first()
+    journal_mode = sqlite_pragma(connection, 'journal_mode')
+    connections.close_all()
+
+    deadline = time.perf_counter() + args.seconds
+    read_latencies, write_latencies, errors = [], [], []
+    lock = threading.Lock()
+
+    def reader(number):
+        latencies = []
+        pk = number * 997
+        while time.perf_counter() < deadline:
+            pk = (pk + 7919) % max_pk
+            try:
+                elapsed, page = common.timed(
+                    paginate, video_sort_key(Video.objects.filter(pk__gte=pk)), page_size=25
+                )
+                latencies.append(elapsed)
+            except OperationalError as e:
+                with lock:
+                    errors.append(str(e))
+        connections.close_all()
+        with lock:
+            read_latencies.extend(latencies)
+
+    def writer(number):
+        latencies = []
+        rows = common.video_rows(10 ** 7, seed=number, start=10 ** 9 * (number + 1))
+        while time.perf_counter() < deadline:
+            row = next(rows)
+            try:
+                elapsed, video = common.timed(
+                    Video.objects.create, name=row['name'], url=row['url'], notes=row['notes']
+                )
+                latencies.append(elapsed)
+            except OperationalError as e:
+                with lock:
+                    errors.append(str(e))
+        connections.close_all()
+        with lock:
+            write_latencies.extend(latencies)
+
+    threads = [threading.Thread(target=reader, args=(n,)) for n in range(args.readers)]
+    threads += [threading.Thread(target=writer, args=(n,)) for n in range(args.writers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    common.write_results({
+        'journal_mode': journal_mode,
+        'reads': common.summarize(read_latencies),
+        'writes': common.summarize(write_latencies),
+        'reads_per_second': round(len(read_latencies) / args.seconds, 1),
+        'writes_per_second': round(len(write_latencies) / args.seconds, 1),
+        'errors': len(errors),
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--videos', type=int, default=10000)
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--readers', type=int, default=4)
+    parser.add_argument('--writers', type=int, default=2)
+    parser.add_argument('--output', help='File to write the JSON results to, instead of standard output')
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args)
+        return
+
+    # each profile runs in its own process and database file, since journal_mode is stored in
+    # the file and settings are read once at startup
+    results = {'videos': args.videos, 'seconds': args.seconds, 'readers': args.readers, 'writers': args.writers}
+    for profile, tuning in (('sqlite_defaults', '0'), ('sqlite_tuned', '1')):
+        with tempfile.TemporaryDirectory() as scratch:
+            env = dict(os.environ, VIDEO_DB_PROFILE='sqlite', VIDEO_SQLITE_TUNING=tuning,
+                       VIDEO_DB_PATH=os.path.join(scratch, 'bench.sqlite3'))
+            worker_args = [a for a in sys.argv[1:] if not a.startswith('--output')]
+            output = subprocess.run(
+                [sys.executable, '-m', 'benchmarks.bench_db_concurrency', '--worker', *worker_args],
+                env=env, check=True, capture_output=True, text=True,
+            ).stdout
+            results[profile] = json.loads(output)
+
+    common.write_results(results, args.output)
+
+
+if __name__ == '__main__':
+    main()
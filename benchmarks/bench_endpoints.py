@@ -0,0 +1,163 @@
+"""
+Latency and query-count benchmark for every video_collection endpoint.
+
+For each collection size a scratch database is filled with synthetic videos (names, show
+notes of varying length, unique YouTube ids), then each endpoint is requested repeatedly
+through Django's test client. Every endpoint is measured cold (page cache cleared before
+each request, so the database and templates do all the work) and warm (served from the
+page cache). Results are latency percentiles and SQL queries per request, as JSON.
+
+Run from the project directory:
+
+    python -m benchmarks.bench_endpoints [--sizes 1000 100000 1000000] [--requests 50] [--output results.json]
+
+To catch regressions in CI, compare against results saved from an earlier run. The exit
+status is 1 if any endpoint's p95 got slower by more than --tolerance, or made more queries:
+
+    python -m benchmarks.bench_endpoints --compare baseline.json --tolerance 0.5
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+from . import common
+
+
+def endpoints(size, rng):
+    """
+    (name, method, path function, data function) for each endpoint. Paths are functions so
+    each request can pick a different video or search term.
+    """
+    from django.urls import reverse
+    from video_collection.models import Video
+
+    max_pk = Video.objects.order_by('-pk').values_list('pk', flat=True).first()
+    new_rows = common.video_rows(10 ** 7, seed=1, start=10 ** 9)
+
+    def random_word():
+        return rng.choice(common.WORDS)
+
+    def add_data():
+        row = next(new_rows)
+        return {'name': row['name'], 'url': row['url'], 'notes': row['notes'] or ''}
+
+    return [
+        ('home', 'get', lambda: reverse('home'), None),
+        ('add_form', 'get', lambda: reverse('add_video'), None),
+        ('add_submit', 'post', lambda: reverse('add_video'), add_data),
+        ('video_list', 'get', lambda: reverse('video_list'), None),
+        ('video_list_search', 'get', lambda: f'{reverse("video_list")}?search_term={random_word()}', None),
+        ('video_details', 'get', lambda: reverse('video_details', args=[rng.randint(1, max_pk)]), None),
+        ('api_video_list', 'get', lambda: reverse('api_video_list'), None),
+        ('api_video_list_search', 'get', lambda: f'{reverse("api_video_list")}?search_term={random_word()}', None),
+        ('api_video_details', 'get', lambda: reverse('api_video_details', args=[rng.randint(1, max_pk)]), None),
+    ]
+
+
+def measure(client, method, path, data, requests, clear_cache):
+    from django.core.cache import cache
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    latencies, queries, statuses = [], [], set()
+    for _ in range(requests):
+        if clear_cache:
+            cache.clear()
+        request_path = path()
+        request_data = data() if data else None
+        with CaptureQueriesContext(connection) as captured:
+            elapsed, response = common.timed(getattr(client, method), request_path, request_data)
+        latencies.append(elapsed)
+        queries.append(len(captured.captured_queries))
+        statuses.add(response.status_code)
+
+    return {
+        **common.summarize(latencies),
+        'queries_max': max(queries),
+        'queries_mean': round(sum(queries) / len(queries), 2),
+        'statuses': sorted(statuses),
+    }
+
+
+def run_worker(args):
+    common.setup_django()
+    from django.test import Client, override_settings
+
+    size = args.sizes[0]
+    common.migrate()
+    elapsed, _ = common.timed(common.create_videos, size)
+
+    rng = random.Random(0)
+    client = Client(SERVER_NAME='localhost')  # an allowed host without running under the test runner
+    results = {'size': size, 'setup_seconds': round(elapsed, 2), 'endpoints': {}}
+    # every request comes from the one client, which would soon be over the write rate limit,
+    # and add_submit would measure 429 responses instead of adds
+    with override_settings(VIDEO_WRITE_RATE_LIMITS={}):
+        for name, method, path, data in endpoints(size, rng):
+            # a few requests first so one-off costs (imports, template compilation) aren't counted
+            measure(client, method, path, data, 3, clear_cache=True)
+            results['endpoints'][name] = {
+                'cold': measure(client, method, path, data, args.requests, clear_cache=True),
+                'warm': measure(client, method, path, data, args.requests, clear_cache=False),
+            }
+    common.write_results(results)
+
+
+def compare(results, baseline, tolerance):
+    # returns a list of regressions between two result files
+    regressions = []
+    for size, endpoints_results in results['sizes'].items():
+        baseline_endpoints = baseline.get('sizes', {}).get(size, {}).get('endpoints', {})
+        for name, modes in endpoints_results['endpoints'].items():
+            for mode, current in modes.items():
+                previous = baseline_endpoints.get(name, {}).get(mode)
+                if not previous:
+                    continue
+                if current['p95_ms'] > previous['p95_ms'] * (1 + tolerance):
+                    regressions.append(f'{size} videos, {name} ({mode}): p95 {previous["p95_ms"]}ms -> {current["p95_ms"]}ms')
+                if current['queries_max'] > previous['queries_max']:
+                    regressions.append(f'{size} videos, {name} ({mode}): queries {previous["queries_max"]} -> {current["queries_max"]}')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000], help='Collection sizes to benchmark')
+    parser.add_argument('--requests', type=int, default=50, help='Requests per endpoint and mode')
+    parser.add_argument('--output', help='File to write the JSON results to, instead of standard output')
+    parser.add_argument('--compare', help='Earlier results to check for regressions against')
+    parser.add_argument('--tolerance', type=float, default=0.5, help='Allowed p95 slowdown as a fraction, for --compare')
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args)
+        return
+
+    # one process and scratch database per size, so sizes don't share caches or connections
+    results = {'requests': args.requests, 'sizes': {}}
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory() as scratch:
+            env = dict(os.environ, VIDEO_DB_PROFILE='sqlite', VIDEO_DB_PATH=os.path.join(scratch, 'bench.sqlite3'))
+            output = subprocess.run(
+                [sys.executable, '-m', 'benchmarks.bench_endpoints', '--worker',
+                 '--sizes', str(size), '--requests', str(args.requests)],
+                env=env, check=True, capture_output=True, text=True,
+            ).stdout
+            results['sizes'][str(size)] = json.loads(output)
+
+    common.write_results(results, args.output)
+
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            regressions = compare(results, json.load(baseline_file), args.tolerance)
+        for regression in regressions:
+            sys.stderr.write(f'regression: {regression}\n')
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
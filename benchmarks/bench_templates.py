@@ -0,0 +1,116 @@
+"""
+Render-time benchmark for the video list template.
+
+Renders a page of videos (1000 by default, with notes of varying length) without touching the
+database, in two setups:
+
+    before     - the list template as it was, reversing each video's details URL with
+                 {% url %}, in the engine the project used to configure: APP_DIRS, which
+                 Django wraps in the cached loader, and template debugging on with DEBUG = True
+    after      - the current template with details URLs worked out once per page in the view
+                 (views.with_details_urls), in the engine video/settings.py configures now
+
+Run from the project directory:
+
+    python -m benchmarks.bench_templates [--rows 1000] [--renders 50] [--output results.json]
+"""
+import argparse
+from . import common
+
+
+# video_list.html before details URLs were worked out in the view
+BEFORE_TEMPLATE = '''{% extends 'video_collection/base.html' %}
+{% block content %}
+<h2>Video List</h2>
+<h3>Search Videos</h3>
+<form method="GET" action="{% url 'video_list' %}">
+    {{ search_form }}
+    <button type="submit">Search</button>
+</form>
+<a href="{% url 'video_list' %}"><button>Clear Search</button></a>
+<h3>{{ video_count }} video{{ video_count|pluralize }}</h3>
+{% for video in videos %}
+    <div>
+        <a href="{% url 'video_details' video.pk %}"><h3>{{ video.name }}</h3></a>
+        <p>{{ video.notes }}</p>
+        {% include 'video_collection/embed.html' %}
+        <p><a href="{{video.url}}">{{ video.url }}</a></p>
+    </div>
+{% empty %}
+    <p>No videos found.</p>
+{% endfor %}
+{% endblock %}
+'''
+
+
+def make_engine(debug):
+    # the cached loader over the project's loaders, as the old APP_DIRS setup had it
+    from django.conf import settings
+    from django.template import Engine
+    from django.template.backends.django import get_installed_libraries
+
+    return Engine(
+        loaders=[('django.template.loaders.cached.Loader', settings.TEMPLATE_LOADERS)],
+        debug=debug,
+        libraries=get_installed_libraries(),
+    )
+
+
+def make_videos(count):
+    # unsaved videos with primary keys, and no tags as if they had been prefetched, so nothing
+    # needs a database
+    from video_collection.models import Tag, Video
+
+    videos = [Video(pk=index + 1, **row) for index, row in enumerate(common.video_rows(count))]
+    for video in videos:
+        video._prefetched_objects_cache = {'tags': Tag.objects.none()}
+    return videos
+
+
+def measure(render, renders):
+    render()  # the first render compiles whatever the loader caches
+    return common.summarize([common.timed(render)[0] for _ in range(renders)])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=1000, help='Videos on the rendered page')
+    parser.add_argument('--renders', type=int, default=50, help='Renders to time per setup')
+    parser.add_argument('--output', help='File to write the JSON results to, instead of standard output')
+    args = parser.parse_args()
+
+    common.setup_django()
+    from django.template import Context, engines
+    from video_collection.forms import SearchForm
+    from video_collection.views import with_details_urls
+
+    videos = make_videos(args.rows)
+    context = {
+        'video_count': len(videos),
+        'search_form': SearchForm(),
+        'embed_mode': 'facade',
+    }
+
+    before_template = make_engine(debug=True).from_string(BEFORE_TEMPLATE)
+
+    def render_before():
+        return before_template.render(Context(dict(context, videos=videos)))
+
+    configured_engine = engines.all()[0].engine
+
+    def render_after():
+        template = configured_engine.get_template('video_collection/video_list.html')
+        return template.render(Context(dict(context, videos=with_details_urls(videos))))
+
+    results = {
+        'rows': args.rows,
+        'renders': args.renders,
+        'before': measure(render_before, args.renders),
+        'after': measure(render_after, args.renders),
+    }
+    results['speedup_p50'] = round(results['before']['p50_ms'] / results['after']['p50_ms'], 2)
+    common.write_results(results, args.output)
+
+
+if __name__ == '__main__':
+    main()
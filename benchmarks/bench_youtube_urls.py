@@ -0,0 +1,81 @@
+"""
+Microbenchmark for YouTube URL parsing.
+
+Compares the per-URL cost of the original urlparse/parse_qs rules that used to live in
+Video.save with the compiled parser in video_collection.youtube, both with a cold cache
+(every URL new) and a warm one (the same URLs again, as in a re-imported playlist).
+
+Run from the project directory:
+
+    python -m benchmarks.bench_youtube_urls [--urls 10000] [--repeat 5]
+"""
+import argparse
+import json
+import random
+import string
+import timeit
+from urllib import parse
+from django.core.exceptions import ValidationError
+from video_collection import youtube
+
+
+def legacy_parse(url):
+    # the rules Video.save used before video_collection.youtube existed
+    if not url.startswith('https://www.youtube.com/watch'):
+        raise ValidationError(f'Not a YouTube URL {url}')
+    url_components = parse.urlparse(url)
+    if url_components.scheme != 'https' or url_components.netloc != 'www.youtube.com' or url_components.path != '/watch':
+        raise ValidationError(f'Not a YouTube URL {url}')
+    if not url_components.query:
+        raise ValidationError(f'Invalid YouTube URL {url}')
+    v_parameters_list = parse.parse_qs(url_components.query, strict_parsing=True).get('v')
+    if not v_parameters_list:
+        raise ValidationError(f'Invalid Youtube URL {url}')
+    return v_parameters_list[0]
+
+
+def make_urls(count, seed=0):
+    # watch URLs, some with timestamps and playlist parameters like links copied from a browser
+    rng = random.Random(seed)
+    alphabet = string.ascii_letters + string.digits + '-_'
+    urls = []
+    for _ in range(count):
+        video_id = ''.join(rng.choices(alphabet, k=11))
+        extra = rng.choice(['', '&t=30s', '&list=PL' + video_id + '&index=3'])
+        urls.append(f'https://www.youtube.com/watch?v={video_id}{extra}')
+    return urls
+
+
+def per_url_ns(function, urls, repeat):
+    best = min(timeit.repeat(lambda: [function(url) for url in urls], number=1, repeat=repeat))
+    return best / len(urls) * 1e9
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--urls', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    urls = make_urls(args.urls)
+
+    # lru_cache keeps the undecorated function as __wrapped__, which is the cold cache cost
+    uncached = youtube._parse.__wrapped__
+
+    # the cache holds the most recently parsed URLs, so the warm run uses as many as it can hold
+    cached_urls = urls[-youtube.CACHE_SIZE:]
+    youtube.clear_cache()
+    for url in cached_urls:
+        youtube.extract_video_id(url)
+
+    results = {
+        'urls': len(urls),
+        'legacy_ns_per_url': round(per_url_ns(legacy_parse, urls, args.repeat)),
+        'compiled_ns_per_url': round(per_url_ns(uncached, urls, args.repeat)),
+        'cached_ns_per_url': round(per_url_ns(youtube.extract_video_id, cached_urls, args.repeat)),
+    }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+"""
+Shared helpers for the benchmark scripts: Django setup against a scratch database,
+synthetic videos, latency summaries and JSON results.
+"""
+import json
+import os
+import random
+import sys
+import time
+
+
+def setup_django(db_path=None):
+    # must run before anything imports the models. The database is a scratch SQLite file, so
+    # the benchmarks never touch db.sqlite3
+    if db_path is not None:
+        os.environ['VIDEO_DB_PATH'] = str(db_path)
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'video.settings')
+    import django
+    django.setup()
+
+
+def migrate():
+    from django.core.management import call_command
+    call_command('migrate', verbosity=0, interactive=False)
+
+
+WORDS = (
+    'podcast episode interview news review music live guest history science comedy game '
+    'politics music tech weekly special season finale behind scenes story talk show '
+    'leftovers update recap question answer deep dive explained'
+).split()
+
+
+def video_rows(count, seed=0, start=0):
+    """
+    Yields dicts of name, url, notes and video_id for count synthetic videos. Notes vary from
+    empty to a few paragraphs, like real show notes, and video ids are unique per index.
+    """
+    rng = random.Random(seed + start)
+    for index in range(start, start + count):
+        video_id = f'{index:011x}'[-11:]
+        name = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(2, 8))).title() + f' #{index}'
+        sentences = rng.choice([0, 1, 3, 10, 30])
+        notes = ' '.join(
+            ' '.join(rng.choice(WORDS) for _ in range(rng.randint(6, 20))).capitalize() + '.'
+            for _ in range(sentences)
+        ) or None
+        yield {'name': name, 'url': f'https://www.youtube.com/watch?v={video_id}', 'notes': notes, 'video_id': video_id}
+
+
+def create_videos(count, batch_size=5000, seed=0):
+    # inserted with bulk_create, so generating a million videos takes seconds rather than hours
+    from django.db import transaction
+    from video_collection.models import Video
+
+    rows = video_rows(count, seed)
+    created = 0
+    while created < count:
+        # the generated urls are already in canonical form
+        batch = [Video(**row, canonical_url=row['url']) for _, row in zip(range(batch_size), rows)]
+        with transaction.atomic():
+            Video.objects.bulk_create(batch)
+        created += len(batch)
+
+
+def percentile(values, fraction):
+    # nearest-rank percentile, values don't need to be sorted
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, round(fraction * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarize(latencies):
+    # latencies in seconds, summary in milliseconds
+    if not latencies:
+        return {'count': 0}
+    return {
+        'count': len(latencies),
+        'mean_ms': round(sum(latencies) / len(latencies) * 1000, 3),
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 3),
+        'max_ms': round(max(latencies) * 1000, 3),
+    }
+
+
+def timed(function, *args, **kwargs):
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+
+def write_results(results, output=None):
+    # machine-readable results, to a file or standard output
+    text = json.dumps(results, indent=2, sort_keys=True)
+    if output:
+        with open(output, 'w') as output_file:
+            output_file.write(text + '\n')
+    else:
+        sys.stdout.write(text + '\n')
@@ -0,0 +1,13 @@
+"""
+video.settings as a production worker runs them, with DEBUG off, except that static files
+keep their plain names, so pages render without collectstatic having been run. Used by
+bench_boot.
+"""
+from video.settings import *  # noqa: F401,F403
+from video.settings import STORAGES
+
+DEBUG = False
+
+ALLOWED_HOSTS = ['localhost']
+
+STORAGES = dict(STORAGES, staticfiles={'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'})
@@ -3,14 +3,34 @@ ASGI config for video project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+To serve the video list and details pages with async views, so that one worker
+can serve many slow clients at once, turn on the async views and run under an
+ASGI server, for example:
+
+    VIDEO_ASYNC_VIEWS=1 uvicorn video.asgi:application --workers 4
+
+Without VIDEO_ASYNC_VIEWS the sync views are used, and under ASGI Django runs
+each of them in a thread through its sync adapter. Keep them off under WSGI
+(video/wsgi.py), where async views would be run through the adapter instead.
+
+Workers warm up while starting unless VIDEO_WARM_START=0, see video_collection/warmup.py.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/4.0/howto/deployment/asgi/
 """
 
 import os
+import time
+
+started = time.perf_counter()
 
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'video.settings')
+os.environ.setdefault('VIDEO_WARM_START', '1')
 
 application = get_asgi_application()
+
+from video_collection.warmup import log_boot
+
+log_boot(time.perf_counter() - started)
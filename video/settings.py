@@ -10,8 +10,12 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.0/ref/settings/
 """
 
+import os
 from pathlib import Path
 
+import django
+from django.core.exceptions import ImproperlyConfigured
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -30,6 +34,12 @@ ALLOWED_HOSTS = []
 
 # Application definition
 
+# VIDEO_PUBLIC_ONLY=1 leaves the admin out, for worker processes that only serve the site (send
+# /admin/ to workers started without it). They start faster and don't load the admin's code,
+# forms and templates at all
+
+VIDEO_PUBLIC_ONLY = os.environ.get('VIDEO_PUBLIC_ONLY') == '1'
+
 INSTALLED_APPS = [
     'django.contrib.admin',
     'django.contrib.auth',
@@ -40,8 +50,20 @@ INSTALLED_APPS = [
     'video_collection'
 ]
 
+if VIDEO_PUBLIC_ONLY:
+    INSTALLED_APPS.remove('django.contrib.admin')
+
+# web workers compile the templates and build the URL resolver while starting up rather than
+# on their first requests (see video_collection/warmup.py). video/wsgi.py and video/asgi.py
+# turn this on unless VIDEO_WARM_START=0, manage.py commands don't need it
+
+VIDEO_WARM_START = os.environ.get('VIDEO_WARM_START') == '1'
+
 MIDDLEWARE = [
+    'video_collection.instrumentation.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'video_collection.staticfiles.StaticFilesMiddleware',
+    'video_collection.public.PublicPageMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -52,12 +74,21 @@ MIDDLEWARE = [
 
 ROOT_URLCONF = 'video.urls'
 
+# the cached loader compiles each template once per process. During development the
+# autoreloader empties it whenever a template changes, so edits still show up straight away
+TEMPLATE_LOADERS = [
+    'django.template.loaders.filesystem.Loader',
+    'django.template.loaders.app_directories.Loader',
+]
+
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # the standard Django templates, timed for the request metrics
+        'BACKEND': 'video_collection.instrumentation.InstrumentedDjangoTemplates',
+        'NAME': 'django', # the alias would otherwise come from the backend's module, 'instrumentation'
         'DIRS': [],
-        'APP_DIRS': True,
         'OPTIONS': {
+            'loaders': [('django.template.loaders.cached.Loader', TEMPLATE_LOADERS)],
             'context_processors': [
                 'django.template.context_processors.debug',
                 'django.template.context_processors.request',
@@ -74,12 +105,84 @@ WSGI_APPLICATION = 'video.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/4.0/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# VIDEO_DB_PROFILE picks the database:
+#   sqlite   - a local file (VIDEO_DB_PATH, default db.sqlite3) tuned for concurrent readers,
+#              see SQLITE_PRAGMAS below
+#   postgres - PostgreSQL from the VIDEO_DB_* variables, with persistent connections
+
+VIDEO_DB_PROFILE = os.environ.get('VIDEO_DB_PROFILE', 'sqlite')
+
+if VIDEO_DB_PROFILE == 'sqlite':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('VIDEO_DB_PATH', BASE_DIR / 'db.sqlite3'),
+            'OPTIONS': {
+                # seconds to wait for another connection's write lock before giving up. This is
+                # SQLite's busy timeout, so it isn't set again in SQLITE_PRAGMAS
+                'timeout': 20,
+            },
+        }
+    }
+    if django.VERSION >= (5, 1):
+        # take the write lock when a transaction starts, rather than upgrading a read lock
+        # part way through, which fails straight away if another connection is writing
+        DATABASES['default']['OPTIONS']['transaction_mode'] = 'IMMEDIATE'
+elif VIDEO_DB_PROFILE == 'postgres':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('VIDEO_DB_NAME', 'video'),
+            'USER': os.environ.get('VIDEO_DB_USER', ''),
+            'PASSWORD': os.environ.get('VIDEO_DB_PASSWORD', ''),
+            'HOST': os.environ.get('VIDEO_DB_HOST', ''),
+            'PORT': os.environ.get('VIDEO_DB_PORT', ''),
+            # keep connections open between requests, and check they still work before reusing them
+            'CONN_MAX_AGE': int(os.environ.get('VIDEO_DB_CONN_MAX_AGE', 600)),
+            'CONN_HEALTH_CHECKS': True,
+        }
+    }
+else:
+    raise ImproperlyConfigured(f'Unknown VIDEO_DB_PROFILE {VIDEO_DB_PROFILE}, use sqlite or postgres')
+
+# applied to every new SQLite connection (see video_collection/db.py). WAL lets readers carry
+# on while a video is being added, and NORMAL sync is safe in WAL mode - a power cut can lose
+# the last few commits but never corrupts the database. Set VIDEO_SQLITE_TUNING=0 to use
+# SQLite's defaults instead.
+
+if os.environ.get('VIDEO_SQLITE_TUNING', '1') == '1':
+    SQLITE_PRAGMAS = {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'mmap_size': 256 * 1024 * 1024,  # bytes of the database file read through memory mapping
+        'cache_size': -20000,  # negative means KiB, so about 20MB of page cache per connection
+        'temp_store': 'MEMORY',
+    }
+else:
+    SQLITE_PRAGMAS = {}
+
+
+# Cache
+# https://docs.djangoproject.com/en/4.0/topics/cache/
+# pages are cached in memory by default. Set VIDEO_CACHE_DIR to share the cache between
+# worker processes through files instead.
+
+if os.environ.get('VIDEO_CACHE_DIR'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.environ['VIDEO_CACHE_DIR'],
+            'OPTIONS': {'MAX_ENTRIES': 10000},
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'video-collection',
+            'OPTIONS': {'MAX_ENTRIES': 10000},
+        }
     }
-}
 
 
 # Password validation
@@ -118,7 +221,164 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+# where collectstatic puts the fingerprinted and compressed files, served by
+# video_collection.staticfiles.StaticFilesMiddleware
+STATIC_ROOT = BASE_DIR / 'staticfiles'
+
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        # plain names during development, so there's no need to run collectstatic after each change
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage' if DEBUG
+        else 'video_collection.staticfiles.CompressedManifestStaticFilesStorage',
+    },
+}
+
+# stylesheets served as the single file css/bundle.css, in this order
+VIDEO_CSS_BUNDLE = ['css/vendor/water.css', 'css/style.css']
+
+# third party files to keep in video_collection/static, downloaded by `manage.py vendor_static`.
+# Until a file has been downloaded and committed, pages link its URL instead
+VIDEO_VENDORED_STATIC = {
+    'css/vendor/water.css': 'https://cdn.jsdelivr.net/npm/water.css@2.1.1/out/dark.css',
+}
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.0/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+
+# Video list pagination
+# number of videos shown per page, which can be changed with ?page_size= up to the maximum
+
+VIDEO_LIST_PAGE_SIZE = 25
+
+VIDEO_LIST_MAX_PAGE_SIZE = 100
+
+# how many of the most used tags are linked above the video list
+VIDEO_TAG_CLOUD_SIZE = 30
+
+
+# Admin
+# the video changelist pages by primary key, newest first, instead of page numbers, and
+# doesn't count the whole table: the unfiltered list shows the database's estimate of the
+# number of videos, and searches and filters stop counting at VIDEO_ADMIN_COUNT_LIMIT. Bulk
+# actions work through the selected videos VIDEO_ADMIN_CHUNK_SIZE at a time.
+
+VIDEO_ADMIN_PAGE_SIZE = 100
+
+VIDEO_ADMIN_COUNT_LIMIT = 10000
+
+VIDEO_ADMIN_CHUNK_SIZE = 1000
+
+
+# Page cache
+# rendered pages are kept until a video is added, edited or deleted, or until this many seconds pass
+
+VIDEO_PAGE_CACHE_ALIAS = 'default'
+
+VIDEO_PAGE_CACHE_TIMEOUT = 60 * 60 * 24
+
+
+# Video embeds
+# 'facade' shows a thumbnail and only loads the YouTube player once it is clicked,
+# 'iframe' loads the player with the page. Either can be picked per request with ?embed=
+
+VIDEO_LIST_EMBED = 'facade'
+
+VIDEO_DETAILS_EMBED = 'iframe'
+
+
+# Async views
+# serve the video list and details pages with async views and the async ORM, for running
+# under an ASGI server (see video/asgi.py). Set VIDEO_ASYNC_VIEWS=1 to turn on.
+
+VIDEO_ASYNC_VIEWS = os.environ.get('VIDEO_ASYNC_VIEWS') == '1'
+
+
+# Request metrics
+# query counts, SQL time and template time are measured for every request and sent in a
+# Server-Timing header, totals per view are served at /metrics, and requests slower than
+# VIDEO_SLOW_REQUEST_MS are logged (None turns that off). Tracing peak memory uses
+# tracemalloc, which slows everything down, so it is off unless VIDEO_METRICS_TRACE_MEMORY=1.
+# /metrics only answers staff users and scrapers from VIDEO_METRICS_ALLOWED_IPS, a comma
+# separated list (checked against VIDEO_CLIENT_IP_HEADER behind a proxy, see Write throttling)
+
+VIDEO_SERVER_TIMING = True
+
+VIDEO_SLOW_REQUEST_MS = 500
+
+VIDEO_METRICS_TRACE_MEMORY = os.environ.get('VIDEO_METRICS_TRACE_MEMORY') == '1'
+
+VIDEO_METRICS_ALLOWED_IPS = [ip.strip() for ip in os.environ.get('VIDEO_METRICS_ALLOWED_IPS', '127.0.0.1,::1').split(',') if ip.strip()]
+
+
+# Public pages
+# the read-only pages (home, video list, video details and the JSON API) skip sessions,
+# authentication and messages and are sent with Cache-Control: public, so a shared cache or
+# reverse proxy can serve them for up to VIDEO_PUBLIC_MAX_AGE seconds. Set VIDEO_PUBLIC_PAGES=0
+# to send them through the full middleware stack instead.
+
+VIDEO_PUBLIC_PAGES = os.environ.get('VIDEO_PUBLIC_PAGES', '1') == '1'
+
+VIDEO_PUBLIC_MAX_AGE = 60
+
+
+# View counts
+# views of the video details pages are counted in memory and saved every
+# VIDEO_VIEW_FLUSH_SECONDS (see video_collection/viewcounts.py). The popular page lists the
+# VIDEO_POPULAR_LIST_SIZE most viewed and most recently viewed videos.
+
+VIDEO_VIEW_FLUSH_SECONDS = 30
+
+VIDEO_POPULAR_LIST_SIZE = 20
+
+
+# Write throttling
+# adding videos (the add page and bulk adds) is limited per client address and across all
+# clients, as (requests, seconds): bursts of up to `requests`, refilled over `seconds`. Over
+# the limit is answered with 429 Too Many Requests and a Retry-After header. None turns a
+# limit off. Behind a reverse proxy, set VIDEO_CLIENT_IP_HEADER to the header it puts the
+# client's address in, e.g. X-Forwarded-For. The buckets are kept in the
+# VIDEO_RATE_LIMIT_CACHE_ALIAS cache.
+
+VIDEO_WRITE_RATE_LIMITS = {
+    'ip': (30, 60),
+    'global': (300, 60),
+}
+
+VIDEO_CLIENT_IP_HEADER = os.environ.get('VIDEO_CLIENT_IP_HEADER') or None
+
+VIDEO_RATE_LIMIT_CACHE_ALIAS = 'default'
+
+# with VIDEO_COALESCE_WRITES=1, videos added one at a time are saved by a background thread, up
+# to VIDEO_COALESCE_MAX_BATCH per transaction, waiting up to VIDEO_COALESCE_WAIT_MS for others
+# to arrive (see video_collection/writes.py)
+
+VIDEO_COALESCE_WRITES = os.environ.get('VIDEO_COALESCE_WRITES') == '1'
+
+VIDEO_COALESCE_MAX_BATCH = 50
+
+VIDEO_COALESCE_WAIT_MS = 10
+
+
+# Video metadata
+# titles, durations and thumbnails are looked up in the background by `manage.py enrich_videos`
+# (see video_collection/enrichment.py). The YouTube Data API fetcher needs YOUTUBE_API_KEY;
+# video_collection.enrichment.StubFetcher makes up metadata without the network, for development.
+# Failed lookups are retried after VIDEO_ENRICHMENT_RETRY_SECONDS, doubling each time, up to
+# VIDEO_ENRICHMENT_MAX_ATTEMPTS times. Jobs a worker has held for VIDEO_ENRICHMENT_LOCK_SECONDS
+# are assumed abandoned and handed to another worker.
+
+VIDEO_METADATA_FETCHER = os.environ.get('VIDEO_METADATA_FETCHER', 'video_collection.enrichment.YouTubeDataAPIFetcher')
+
+YOUTUBE_API_KEY = os.environ.get('YOUTUBE_API_KEY', '')
+
+VIDEO_ENRICHMENT_MAX_ATTEMPTS = 5
+
+VIDEO_ENRICHMENT_RETRY_SECONDS = 30
+
+VIDEO_ENRICHMENT_LOCK_SECONDS = 60 * 10
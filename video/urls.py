@@ -13,10 +13,14 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
-from django.contrib import admin
+from django.conf import settings
 from django.urls import path, include
 
 urlpatterns = [
-    path('admin/', admin.site.urls),
     path('', include('video_collection.urls'))
 ]
+
+# public-only workers don't have the admin installed, see VIDEO_PUBLIC_ONLY
+if not settings.VIDEO_PUBLIC_ONLY:
+    from django.contrib import admin
+    urlpatterns.insert(0, path('admin/', admin.site.urls))
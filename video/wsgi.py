@@ -3,14 +3,24 @@ WSGI config for video project.
 
 It exposes the WSGI callable as a module-level variable named ``application``.
 
+Workers warm up while starting unless VIDEO_WARM_START=0, see video_collection/warmup.py.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/4.0/howto/deployment/wsgi/
 """
 
 import os
+import time
+
+started = time.perf_counter()
 
 from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'video.settings')
+os.environ.setdefault('VIDEO_WARM_START', '1')
 
 application = get_wsgi_application()
+
+from video_collection.warmup import log_boot
+
+log_boot(time.perf_counter() - started)
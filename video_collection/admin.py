@@ -1,6 +1,279 @@
-from django.contrib import admin
-from .models import Video
+from django import forms
+from django.conf import settings
+from django.contrib import admin, messages
+from django.contrib.admin import helpers
+from django.contrib.admin.helpers import ActionForm
+from django.contrib.admin.options import IncorrectLookupParameters
+from django.contrib.admin.views.main import ALL_VAR, ORDER_VAR, ChangeList
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.template.response import TemplateResponse
+from django.utils.functional import cached_property
+from django.utils.text import slugify
+from .caching import bump_version
+from .db import estimate_row_count
+from .dedupe import canonical_url_or_none
+from .models import Playlist, PlaylistEntry, Tag, Video
+from .search import matching_videos
+from .tagging import get_or_create_tags, parse_tag_names
+from .youtube import parse_youtube_url
 
 # Register your models here.
 
-admin.site.register(Video)
+# the video changelist has to stay quick with millions of videos, so it avoids the things the
+# default one does that read the whole table: COUNT(*) for the total (see
+# EstimatedCountPaginator), OFFSET for page numbers (see VideoChangeList), LIKE '%term%' for
+# searches (the full text index is used instead) and loading every selected video for a bulk
+# action (they are worked through in chunks of primary keys, see pk_chunks)
+
+CURSOR_VAR = 'cursor'
+
+
+def pk_chunks(queryset, chunk_size=None):
+    # lists of the queryset's primary keys, chunk_size at a time in key order. Each chunk is
+    # read from where the last one ended, so it is safe to delete the rows of each chunk
+    chunk_size = chunk_size or settings.VIDEO_ADMIN_CHUNK_SIZE
+    pks = queryset.order_by('pk').values_list('pk', flat=True)
+    last = None
+    while True:
+        chunk = list((pks if last is None else pks.filter(pk__gt=last))[:chunk_size])
+        if not chunk:
+            return
+        yield chunk
+        last = chunk[-1]
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator that doesn't count the whole table. Without filters or a search the database's
+    estimate is used; otherwise counting stops at VIDEO_ADMIN_COUNT_LIMIT. count_qualifier says
+    which happened ('about' or 'over'), for showing next to the count.
+    """
+    count_qualifier = ''
+
+    @cached_property
+    def count(self):
+        limit = settings.VIDEO_ADMIN_COUNT_LIMIT
+        if not self.object_list.query.where:
+            estimate = estimate_row_count(self.object_list.model, self.object_list.db)
+            if estimate is not None and estimate > limit:
+                self.count_qualifier = 'about'
+                return estimate
+        # small enough to count exactly, or at least up to the limit
+        count = self.object_list.order_by()[:limit + 1].count()
+        if count > limit:
+            self.count_qualifier = 'over'
+            return limit
+        return count
+
+
+class VideoChangeList(ChangeList):
+    """
+    Pages through videos newest first with ?cursor=<the last primary key on the previous page>,
+    so every page is an indexed range read however far in it is. Sorting by a column falls back
+    to the usual page numbers.
+    """
+
+    def get_filters_params(self, params=None):
+        # the cursor isn't a field to filter on
+        params = super().get_filters_params(params)
+        params.pop(CURSOR_VAR, None)
+        return params
+
+    def get_results(self, request):
+        # links for searching, filtering and sorting start again from the first page
+        cursor = self.params.pop(CURSOR_VAR, None)
+        self.cursor_mode = ORDER_VAR not in self.params and ALL_VAR not in self.params
+        if not self.cursor_mode:
+            return super().get_results(request)
+
+        try:
+            cursor = int(cursor) if cursor else None
+        except ValueError:
+            raise IncorrectLookupParameters
+        paginator = self.model_admin.get_paginator(request, self.queryset, self.list_per_page)
+        page = self.queryset if cursor is None else self.queryset.filter(pk__lt=cursor)
+        rows = list(page[:self.list_per_page + 1]) # one extra to tell whether there is a next page
+        self.result_list = rows[:self.list_per_page]
+        self.result_count = paginator.count
+        self.show_full_result_count = False
+        self.show_admin_actions = True
+        self.full_result_count = None
+        self.can_show_all = False
+        self.multi_page = cursor is not None or len(rows) > self.list_per_page
+        self.paginator = paginator
+        self.first_page_url = self.get_query_string() if cursor is not None else None
+        self.next_page_url = self.get_query_string({CURSOR_VAR: rows[-2].pk}) if len(rows) > self.list_per_page else None
+
+
+class VideoActionForm(ActionForm):
+    tags = forms.CharField(required=False, help_text='Comma separated, for the tag actions')
+
+
+@admin.register(Video)
+class VideoAdmin(admin.ModelAdmin):
+    # plain columns only, so the list is one query with no joins
+    list_display = ['id', 'name', 'video_id', 'title', 'duration', 'enriched_at']
+    list_display_links = ['id', 'name']
+    ordering = ['-pk']
+    list_per_page = settings.VIDEO_ADMIN_PAGE_SIZE
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    # searches use the full text index, see get_search_results
+    search_fields = ['name', 'notes', '=video_id']
+    search_help_text = 'Words in the name or notes, a YouTube video id or link'
+    autocomplete_fields = ['tags'] # a multiple select of every tag would be enormous
+    readonly_fields = ['video_id', 'canonical_url', 'enriched_at']
+    action_form = VideoActionForm
+    actions = ['delete_videos', 'add_tags', 'remove_tags', 'revalidate_urls']
+
+    def get_changelist(self, request, **kwargs):
+        return VideoChangeList
+
+    def get_actions(self, request):
+        # delete_videos replaces the built in delete, which loads every selected video into
+        # memory to list them on the confirmation page
+        actions = super().get_actions(request)
+        actions.pop('delete_selected', None)
+        return actions
+
+    def get_search_results(self, request, queryset, search_term):
+        search_term = search_term.strip()
+        if not search_term:
+            return queryset, False
+        matches = Q(pk__in=matching_videos(search_term).values('pk')) | Q(video_id=search_term)
+        canonical_url = canonical_url_or_none(search_term)
+        if canonical_url:
+            matches |= Q(canonical_url=canonical_url)
+        return queryset.filter(matches), False
+
+    @admin.action(permissions=['delete'], description='Delete selected videos')
+    def delete_videos(self, request, queryset):
+        if request.POST.get('post') != 'yes':
+            select_across = request.POST.get('select_across') == '1'
+            return TemplateResponse(request, 'admin/video_collection/video/delete_videos_confirmation.html', {
+                **self.admin_site.each_context(request),
+                'title': 'Are you sure?',
+                'opts': self.model._meta,
+                'select_across': select_across,
+                'selected': request.POST.getlist(helpers.ACTION_CHECKBOX_NAME),
+                'action_checkbox_name': helpers.ACTION_CHECKBOX_NAME,
+            })
+        deleted = 0
+        for chunk in pk_chunks(queryset):
+            # each chunk is its own transaction, so a big delete doesn't lock the table for long
+            with transaction.atomic():
+                deleted += Video.objects.filter(pk__in=chunk).delete()[1].get(Video._meta.label, 0)
+        self.message_user(request, f'Deleted {deleted} video{"s" if deleted != 1 else ""}.', messages.SUCCESS)
+
+    @admin.action(permissions=['change'], description='Add tags to selected videos')
+    def add_tags(self, request, queryset):
+        self._change_tags(request, queryset, add=True)
+
+    @admin.action(permissions=['change'], description='Remove tags from selected videos')
+    def remove_tags(self, request, queryset):
+        self._change_tags(request, queryset, add=False)
+
+    def _change_tags(self, request, queryset, add):
+        names = parse_tag_names(request.POST.get('tags', ''))
+        if not names:
+            self.message_user(request, 'Enter the tags to add or remove in the tags box.', messages.WARNING)
+            return
+        tags = get_or_create_tags(names) if add else list(Tag.objects.filter(slug__in=map(slugify, names)))
+        for chunk in pk_chunks(queryset):
+            with transaction.atomic():
+                for tag in tags:
+                    # through the related manager, so signals.py keeps the tag counts right
+                    (tag.videos.add if add else tag.videos.remove)(*chunk)
+        tag_list = ', '.join(tag.name for tag in tags) or 'nothing'
+        self.message_user(request, f'{"Added" if add else "Removed"} {tag_list}.', messages.SUCCESS)
+
+    @admin.action(permissions=['change'], description='Re-check YouTube links of selected videos')
+    def revalidate_urls(self, request, queryset):
+        # works out each video's id and canonical link again with the current URL rules
+        fixed, invalid, duplicates = 0, [], []
+        for chunk in pk_chunks(queryset):
+            updates, renamed = [], []
+            for video in Video.objects.filter(pk__in=chunk).order_by('pk').only('pk', 'url', 'video_id', 'canonical_url'):
+                try:
+                    parsed = parse_youtube_url(video.url)
+                except ValidationError:
+                    invalid.append(video.pk)
+                    continue
+                if video.video_id != parsed.video_id:
+                    renamed.append(video)
+                elif video.canonical_url != parsed.url:
+                    updates.append(video)
+                video.video_id, video.canonical_url = parsed.video_id, parsed.url
+            # a corrected id that any other video already has is a duplicate, for dedupe_videos.
+            # So is one that two videos here are corrected to, the first of them keeps it
+            taken = set(
+                Video.objects.filter(video_id__in=[video.video_id for video in renamed])
+                .exclude(pk__in=[video.pk for video in renamed])
+                .values_list('video_id', flat=True)
+            )
+            for video in renamed:
+                if video.video_id in taken:
+                    duplicates.append(video.pk)
+                else:
+                    taken.add(video.video_id)
+                    updates.append(video)
+            try:
+                with transaction.atomic():
+                    Video.objects.bulk_update(updates, ['video_id', 'canonical_url'])
+            except IntegrityError:
+                # another video took one of the ids since the check above, or one of these is
+                # corrected to the id another of them is leaving. One at a time then, going
+                # round again while that frees up ids, and whatever still clashes is left alone
+                saved, pending = [], updates
+                while pending:
+                    clashing = []
+                    for video in pending:
+                        try:
+                            with transaction.atomic():
+                                Video.objects.bulk_update([video], ['video_id', 'canonical_url'])
+                            saved.append(video)
+                        except IntegrityError:
+                            clashing.append(video)
+                    if len(clashing) == len(pending):
+                        duplicates += [video.pk for video in clashing]
+                        break
+                    pending = clashing
+                updates = saved
+            fixed += len(updates)
+        if fixed:
+            bump_version() # bulk_update doesn't send the signals that would do this
+        self.message_user(request, f'Fixed {fixed} video{"s" if fixed != 1 else ""}.', messages.SUCCESS)
+        if invalid:
+            self.message_user(request, f'{len(invalid)} not a valid YouTube link: {_id_list(invalid)}', messages.WARNING)
+        if duplicates:
+            self.message_user(request, f'{len(duplicates)} already added under another id, run manage.py dedupe_videos: {_id_list(duplicates)}', messages.WARNING)
+
+
+def _id_list(pks, limit=20):
+    # 'ids 1, 2, 3' for a message, with the rest left off
+    more = f' and {len(pks) - limit} more' if len(pks) > limit else ''
+    return f'ids {", ".join(map(str, pks[:limit]))}{more}'
+
+
+@admin.register(Tag)
+class TagAdmin(admin.ModelAdmin):
+    list_display = ['name', 'slug', 'video_count']
+    prepopulated_fields = {'slug': ['name']}
+    readonly_fields = ['video_count'] # kept up to date by signals.py
+    search_fields = ['name'] # for the autocomplete on videos
+
+
+class PlaylistEntryInline(admin.TabularInline):
+    model = PlaylistEntry
+    raw_id_fields = ['video'] # a dropdown of every video would be enormous
+    ordering = ['position']
+
+
+@admin.register(Playlist)
+class PlaylistAdmin(admin.ModelAdmin):
+    list_display = ['name', 'slug']
+    prepopulated_fields = {'slug': ['name']}
+    inlines = [PlaylistEntryInline]
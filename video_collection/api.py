@@ -0,0 +1,83 @@
+from datetime import datetime, timezone
+from django.http import JsonResponse
+from django.urls import reverse
+from django.views.decorators.http import condition, require_safe
+from .caching import cache_page_by_version, get_version
+from .models import Video
+from .pagination import get_page_size, page_query_string, paginate, video_sort_key
+from .public import public_page
+from .search import search_page
+
+
+# read-only JSON API
+#
+# videos are read with .values() (or .only() for search results), so only the columns in
+# API_FIELDS are fetched and no model instances are built for plain listings.
+#
+# every response carries an ETag and Last-Modified taken from the collection version in
+# caching.py, which changes whenever a video is saved or deleted. Clients that send them back
+# in If-None-Match / If-Modified-Since get a 304 without the database being queried at all.
+
+API_FIELDS = ('id', 'name', 'url', 'notes', 'video_id')
+
+
+def collection_etag(request, *args, **kwargs):
+    return f'v{get_version()}'
+
+
+def collection_last_modified(request, *args, **kwargs):
+    return datetime.fromtimestamp(get_version() / 1e9, tz=timezone.utc)
+
+
+def api_view(view):
+    # GET/HEAD only, served without sessions, answers conditional requests with 304, and caches
+    # the JSON like the HTML pages
+    conditional = condition(etag_func=collection_etag, last_modified_func=collection_last_modified)
+    return public_page(require_safe(conditional(cache_page_by_version(view))))
+
+
+def serialize(video):
+    if isinstance(video, dict):
+        return {field: video[field] for field in API_FIELDS}
+    return {field: getattr(video, field) for field in API_FIELDS}
+
+
+def not_found():
+    return JsonResponse({'error': 'Video not found'}, status=404)
+
+
+def _page_url(request, cursor):
+    query = page_query_string(request.GET, cursor)
+    return f'{reverse("api_video_list")}?{query}' if query else None
+
+
+@api_view
+def video_list(request):
+    page_size = get_page_size(request.GET.get('page_size'))
+    cursor = request.GET.get('cursor')
+    search_term = request.GET.get('search_term', '').strip()
+
+    if search_term:
+        page = search_page(search_term, cursor, page_size, Video.objects.only(*API_FIELDS))
+    else:
+        videos = video_sort_key(Video.objects.all()).values(*API_FIELDS, 'sort_name')
+        page = paginate(videos, cursor, page_size)
+
+    return JsonResponse({
+        'count': page.count,
+        'next': _page_url(request, page.next_cursor),
+        'previous': _page_url(request, page.previous_cursor),
+        'results': [serialize(video) for video in page.items],
+    })
+
+
+@api_view
+def video_details(request, video_pk):
+    video = Video.objects.filter(pk=video_pk).values(*API_FIELDS).first()
+    return JsonResponse(serialize(video)) if video else not_found()
+
+
+@api_view
+def video_details_by_video_id(request, video_id):
+    video = Video.objects.filter(video_id=video_id).values(*API_FIELDS).first()
+    return JsonResponse(serialize(video)) if video else not_found()
@@ -1,6 +1,21 @@
 from django.apps import AppConfig
+from django.conf import settings
+from django.db.models.signals import post_migrate
+
+
+def ensure_search_triggers(using, **kwargs):
+    from django.db import connections
+    from .search import ensure_search_triggers
+    ensure_search_triggers(connections[using])
 
 
 class VideoCollectionConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'video_collection'
+
+    def ready(self):
+        from . import signals  # connects the cache invalidation receivers
+        post_migrate.connect(ensure_search_triggers, sender=self)
+        if getattr(settings, 'VIDEO_WARM_START', False):
+            from .warmup import warm_up
+            warm_up() # see warmup.py
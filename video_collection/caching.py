@@ -0,0 +1,100 @@
+import hashlib
+import inspect
+import time
+from functools import wraps
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+
+
+# page caching for the read-only pages
+#
+# rather than expiring pages after a fixed time, every cache key includes a version number
+# for the whole collection. Saving or deleting a video bumps the version (see signals.py),
+# which makes every cached page unreachable at once, so nobody ever sees a stale list and
+# nothing needs to know which pages a particular video appeared on. Old entries are simply
+# left to be evicted by the cache backend.
+
+VERSION_KEY = 'video_collection:version'
+
+
+def get_cache():
+    return caches[getattr(settings, 'VIDEO_PAGE_CACHE_ALIAS', 'default')]
+
+
+def get_version():
+    # the version is a timestamp in nanoseconds, so if the cache ever loses it the new version
+    # can't collide with one that cached pages were stored under
+    page_cache = get_cache()
+    version = page_cache.get(VERSION_KEY)
+    if version is None:
+        page_cache.add(VERSION_KEY, time.time_ns(), timeout=None)
+        version = page_cache.get(VERSION_KEY, time.time_ns())
+    return version
+
+
+def bump_version():
+    page_cache = get_cache()
+    version = max(time.time_ns(), (page_cache.get(VERSION_KEY) or 0) + 1)
+    page_cache.set(VERSION_KEY, version, timeout=None)
+    return version
+
+
+def page_key(request, version=None):
+    # one entry per path and query string, so each search term, cursor and page size is cached separately
+    query = sorted(request.GET.lists())
+    digest = hashlib.sha1(f'{request.path}?{query}'.encode()).hexdigest()
+    return f'video_collection:page:{version or get_version()}:{digest}'
+
+
+def _timeout():
+    return getattr(settings, 'VIDEO_PAGE_CACHE_TIMEOUT', None)
+
+
+def _cacheable(response):
+    return response.status_code == 200 and not response.streaming and not response.cookies
+
+
+def cache_page_by_version(view):
+    """
+    Caches successful GET responses from view until the next change to the collection.
+    Works with both sync and async views.
+    """
+    if inspect.iscoroutinefunction(view):
+        @wraps(view)
+        async def cached_async_view(request, *args, **kwargs):
+            if request.method != 'GET':
+                return await view(request, *args, **kwargs)
+
+            page_cache = get_cache()
+            key = page_key(request, await page_cache.aget(VERSION_KEY))
+            cached = await page_cache.aget(key)
+            if cached is not None:
+                content, content_type = cached
+                return HttpResponse(content, content_type=content_type)
+
+            response = await view(request, *args, **kwargs)
+            if _cacheable(response):
+                await page_cache.aset(key, (response.content, response['Content-Type']), timeout=_timeout())
+            return response
+
+        return cached_async_view
+
+    @wraps(view)
+    def cached_view(request, *args, **kwargs):
+        if request.method != 'GET':
+            return view(request, *args, **kwargs)
+
+        page_cache = get_cache()
+        key = page_key(request)
+        cached = page_cache.get(key)
+        if cached is not None:
+            content, content_type = cached
+            return HttpResponse(content, content_type=content_type)
+
+        response = view(request, *args, **kwargs)
+        if _cacheable(response):
+            page_cache.set(key, (response.content, response['Content-Type']), timeout=_timeout())
+        return response
+
+    return cached_view
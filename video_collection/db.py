@@ -0,0 +1,50 @@
+from django.conf import settings
+from django.db import connections
+from .instrumentation import install_query_timer
+
+
+# per-connection database setup, run from the connection_created signal (see signals.py)
+
+def configure_connection(connection):
+    install_query_timer(connection)
+    if connection.vendor == 'sqlite':
+        apply_sqlite_pragmas(connection)
+
+
+def apply_sqlite_pragmas(connection):
+    # pragmas are per connection (journal_mode is stored in the file, but setting it again is
+    # cheap), so they have to be applied every time Django opens one
+    pragmas = getattr(settings, 'SQLITE_PRAGMAS', {})
+    if not pragmas:
+        return
+    with connection.cursor() as cursor:
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+
+
+def sqlite_pragma(connection, name):
+    with connection.cursor() as cursor:
+        cursor.execute(f'PRAGMA {name}')
+        return cursor.fetchone()[0]
+
+
+def estimate_row_count(model, using='default'):
+    """
+    A quick estimate of how many rows model's table has, without counting them: PostgreSQL's
+    planner statistics, or SQLite's largest rowid (too high by however many rows have been
+    deleted). None if the database has no estimate.
+    """
+    connection = connections[using]
+    table = connection.ops.quote_name(model._meta.db_table)
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute('SELECT reltuples FROM pg_class WHERE oid = %s::regclass', [model._meta.db_table])
+        elif connection.vendor == 'sqlite':
+            cursor.execute(f'SELECT MAX(rowid) FROM {table}')
+        else:
+            return None
+        row = cursor.fetchone()
+    # reltuples is -1 for a table that has never been analyzed
+    if row is None or row[0] is None or row[0] < 0:
+        return None
+    return int(row[0])
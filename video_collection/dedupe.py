@@ -0,0 +1,128 @@
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Count, Max, Min
+from .caching import bump_version
+from .models import PlaylistEntry, Video
+from .youtube import parse_youtube_url
+
+
+# finding and merging videos that are the same YouTube video
+#
+# every video has a canonical_url, the https://www.youtube.com/watch?v=ID form of its link,
+# which is indexed so a new video can be checked for duplicates with one lookup before it is
+# inserted. Videos saved before that column existed can still be stored twice under different
+# video ids, so merge_duplicates walks the table in primary key ranges and merges each group
+# of videos sharing a canonical_url into the oldest one. Every range and every merge is its own
+# short transaction, so the site keeps working while it runs.
+
+BATCH_SIZE = 1000
+
+
+def canonical_url_or_none(url):
+    try:
+        return parse_youtube_url(url).url
+    except ValidationError:
+        return None  # not a link the current rules accept, left for someone to fix by hand
+
+
+def pk_ranges(queryset, batch_size=BATCH_SIZE):
+    # (first, last) primary keys covering the table in steps of batch_size
+    bounds = queryset.aggregate(first=Min('pk'), last=Max('pk'))
+    if bounds['first'] is None:
+        return
+    for start in range(bounds['first'], bounds['last'] + 1, batch_size):
+        yield start, start + batch_size - 1
+
+
+def fill_canonical_urls(video_model=Video, batch_size=BATCH_SIZE):
+    """
+    Sets canonical_url for videos that don't have one yet and returns how many were set.
+    Takes the model as an argument so the migration that adds the column can use it too.
+    """
+    filled = 0
+    missing = video_model.objects.filter(canonical_url__isnull=True)
+    for first, last in pk_ranges(missing, batch_size):
+        videos = list(missing.filter(pk__range=(first, last)).only('pk', 'url'))
+        for video in videos:
+            video.canonical_url = canonical_url_or_none(video.url)
+        videos = [video for video in videos if video.canonical_url]
+        with transaction.atomic():
+            video_model.objects.bulk_update(videos, ['canonical_url'])
+        filled += len(videos)
+    return filled
+
+
+def merge_group(canonical_url):
+    """
+    Merges every video with this canonical_url into the oldest one: notes and YouTube metadata
+    it is missing are taken from the others, and their tags and playlist places are moved onto
+    it, then the others are deleted. Returns how many were deleted.
+    """
+    with transaction.atomic():
+        videos = list(Video.objects.filter(canonical_url=canonical_url).order_by('pk'))
+        if len(videos) < 2:
+            return 0  # already merged by someone else
+        keeper, duplicates = videos[0], videos[1:]
+
+        changes = {}
+        for field in ('notes', 'title', 'duration', 'thumbnail_url', 'enriched_at'):
+            if getattr(keeper, field) in (None, ''):
+                value = next((getattr(video, field) for video in duplicates if getattr(video, field) not in (None, '')), None)
+                if value is not None:
+                    changes[field] = value
+
+        duplicate_pks = [video.pk for video in duplicates]
+        # through the related manager, so signals.py counts the tags the oldest video gains
+        tag_pks = Video.tags.through.objects.filter(video__in=duplicate_pks).values_list('tag_id', flat=True)
+        keeper.tags.add(*set(tag_pks))
+        # a video is in a playlist at most once, so the oldest keeps its own place in a playlist
+        # it is already in, otherwise it takes the earliest of the duplicates' places
+        playlist_pks = set(PlaylistEntry.objects.filter(video=keeper).values_list('playlist_id', flat=True))
+        moved = []
+        for entry in PlaylistEntry.objects.filter(video__in=duplicate_pks).order_by('position', 'pk'):
+            if entry.playlist_id not in playlist_pks:
+                playlist_pks.add(entry.playlist_id)
+                moved.append(entry.pk)
+        PlaylistEntry.objects.filter(pk__in=moved).update(video=keeper)
+
+        Video.objects.filter(pk__in=duplicate_pks).delete()
+        # the oldest video may have been stored with a mangled video id, now it is free to fix
+        changes['video_id'] = parse_youtube_url(canonical_url).video_id
+        Video.objects.filter(pk=keeper.pk).update(**changes)
+    return len(duplicates)
+
+
+def merge_duplicates(batch_size=BATCH_SIZE, dry_run=False):
+    """
+    Scans the whole table for videos sharing a canonical_url and merges them. Returns
+    (groups, videos) - how many groups of duplicates were found and how many videos were, or
+    with dry_run would be, deleted.
+    """
+    groups = removed = 0
+    seen = set()  # groups spanning several ranges are only counted once in a dry run
+    for first, last in pk_ranges(Video.objects.all(), batch_size):
+        batch_urls = set(
+            Video.objects.filter(pk__range=(first, last), canonical_url__isnull=False)
+            .values_list('canonical_url', flat=True)
+        )
+        if not batch_urls:
+            continue
+        duplicated = (
+            Video.objects.filter(canonical_url__in=batch_urls)
+            .values('canonical_url')
+            .annotate(videos=Count('pk'))
+            .filter(videos__gt=1)
+        )
+        for group in duplicated:
+            if group['canonical_url'] in seen:
+                continue
+            seen.add(group['canonical_url'])
+            groups += 1
+            if dry_run:
+                removed += group['videos'] - 1
+            else:
+                removed += merge_group(group['canonical_url'])
+
+    if removed and not dry_run:
+        bump_version()
+    return groups, removed
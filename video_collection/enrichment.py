@@ -0,0 +1,256 @@
+import json
+import logging
+import random
+import re
+import time
+import uuid
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from http.client import HTTPException
+from urllib import parse, request
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from .caching import bump_version
+from .models import EnrichmentJob, Video
+
+
+# background enrichment of videos with their YouTube title, duration and thumbnail
+#
+# adding a video only queues an EnrichmentJob, so the add request never waits on YouTube.
+# The enrich_videos command claims queued jobs, looks the videos up in batches with the
+# fetcher named in VIDEO_METADATA_FETCHER, and retries failures with exponential backoff.
+
+logger = logging.getLogger('video_collection.enrichment')
+
+VideoMetadata = namedtuple('VideoMetadata', ['title', 'duration', 'thumbnail_url'])
+
+
+class FetchError(Exception):
+    # the lookup failed in a way that might work later (network trouble, rate limits)
+    pass
+
+
+class StubFetcher:
+    """
+    Made-up metadata without going near the network, for tests and local development.
+    Video ids starting with 'missing' are reported as not found.
+    """
+    batch_size = 50
+
+    def __init__(self):
+        self.calls = []  # the video ids asked for in each call
+
+    def fetch(self, video_ids):
+        self.calls.append(list(video_ids))
+        return {
+            video_id: VideoMetadata(f'Video {video_id}', 60 * len(video_id), f'https://i.ytimg.com/vi/{video_id}/hqdefault.jpg')
+            for video_id in video_ids
+            if not video_id.startswith('missing')
+        }
+
+
+class YouTubeDataAPIFetcher:
+    """
+    Looks videos up with the YouTube Data API, up to 50 per request. Needs YOUTUBE_API_KEY.
+    """
+    batch_size = 50
+    endpoint = 'https://www.googleapis.com/youtube/v3/videos'
+
+    def __init__(self, api_key=None, timeout=10):
+        self.api_key = api_key or getattr(settings, 'YOUTUBE_API_KEY', '')
+        self.timeout = timeout
+
+    def fetch(self, video_ids):
+        if not self.api_key:
+            raise FetchError('YOUTUBE_API_KEY is not set')
+        query = parse.urlencode({'part': 'snippet,contentDetails', 'id': ','.join(video_ids), 'key': self.api_key})
+        # URLError, timeouts and dropped connections are all OSErrors, a response cut off part
+        # way through is an HTTPException and one that isn't JSON a ValueError
+        try:
+            with request.urlopen(f'{self.endpoint}?{query}', timeout=self.timeout) as response:
+                data = json.load(response)
+        except (OSError, HTTPException, ValueError) as e:
+            raise FetchError(f'YouTube lookup failed: {e}') from e
+
+        results = {}
+        for item in data.get('items', []):
+            thumbnails = item.get('snippet', {}).get('thumbnails', {})
+            thumbnail = thumbnails.get('high') or thumbnails.get('medium') or thumbnails.get('default') or {}
+            results[item['id']] = VideoMetadata(
+                item.get('snippet', {}).get('title', '')[:200],
+                parse_duration(item.get('contentDetails', {}).get('duration', '')),
+                thumbnail.get('url'),
+            )
+        return results
+
+
+def parse_duration(value):
+    # ISO 8601 durations as used by YouTube, like PT1H2M3S or P1DT2H, to seconds
+    match = re.fullmatch(r'P(?:(\d+)D)?(?:T(?:(\d+)H)?(?:(\d+)M)?(?:(\d+)S)?)?', value or '')
+    if not match:
+        return None
+    days, hours, minutes, seconds = (int(part or 0) for part in match.groups())
+    return ((days * 24 + hours) * 60 + minutes) * 60 + seconds
+
+
+def get_fetcher():
+    return import_string(settings.VIDEO_METADATA_FETCHER)()
+
+
+# the queue
+
+def enqueue(video_pks):
+    # queues videos for enrichment, videos that already have a job are left alone
+    now = timezone.now()
+    EnrichmentJob.objects.bulk_create(
+        [EnrichmentJob(video_id=pk, run_after=now) for pk in video_pks],
+        ignore_conflicts=True,
+    )
+
+
+def enqueue_unenriched():
+    # queues every video that has never been enriched and isn't queued already, e.g. the ones
+    # added before enrichment existed. Returns how many were queued
+    pks = list(Video.objects.filter(enriched_at__isnull=True, enrichment_job__isnull=True).values_list('pk', flat=True))
+    enqueue(pks)
+    return len(pks)
+
+
+def claim_jobs(limit):
+    """
+    Marks up to limit jobs that are due as running and returns them. Jobs left running for
+    longer than VIDEO_ENRICHMENT_LOCK_SECONDS belonged to a worker that died, and are taken
+    over. Each claim has its own token, so two workers can't both end up with the same job.
+    """
+    now = timezone.now()
+    stale = now - timedelta(seconds=settings.VIDEO_ENRICHMENT_LOCK_SECONDS)
+    token = uuid.uuid4().hex
+    due = (
+        Q(status=EnrichmentJob.PENDING, run_after__lte=now)
+        | Q(status=EnrichmentJob.RUNNING, locked_at__lt=stale)
+    )
+    with transaction.atomic():
+        pks = list(EnrichmentJob.objects.filter(due).order_by('run_after').values_list('pk', flat=True)[:limit])
+        EnrichmentJob.objects.filter(due, pk__in=pks).update(status=EnrichmentJob.RUNNING, claimed_by=token, locked_at=now)
+    return list(EnrichmentJob.objects.filter(claimed_by=token, status=EnrichmentJob.RUNNING).select_related('video'))
+
+
+def retry_delay(attempts):
+    # exponential backoff with some jitter, so failed jobs don't all come back at once
+    base = settings.VIDEO_ENRICHMENT_RETRY_SECONDS
+    return base * 2 ** (attempts - 1) * random.uniform(0.8, 1.2)
+
+
+def retry_later(jobs, e):
+    # puts jobs whose attempt failed back in the queue with a backoff, or gives up on them
+    now = timezone.now()
+    retrying = failed = 0
+    for job in jobs:
+        job.last_error = str(e)
+        if job.attempts >= settings.VIDEO_ENRICHMENT_MAX_ATTEMPTS:
+            job.status = EnrichmentJob.FAILED
+            failed += 1
+        else:
+            job.status = EnrichmentJob.PENDING
+            job.run_after = now + timedelta(seconds=retry_delay(job.attempts))
+            retrying += 1
+    EnrichmentJob.objects.bulk_update(jobs, ['status', 'attempts', 'run_after', 'last_error'])
+    return 0, retrying, failed
+
+
+def process_batch(jobs, fetcher):
+    """
+    Looks up one batch of claimed jobs with a single fetcher call and saves the results.
+    Returns (enriched, retrying, failed) counts.
+    """
+    now = timezone.now()
+    for job in jobs:
+        job.attempts += 1
+
+    try:
+        results = fetcher.fetch([job.video.video_id for job in jobs])
+    except FetchError as e:
+        logger.warning('Enrichment of %d videos failed: %s', len(jobs), e)
+        return retry_later(jobs, e)
+
+    videos = []
+    for job in jobs:
+        metadata = results.get(job.video.video_id)
+        if metadata is None:
+            # YouTube doesn't know the video (deleted or private), trying again won't help
+            job.status = EnrichmentJob.FAILED
+            job.last_error = 'Video not found on YouTube'
+            continue
+        job.status = EnrichmentJob.DONE
+        job.last_error = ''
+        job.video.title, job.video.duration, job.video.thumbnail_url = metadata
+        job.video.enriched_at = now
+        videos.append(job.video)
+
+    with transaction.atomic():
+        Video.objects.bulk_update(videos, ['title', 'duration', 'thumbnail_url', 'enriched_at'])
+        EnrichmentJob.objects.bulk_update(jobs, ['status', 'attempts', 'last_error'])
+    if videos:
+        bump_version()  # bulk_update doesn't send post_save, so cached pages are invalidated here
+    return len(videos), 0, len(jobs) - len(videos)
+
+
+def _process_batch_safely(jobs, fetcher):
+    # anything process_batch didn't expect only costs this batch an attempt, rather than
+    # stopping the worker and leaving the jobs running until VIDEO_ENRICHMENT_LOCK_SECONDS
+    try:
+        return process_batch(jobs, fetcher)
+    except Exception as e:
+        logger.exception('Enrichment of %d videos failed unexpectedly', len(jobs))
+        try:
+            return retry_later(jobs, e)
+        except Exception:
+            logger.exception('Could not put %d jobs back in the queue, they will be taken over once their lock expires', len(jobs))
+            return 0, 0, 0
+
+
+def _process_batch_in_thread(jobs, fetcher):
+    try:
+        return _process_batch_safely(jobs, fetcher)
+    finally:
+        connection.close()  # each worker thread has its own connection
+
+
+def run(fetcher=None, batch_size=None, threads=1, once=False, poll_interval=5.0):
+    """
+    Works through the queue until it is empty (once=True) or forever. Each round claims enough
+    jobs for one batch per thread and looks the batches up in parallel. Returns the totals as
+    a dict of enriched, retrying and failed.
+    """
+    fetcher = fetcher or get_fetcher()
+    batch_size = batch_size or fetcher.batch_size
+    totals = {'enriched': 0, 'retrying': 0, 'failed': 0}
+
+    executor = ThreadPoolExecutor(max_workers=threads) if threads > 1 else None
+    try:
+        while True:
+            jobs = claim_jobs(batch_size * threads)
+            if not jobs:
+                if once:
+                    break
+                time.sleep(poll_interval)
+                continue
+
+            batches = [jobs[start:start + batch_size] for start in range(0, len(jobs), batch_size)]
+            if executor:
+                counts = list(executor.map(_process_batch_in_thread, batches, [fetcher] * len(batches)))
+            else:
+                counts = [_process_batch_safely(batch, fetcher) for batch in batches]
+
+            for enriched, retrying, failed in counts:
+                totals['enriched'] += enriched
+                totals['retrying'] += retrying
+                totals['failed'] += failed
+    finally:
+        if executor:
+            executor.shutdown()
+    return totals
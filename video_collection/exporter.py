@@ -0,0 +1,69 @@
+import csv
+import json
+from .models import Video
+from .search import matching_videos
+
+
+# streaming export of the collection as CSV or JSON lines
+#
+# rows are read with .values_list().iterator(), which fetches chunk_size rows at a time from
+# the database cursor instead of loading the whole result, and each row is turned into a line
+# of text as it is read. Memory use stays the same however big the collection is, whether the
+# lines go to an HTTP response or to a file. Files written here can be read back by the bulk
+# importer, which ignores the extra columns.
+#
+# rows come out in primary key order, so an incremental export can ask for everything after
+# the last id it already has.
+
+CHUNK_SIZE = 2000
+
+FORMATS = ('csv', 'jsonl')
+
+CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'jsonl': 'application/x-ndjson; charset=utf-8',
+}
+
+EXPORT_FIELDS = ('id', 'name', 'url', 'notes', 'video_id', 'canonical_url', 'title', 'duration', 'thumbnail_url')
+
+
+def export_queryset(search_term=None, after=None, until=None):
+    """
+    Videos to export in primary key order, optionally only those matching a search term and
+    with a primary key greater than after and/or at most until.
+    """
+    videos = Video.objects.all()
+    if search_term:
+        videos = matching_videos(search_term, videos)
+    if after is not None:
+        videos = videos.filter(pk__gt=after)
+    if until is not None:
+        videos = videos.filter(pk__lte=until)
+    return videos.order_by('pk').values_list(*EXPORT_FIELDS)
+
+
+class _Line:
+    # file-like object for csv.writer whose write() hands the line straight back
+    def write(self, value):
+        return value
+
+
+def csv_lines(rows):
+    writer = csv.writer(_Line())
+    yield writer.writerow(EXPORT_FIELDS)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def jsonl_lines(rows):
+    for row in rows:
+        yield json.dumps(dict(zip(EXPORT_FIELDS, row))) + '\n'
+
+
+def export_lines(queryset, output_format, chunk_size=CHUNK_SIZE):
+    # a generator of text lines, nothing is read from the database until it is iterated
+    if output_format == 'csv':
+        return csv_lines(queryset.iterator(chunk_size=chunk_size))
+    if output_format == 'jsonl':
+        return jsonl_lines(queryset.iterator(chunk_size=chunk_size))
+    raise ValueError(f'Unknown export format {output_format}, expected one of {", ".join(FORMATS)}')
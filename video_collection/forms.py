@@ -1,11 +1,36 @@
-from socket import fromshare
 from django import forms
 from .models import Video
+from .tagging import get_or_create_tags, parse_tag_names
+from .youtube import parse_youtube_url
 
 class VideoForm(forms.ModelForm):
+    tags = forms.CharField(required=False, max_length=500, help_text='Separate tags with commas')
+
     class Meta:
         model = Video
         fields = ['name', 'url', 'notes']
 
+    def clean_url(self):
+        # check the URL with the same rules as Video.save, before anything is written to the database
+        url = self.cleaned_data['url']
+        try:
+            canonical_url = parse_youtube_url(url).url
+        except forms.ValidationError:
+            raise forms.ValidationError('Invalid YouTube URL', code='invalid')
+        # an index lookup, so a duplicate is caught without attempting the INSERT. Links with
+        # timestamps or playlists count as the same video
+        if Video.objects.filter(canonical_url=canonical_url).exists():
+            raise forms.ValidationError('That video has already been added', code='duplicate')
+        return url
+
+    def clean_tags(self):
+        return parse_tag_names(self.cleaned_data['tags'])
+
+    def save(self, commit=True):
+        video = super().save(commit)
+        if commit and self.cleaned_data['tags']:
+            video.tags.set(get_or_create_tags(self.cleaned_data['tags']))
+        return video
+
 class SearchForm(forms.Form):
-    search_term = forms.CharField()
\ No newline at end of file
+    search_term = forms.CharField()
@@ -0,0 +1,179 @@
+import codecs
+import csv
+import json
+from itertools import islice
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+from . import enrichment
+from .caching import bump_version
+from .models import Video
+from .youtube import parse_youtube_url
+
+
+# bulk import of videos from CSV or JSON lines
+#
+# rows are read lazily and handled in batches: each batch is validated with the same URL rules
+# as Video.save, checked for videos that already exist with one query, and inserted with one
+# bulk_create, so importing a playlist of thousands of videos takes a handful of queries per
+# batch rather than several per video
+
+BATCH_SIZE = 500
+
+FORMATS = ('csv', 'jsonl')
+
+FIELDS = ('name', 'url', 'notes')
+
+CREATED = 'created'
+DUPLICATE = 'duplicate'
+INVALID = 'invalid'
+
+
+class ImportReport:
+
+    def __init__(self):
+        self.created = 0
+        self.duplicates = 0
+        self.invalid = 0
+        self.errors = []  # one entry per row that was not imported
+
+    def add_error(self, line, status, message, video_id=None):
+        if status == DUPLICATE:
+            self.duplicates += 1
+        else:
+            self.invalid += 1
+        self.errors.append({'line': line, 'status': status, 'video_id': video_id, 'message': message})
+
+    def as_dict(self):
+        return {
+            'created': self.created,
+            'duplicates': self.duplicates,
+            'invalid': self.invalid,
+            'errors': self.errors,
+        }
+
+
+def guess_format(filename, content_type=''):
+    if filename.endswith(('.jsonl', '.ndjson')) or 'ndjson' in content_type or 'jsonl' in content_type:
+        return 'jsonl'
+    if filename.endswith('.csv') or 'csv' in content_type:
+        return 'csv'
+    return None
+
+
+def read_rows(lines, input_format):
+    """
+    Yields (line number, row) for each video in an iterable of text lines. A row is a dict with
+    name, url and notes, or an error message string if the line could not be parsed at all.
+    """
+    if input_format == 'csv':
+        reader = csv.DictReader(lines)
+        for row in reader:
+            yield reader.line_num, row
+    elif input_format == 'jsonl':
+        for line_number, line in enumerate(lines, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                yield line_number, f'Invalid JSON: {e}'
+                continue
+            yield line_number, row if isinstance(row, dict) else 'Each line must be a JSON object'
+    else:
+        raise ValueError(f'Unknown import format {input_format}, expected one of {", ".join(FORMATS)}')
+
+
+def decode_lines(byte_lines, encoding='utf-8'):
+    # uploaded files and request bodies iterate as bytes, csv and json want text
+    return codecs.iterdecode(byte_lines, encoding)
+
+
+def _build_video(line, row, report):
+    # returns an unsaved Video, or None if the row was recorded as invalid
+    if isinstance(row, str):
+        report.add_error(line, INVALID, row)
+        return None
+    # JSON lines can hold numbers, lists and so on where the text should be
+    not_text = [field for field in FIELDS if row.get(field) is not None and not isinstance(row[field], str)]
+    if not_text:
+        report.add_error(line, INVALID, f'{", ".join(not_text)} must be text')
+        return None
+
+    video = Video(name=(row.get('name') or '').strip(), url=(row.get('url') or '').strip(), notes=row.get('notes') or None)
+    try:
+        # same field rules as the add form, then the same URL rules as Video.save
+        video.clean_fields(exclude=['video_id', 'canonical_url'])
+        video.video_id, video.canonical_url = parse_youtube_url(video.url)
+    except ValidationError as e:
+        report.add_error(line, INVALID, '; '.join(e.messages))
+        return None
+    return video
+
+
+def _import_batch(batch, report):
+    new_videos = {}  # video_id: (line, video), so duplicates within the batch are caught too
+    for line, row in batch:
+        video = _build_video(line, row, report)
+        if video is None:
+            continue
+        if video.video_id in new_videos:
+            report.add_error(line, DUPLICATE, 'Video appears earlier in the import', video.video_id)
+            continue
+        new_videos[video.video_id] = (line, video)
+
+    # one indexed query to find which of this batch's videos are already in the collection
+    canonical_urls = {video.canonical_url: video_id for video_id, (line, video) in new_videos.items()}
+    existing = Video.objects.filter(canonical_url__in=canonical_urls).values_list('canonical_url', flat=True)
+    for canonical_url in set(existing):
+        video_id = canonical_urls[canonical_url]
+        line, video = new_videos.pop(video_id)
+        report.add_error(line, DUPLICATE, 'That video has already been added', video_id)
+
+    if not new_videos:
+        return
+
+    created = []
+    try:
+        with transaction.atomic():
+            created = Video.objects.bulk_create([video for line, video in new_videos.values()])
+    except IntegrityError:
+        # something else added one of these videos since the check above - fall back to one
+        # insert per video for this batch so only the clashing rows are rejected
+        for line, video in new_videos.values():
+            try:
+                with transaction.atomic():
+                    created += Video.objects.bulk_create([video])
+            except IntegrityError:
+                report.add_error(line, DUPLICATE, 'That video has already been added', video.video_id)
+
+    report.created += len(created)
+    # bulk_create doesn't send post_save either, so the new videos are queued for enrichment here
+    enrichment.enqueue(video.pk for video in created)
+
+
+def import_videos(rows, batch_size=BATCH_SIZE):
+    """
+    Imports videos from an iterable of (line number, row) pairs such as read_rows produces,
+    and returns an ImportReport. Only one batch of rows is held in memory at a time.
+    """
+    report = ImportReport()
+    rows = iter(rows)
+    last_line = 0
+    while True:
+        batch = []
+        try:
+            batch.extend(islice(rows, batch_size))
+        except UnicodeDecodeError as e:
+            # the lines can't be read past this point, but the rows before it are still imported
+            line = (batch[-1][0] if batch else last_line) + 1
+            report.add_error(line, INVALID, f'Not {e.encoding} text ({e.reason}), nothing from here on was read')
+            _import_batch(batch, report)
+            break
+        if not batch:
+            break
+        _import_batch(batch, report)
+        last_line = batch[-1][0]
+    if report.created:
+        bump_version()  # bulk_create doesn't send post_save, so cached pages are invalidated here
+    report.errors.sort(key=lambda error: error['line'])
+    return report
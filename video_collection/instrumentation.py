@@ -0,0 +1,262 @@
+import logging
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from contextvars import ContextVar
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import PermissionDenied
+from django.http import HttpResponse
+from django.template.backends.django import DjangoTemplates
+from .ratelimit import client_ip
+
+
+# per-request timing: how many SQL queries ran and how long they took, how long templates
+# took to render, and optionally the peak memory allocated, for each view.
+#
+# the numbers for the request being handled live in a context variable, which follows the
+# request into sync_to_async threads, so async views are measured the same way as sync ones.
+# They are reported three ways: a Server-Timing header on each response (shown in browser dev
+# tools), running totals per view in Prometheus text format at /metrics, and a warning in the
+# log for requests slower than VIDEO_SLOW_REQUEST_MS.
+
+logger = logging.getLogger('video_collection.requests')
+
+_current_metrics = ContextVar('video_collection_request_metrics', default=None)
+
+
+class RequestMetrics:
+
+    def __init__(self):
+        self.queries = 0
+        self.sql_seconds = 0.0
+        self.template_seconds = 0.0
+        self.peak_memory = None  # bytes, only measured when VIDEO_METRICS_TRACE_MEMORY is on
+        self.total_seconds = 0.0
+
+    def server_timing(self):
+        return (
+            f'db;dur={self.sql_seconds * 1000:.2f};desc="{self.queries} queries", '
+            f'tpl;dur={self.template_seconds * 1000:.2f};desc="templates", '
+            f'total;dur={self.total_seconds * 1000:.2f}'
+        )
+
+
+@contextmanager
+def track():
+    """
+    Measures everything inside the block, for use outside a request too:
+
+        with track() as metrics:
+            ...
+        print(metrics.queries, metrics.sql_seconds)
+    """
+    metrics = RequestMetrics()
+    token = _current_metrics.set(metrics)
+    trace_memory = getattr(settings, 'VIDEO_METRICS_TRACE_MEMORY', False)
+    if trace_memory:
+        # the peak is for the whole process, so with several requests at once in one process
+        # it includes memory allocated by the others
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+    start = time.perf_counter()
+    try:
+        yield metrics
+    finally:
+        metrics.total_seconds = time.perf_counter() - start
+        if trace_memory:
+            metrics.peak_memory = tracemalloc.get_traced_memory()[1]
+        _current_metrics.reset(token)
+
+
+# SQL
+
+def _time_query(execute, sql, params, many, context):
+    metrics = _current_metrics.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.sql_seconds += time.perf_counter() - start
+        metrics.queries += 1
+
+
+def install_query_timer(connection):
+    # called for each new database connection (see db.py). The wrapper list belongs to the
+    # connection object, which is reused when Django reconnects, so only add it once
+    if _time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_time_query)
+
+
+# templates
+
+class InstrumentedTemplate:
+
+    def __init__(self, template):
+        self.template = template
+
+    def __getattr__(self, name):
+        return getattr(self.template, name)
+
+    def render(self, context=None, request=None):
+        metrics = _current_metrics.get()
+        if metrics is None:
+            return self.template.render(context, request)
+        start = time.perf_counter()
+        try:
+            return self.template.render(context, request)
+        finally:
+            metrics.template_seconds += time.perf_counter() - start
+
+
+class InstrumentedDjangoTemplates(DjangoTemplates):
+    """
+    The normal Django template backend, timing each template render. Templates included or
+    extended by another template are counted as part of it.
+    """
+
+    def from_string(self, template_code):
+        return InstrumentedTemplate(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return InstrumentedTemplate(super().get_template(template_name))
+
+
+# totals per view, in Prometheus text format
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class MetricsRegistry:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.views = {}
+
+    def record(self, view_name, metrics):
+        with self.lock:
+            view = self.views.setdefault(view_name, {
+                'requests': 0,
+                'seconds': 0.0,
+                'buckets': [0] * len(DURATION_BUCKETS),
+                'queries': 0,
+                'sql_seconds': 0.0,
+                'template_seconds': 0.0,
+                'peak_memory': 0,
+            })
+            view['requests'] += 1
+            view['seconds'] += metrics.total_seconds
+            for index, bound in enumerate(DURATION_BUCKETS):
+                if metrics.total_seconds <= bound:
+                    view['buckets'][index] += 1
+            view['queries'] += metrics.queries
+            view['sql_seconds'] += metrics.sql_seconds
+            view['template_seconds'] += metrics.template_seconds
+            if metrics.peak_memory:
+                view['peak_memory'] = max(view['peak_memory'], metrics.peak_memory)
+
+    def clear(self):
+        with self.lock:
+            self.views.clear()
+
+    def render(self):
+        with self.lock:
+            views = {name: dict(view, buckets=list(view['buckets'])) for name, view in self.views.items()}
+
+        lines = [
+            '# HELP video_request_duration_seconds Time taken to handle requests, by view.',
+            '# TYPE video_request_duration_seconds histogram',
+        ]
+        for name, view in sorted(views.items()):
+            label = f'view="{_escape(name)}"'
+            for bound, count in zip(DURATION_BUCKETS, view['buckets']):
+                lines.append(f'video_request_duration_seconds_bucket{{{label},le="{bound}"}} {count}')
+            lines.append(f'video_request_duration_seconds_bucket{{{label},le="+Inf"}} {view["requests"]}')
+            lines.append(f'video_request_duration_seconds_sum{{{label}}} {view["seconds"]}')
+            lines.append(f'video_request_duration_seconds_count{{{label}}} {view["requests"]}')
+
+        counters = (
+            ('video_db_queries_total', 'counter', 'SQL queries run, by view.', 'queries'),
+            ('video_db_duration_seconds_total', 'counter', 'Time spent running SQL queries, by view.', 'sql_seconds'),
+            ('video_template_render_seconds_total', 'counter', 'Time spent rendering templates, by view.', 'template_seconds'),
+            ('video_request_peak_memory_bytes', 'gauge', 'Largest peak memory seen in one request, by view.', 'peak_memory'),
+        )
+        for metric, metric_type, help_text, key in counters:
+            lines.append(f'# HELP {metric} {help_text}')
+            lines.append(f'# TYPE {metric} {metric_type}')
+            for name, view in sorted(views.items()):
+                lines.append(f'{metric}{{view="{_escape(name)}"}} {view[key]}')
+
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(label_value):
+    return label_value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+registry = MetricsRegistry()
+
+
+def can_see_metrics(request):
+    # the route timings and query counts say a lot about the site, so only a scraper from one of
+    # VIDEO_METRICS_ALLOWED_IPS or a logged in staff user gets them
+    user = getattr(request, 'user', None)
+    return client_ip(request) in getattr(settings, 'VIDEO_METRICS_ALLOWED_IPS', ()) or bool(user and user.is_staff)
+
+
+def metrics_view(request):
+    # totals for this process only - with several worker processes, scrape each one
+    if not can_see_metrics(request):
+        raise PermissionDenied
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+# middleware
+
+class MetricsMiddleware:
+    """
+    Measures each request, adds a Server-Timing header, records the totals for /metrics and
+    logs slow requests. Goes first in MIDDLEWARE so the other middleware is included.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        with track() as metrics:
+            response = self.get_response(request)
+        return self.finish(request, response, metrics)
+
+    async def __acall__(self, request):
+        with track() as metrics:
+            response = await self.get_response(request)
+        return self.finish(request, response, metrics)
+
+    def finish(self, request, response, metrics):
+        match = getattr(request, 'resolver_match', None)
+        view_name = match.view_name if match else 'unresolved'
+        registry.record(view_name, metrics)
+
+        if getattr(settings, 'VIDEO_SERVER_TIMING', True):
+            response['Server-Timing'] = metrics.server_timing()
+
+        slow_ms = getattr(settings, 'VIDEO_SLOW_REQUEST_MS', None)
+        if slow_ms is not None and metrics.total_seconds * 1000 >= slow_ms:
+            logger.warning(
+                'Slow request %s %s (%s): %.1fms, %d queries in %.1fms, templates %.1fms, peak memory %s',
+                request.method, request.get_full_path(), view_name, metrics.total_seconds * 1000,
+                metrics.queries, metrics.sql_seconds * 1000, metrics.template_seconds * 1000,
+                metrics.peak_memory if metrics.peak_memory is not None else 'not traced',
+            )
+        return response
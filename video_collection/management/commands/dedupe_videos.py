@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+from video_collection import dedupe
+
+
+class Command(BaseCommand):
+    help = 'Merges videos that are stored more than once under different links to the same YouTube video'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=dedupe.BATCH_SIZE, help='Videos to scan per query')
+        parser.add_argument('--dry-run', action='store_true', help='Only report the duplicates, change nothing')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1')
+
+        if not options['dry_run']:
+            # videos added by something that skipped Video.save
+            filled = dedupe.fill_canonical_urls(batch_size=options['batch_size'])
+            if filled:
+                self.stdout.write(f'Set the canonical URL of {filled} videos')
+
+        groups, removed = dedupe.merge_duplicates(options['batch_size'], options['dry_run'])
+        if options['dry_run']:
+            self.stdout.write(f'Found {groups} duplicated videos, merging would delete {removed} videos')
+        else:
+            self.stdout.write(self.style.SUCCESS(f'Merged {groups} duplicated videos, deleted {removed} videos'))
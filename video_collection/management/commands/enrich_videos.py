@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand, CommandError
+from video_collection import enrichment
+
+
+class Command(BaseCommand):
+    help = 'Looks up titles, durations and thumbnails for queued videos'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=1, help='Batches to look up at the same time')
+        parser.add_argument('--batch-size', type=int, help='Videos per lookup, defaults to the most the fetcher allows')
+        parser.add_argument('--once', action='store_true', help='Stop when the queue is empty instead of waiting for more')
+        parser.add_argument('--poll-interval', type=float, default=5.0, help='Seconds to wait between checks of an empty queue')
+        parser.add_argument('--enqueue-missing', action='store_true', help='First queue every video that has never been enriched')
+
+    def handle(self, *args, **options):
+        if options['threads'] < 1:
+            raise CommandError('--threads must be at least 1')
+        if options['batch_size'] is not None and options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1')
+
+        if options['enqueue_missing']:
+            queued = enrichment.enqueue_unenriched()
+            self.stdout.write(f'Queued {queued} videos')
+
+        totals = enrichment.run(
+            batch_size=options['batch_size'],
+            threads=options['threads'],
+            once=options['once'],
+            poll_interval=options['poll_interval'],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Enriched {totals["enriched"]} videos, {totals["retrying"]} to retry, {totals["failed"]} failed'
+        ))
@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand, CommandError
+from video_collection import exporter
+
+
+class Command(BaseCommand):
+    help = 'Exports videos as CSV or JSON lines, streamed so any size of collection uses little memory'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=exporter.FORMATS, default='csv', help='Output format')
+        parser.add_argument('--output', help='File to write to, instead of standard output')
+        parser.add_argument('--search-term', help='Only export videos matching this search')
+        parser.add_argument('--after', type=int, help='Only export videos with a greater id, for incremental exports')
+        parser.add_argument('--until', type=int, help='Only export videos with this id or less')
+        parser.add_argument('--chunk-size', type=int, default=exporter.CHUNK_SIZE, help='Rows fetched from the database at a time')
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size must be at least 1')
+
+        videos = exporter.export_queryset(options['search_term'], options['after'], options['until'])
+        lines = exporter.export_lines(videos, options['format'], options['chunk_size'])
+
+        if options['output']:
+            try:
+                with open(options['output'], 'w', newline='', encoding='utf-8') as export_file:
+                    count = self.write_lines(lines, export_file.write)
+            except OSError as e:
+                raise CommandError(f'Can\'t write {options["output"]}: {e}')
+        else:
+            count = self.write_lines(lines, lambda line: self.stdout.write(line, ending=''))
+
+        if options['format'] == 'csv':
+            count -= 1  # the header
+        # standard output may be the export itself, so the summary goes to standard error
+        self.stderr.write(f'Exported {count} videos')
+
+    def write_lines(self, lines, write):
+        count = 0
+        for line in lines:
+            write(line)
+            count += 1
+        return count
@@ -0,0 +1,36 @@
+import sys
+from django.core.management.base import BaseCommand, CommandError
+from video_collection import importer
+
+
+class Command(BaseCommand):
+    help = 'Imports videos from CSV (name,url,notes columns) or JSON lines files'
+
+    def add_arguments(self, parser):
+        parser.add_argument('files', nargs='+', help='Files to import, or - to read from standard input')
+        parser.add_argument('--format', choices=importer.FORMATS, help='Input format, guessed from the file extension if not given')
+        parser.add_argument('--batch-size', type=int, default=importer.BATCH_SIZE, help='Number of videos validated and inserted together')
+
+    def handle(self, *args, **options):
+        for filename in options['files']:
+            input_format = options['format'] or importer.guess_format(filename)
+            if input_format is None:
+                raise CommandError(f'Can\'t tell the format of {filename}, use --format')
+
+            if filename == '-':
+                report = self.import_file(sys.stdin, input_format, options['batch_size'])
+            else:
+                try:
+                    with open(filename, newline='', encoding='utf-8') as import_file:
+                        report = self.import_file(import_file, input_format, options['batch_size'])
+                except OSError as e:
+                    raise CommandError(f'Can\'t read {filename}: {e}')
+
+            for error in report.errors:
+                self.stderr.write(f'{filename}:{error["line"]}: {error["status"]}: {error["message"]}')
+            self.stdout.write(self.style.SUCCESS(
+                f'{filename}: {report.created} added, {report.duplicates} duplicates, {report.invalid} invalid'
+            ))
+
+    def import_file(self, import_file, input_format, batch_size):
+        return importer.import_videos(importer.read_rows(import_file, input_format), batch_size)
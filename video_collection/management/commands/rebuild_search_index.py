@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, DEFAULT_DB_ALIAS
+from video_collection import search
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the full text search index of video names and notes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS, help='Database to rebuild the index in')
+        parser.add_argument('--optimize', action='store_true', help='Also merge the index into a single b-tree')
+
+    def handle(self, *args, **options):
+        db_connection = connections[options['database']]
+        if not search.fts_supported(db_connection):
+            raise CommandError('This database does not support SQLite FTS5, searches use LIKE instead')
+
+        # creates the table and triggers if they are missing, then re-reads every video
+        search.create_search_index(db_connection)
+        if options['optimize']:
+            search.optimize_search_index(db_connection)
+
+        self.stdout.write(self.style.SUCCESS('Search index rebuilt'))
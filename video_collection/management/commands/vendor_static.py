@@ -0,0 +1,19 @@
+import os
+from urllib.error import URLError
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+from video_collection import staticfiles
+
+
+class Command(BaseCommand):
+    help = 'Downloads the third party static files in VIDEO_VENDORED_STATIC into the app, to commit with it'
+
+    def handle(self, *args, **options):
+        static_dir = os.path.join(apps.get_app_config('video_collection').path, 'static')
+        try:
+            written = staticfiles.vendor_files(static_dir)
+        except (URLError, TimeoutError) as e:
+            raise CommandError(f'Download failed: {e}')
+        for path in written:
+            self.stdout.write(f'Wrote {path}')
+        self.stdout.write(self.style.SUCCESS(f'Vendored {len(written)} files, run collectstatic to rebuild the bundle'))
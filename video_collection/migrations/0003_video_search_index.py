@@ -0,0 +1,23 @@
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    from video_collection.search import create_search_index
+    create_search_index(schema_editor.connection)
+
+
+def drop_search_index(apps, schema_editor):
+    from video_collection.search import drop_search_index
+    drop_search_index(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('video_collection', '0002_video_video_id'),
+    ]
+
+    operations = [
+        # SQLite FTS5 index over video names and notes, a no-op on other databases
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
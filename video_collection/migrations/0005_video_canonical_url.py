@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:26
+
+from django.db import migrations, models
+
+
+def fill_canonical_urls(apps, schema_editor):
+    # in batches, so a large collection isn't held in memory or locked in one long update
+    from video_collection.dedupe import fill_canonical_urls
+    fill_canonical_urls(apps.get_model('video_collection', 'Video'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('video_collection', '0004_video_metadata_enrichment_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='video',
+            name='canonical_url',
+            field=models.CharField(blank=True, db_index=True, max_length=400, null=True),
+        ),
+        migrations.RunPython(fill_canonical_urls, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:33
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('video_collection', '0005_video_canonical_url'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Playlist',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=200)),
+                ('slug', models.SlugField(max_length=200, unique=True)),
+                ('description', models.TextField(blank=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='PlaylistEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('position', models.PositiveIntegerField()),
+                ('playlist', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='entries', to='video_collection.playlist')),
+                ('video', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='playlist_entries', to='video_collection.video')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='playlist',
+            name='videos',
+            field=models.ManyToManyField(blank=True, related_name='playlists', through='video_collection.PlaylistEntry', to='video_collection.video'),
+        ),
+        migrations.CreateModel(
+            name='Tag',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('slug', models.SlugField(unique=True)),
+                ('video_count', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['-video_count', 'name'], name='tag_cloud_idx')],
+            },
+        ),
+        migrations.AddField(
+            model_name='video',
+            name='tags',
+            field=models.ManyToManyField(blank=True, related_name='videos', to='video_collection.tag'),
+        ),
+        migrations.AddIndex(
+            model_name='playlistentry',
+            index=models.Index(fields=['playlist', 'position'], name='playlist_entry_order_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='playlistentry',
+            constraint=models.UniqueConstraint(fields=('playlist', 'video'), name='playlist_entry_unique_video'),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:12
+
+import django.db.models.functions.text
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('video_collection', '0006_tags_and_playlists'),
+    ]
+
+    operations = [
+        # videos added before these columns existed are given the time of the migration
+        migrations.AddField(
+            model_name='video',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='video',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddIndex(
+            model_name='video',
+            index=models.Index(django.db.models.functions.text.Lower('name'), models.F('id'), name='video_sort_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='video',
+            index=models.Index(fields=['name'], name='video_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='video',
+            index=models.Index(fields=['-created_at', '-id'], name='video_recent_idx'),
+        ),
+    ]
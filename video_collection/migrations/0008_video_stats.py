@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('video_collection', '0007_video_sort_indexes_timestamps'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VideoStats',
+            fields=[
+                ('video', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='video_collection.video')),
+                ('views', models.PositiveBigIntegerField(default=0)),
+                ('last_viewed_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name_plural': 'video stats',
+                'indexes': [models.Index(fields=['-views', 'video'], name='video_stats_popular_idx'), models.Index(fields=['-last_viewed_at', 'video'], name='video_stats_recent_idx')],
+            },
+        ),
+    ]
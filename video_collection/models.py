@@ -1,6 +1,8 @@
-from urllib import parse
-from django.core.exceptions import ValidationError
 from django.db import models
+from django.db.models import F
+from django.db.models.functions import Lower
+from django.utils.text import slugify
+from .youtube import parse_youtube_url
 
 
 class Video(models.Model):
@@ -8,36 +10,152 @@ class Video(models.Model):
     url = models.CharField(max_length=400)
     notes = models.TextField(blank=True, null=True) # allows null entries in the database
     video_id = models.CharField(max_length=40, unique=True)
+    # https://www.youtube.com/watch?v=ID, whatever form of link was added, used to find duplicates
+    canonical_url = models.CharField(max_length=400, blank=True, null=True, db_index=True)
+
+    # filled in from YouTube in the background after the video is added, see enrichment.py
+    title = models.CharField(max_length=200, blank=True, null=True)
+    duration = models.PositiveIntegerField(blank=True, null=True) # seconds
+    thumbnail_url = models.CharField(max_length=400, blank=True, null=True)
+    enriched_at = models.DateTimeField(blank=True, null=True)
+
+    tags = models.ManyToManyField('Tag', related_name='videos', blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # the video list's order (see pagination.VIDEO_ORDERING), so a page is read off the
+            # index instead of sorting the whole table. Databases without expression indexes
+            # skip it and sort instead
+            models.Index(Lower('name'), F('id'), name='video_sort_name_idx'),
+            # sorting by name as it is, e.g. the admin's name column
+            models.Index(fields=['name'], name='video_name_idx'),
+            # ?sort=recent, newest first (see pagination.RECENT_ORDERING)
+            models.Index(fields=['-created_at', '-id'], name='video_recent_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        # extract the video ID from a youtube url, raises a ValidationError if it isn't one
+        self.video_id, self.canonical_url = parse_youtube_url(self.url)
+        super().save(*args, **kwargs)
+
+    @property
+    def duration_text(self):
+        # 1:02:03 or 2:03, for showing on the page
+        if self.duration is None:
+            return ''
+        minutes, seconds = divmod(self.duration, 60)
+        hours, minutes = divmod(minutes, 60)
+        return f'{hours}:{minutes:02}:{seconds:02}' if hours else f'{minutes}:{seconds:02}'
+
+    def __str__(self):
+        return f'ID: {self.pk}, Name: {self.name}, URL: {self.url}, Video ID: {self.video_id}, Notes: {(self.notes or "")[:200]}'
+        # truncates notes to first 200 characters, notes can be NULL
+
+
+class EnrichmentJob(models.Model):
+    # one row per video waiting for its YouTube metadata, used as a work queue by the
+    # enrich_videos command
+
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    video = models.OneToOneField(Video, on_delete=models.CASCADE, related_name='enrichment_job')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    run_after = models.DateTimeField() # not retried before this time
+    claimed_by = models.CharField(max_length=32, blank=True) # the worker batch that has the job
+    locked_at = models.DateTimeField(blank=True, null=True)
+    last_error = models.TextField(blank=True)
+
+    class Meta:
+        indexes = [
+            # workers look for the next jobs by status and time
+            models.Index(fields=['status', 'run_after'], name='enrichment_job_queue_idx'),
+        ]
+
+    def __str__(self):
+        return f'Video: {self.video_id}, Status: {self.status}, Attempts: {self.attempts}'
+
+
+class VideoStats(models.Model):
+    # how often and how recently each video's details page has been viewed. Views are counted in
+    # memory and added here in batches (see viewcounts.py), and the most viewed and recently
+    # viewed lists are read off this table's indexes rather than sorting the videos
+    video = models.OneToOneField(Video, on_delete=models.CASCADE, primary_key=True, related_name='stats')
+    views = models.PositiveBigIntegerField(default=0)
+    last_viewed_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        verbose_name_plural = 'video stats'
+        indexes = [
+            models.Index(fields=['-views', 'video'], name='video_stats_popular_idx'),
+            models.Index(fields=['-last_viewed_at', 'video'], name='video_stats_recent_idx'),
+        ]
+
+    def __str__(self):
+        return f'Video: {self.video_id}, Views: {self.views}, Last viewed: {self.last_viewed_at}'
+
+
+class Tag(models.Model):
+    name = models.CharField(max_length=50, unique=True)
+    slug = models.SlugField(max_length=50, unique=True)
+    # how many videos have the tag, kept up to date by signals.py so the tag cloud is a plain
+    # indexed read instead of a GROUP BY over every video's tags
+    video_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-video_count', 'name'], name='tag_cloud_idx'),
+        ]
 
     def save(self, *args, **kwargs):
-        # extract the video ID from a youtube url
-
-        # various ValidationErrors that will occur if the YouTube link does not follow specific patterns
-        if not self.url.startswith('https://www.youtube.com/watch'):
-            raise ValidationError(f'Not a YouTube URL {self.url}')
-
-        url_components = parse.urlparse(self.url)
-
-        if url_components.scheme != 'https':
-            raise ValidationError(f'Not a YouTube URL {self.url}')
-        
-        if url_components.netloc != 'www.youtube.com':
-            raise ValidationError(f'Not a YouTube URL {self.url}')
-
-        if url_components.path != '/watch':
-            raise ValidationError(f'Not a YouTube URL {self.url}')
-
-        query_string = url_components.query
-        if not query_string:
-            raise ValidationError(f'Invalid YouTube URL {self.url}')
-        parameters = parse.parse_qs(query_string, strict_parsing=True)
-        v_parameters_list = parameters.get('v') # return None if no key found
-        if not v_parameters_list: # checking if None or empty list
-            raise ValidationError(f'Invalid Youtube URL {self.url}')
-        self.video_id = v_parameters_list[0]
-        
+        if not self.slug:
+            self.slug = slugify(self.name)
         super().save(*args, **kwargs)
 
     def __str__(self):
-        return f'ID: {self.pk}, Name: {self.name}, URL: {self.url}, Video ID: {self.video_id}, Notes: {self.notes[:200]}'
-        # truncates notes to first 200 characters
+        return f'Tag: {self.name}, Videos: {self.video_count}'
+
+
+class Playlist(models.Model):
+    name = models.CharField(max_length=200)
+    slug = models.SlugField(max_length=200, unique=True)
+    description = models.TextField(blank=True)
+    videos = models.ManyToManyField(Video, through='PlaylistEntry', related_name='playlists', blank=True)
+
+    def save(self, *args, **kwargs):
+        if not self.slug:
+            self.slug = slugify(self.name)
+        super().save(*args, **kwargs)
+
+    def __str__(self):
+        return f'Playlist: {self.name}'
+
+
+class PlaylistEntry(models.Model):
+    # the composite index below starts with playlist, so the foreign key needs no index of its own
+    playlist = models.ForeignKey(Playlist, on_delete=models.CASCADE, related_name='entries', db_index=False)
+    video = models.ForeignKey(Video, on_delete=models.CASCADE, related_name='playlist_entries')
+    position = models.PositiveIntegerField() # order within the playlist, gaps are fine
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['playlist', 'video'], name='playlist_entry_unique_video'),
+        ]
+        indexes = [
+            models.Index(fields=['playlist', 'position'], name='playlist_entry_order_idx'),
+        ]
+
+    def __str__(self):
+        return f'Playlist: {self.playlist_id}, Position: {self.position}, Video: {self.video_id}'
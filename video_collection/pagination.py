@@ -0,0 +1,223 @@
+import base64
+import binascii
+import json
+import math
+from datetime import datetime
+from django.conf import settings
+from django.db.models import Q
+from django.db.models.functions import Lower
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+
+# keyset (cursor) pagination - instead of OFFSET, each page remembers the sort key of its
+# first and last rows, and the next query starts from there with a WHERE clause, so the cost
+# of a page doesn't grow with how deep into the collection the user has scrolled
+
+NEXT = 'n'
+PREVIOUS = 'p'
+
+# the video list is sorted case-insensitively by name, with the primary key as a tie-breaker
+# so that two videos with the same name always come out in the same order
+VIDEO_ORDERING = ('sort_name', 'id')
+
+# ?sort=recent, newest first. A leading - sorts that field in descending order
+RECENT_ORDERING = ('-created_at', '-id')
+
+
+class Page:
+
+    def __init__(self, items, count, next_cursor=None, previous_cursor=None):
+        self.items = items
+        self.count = count
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+def encode_cursor(direction, values):
+    # the cursor is opaque to the user - just the direction and sort key as url-safe base64 JSON
+    # datetimes go in as ISO strings with full precision, which filters accept as they are
+    raw = json.dumps([direction, list(values)], separators=(',', ':'), default=_isoformat).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def _isoformat(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f'{type(value).__name__} can\'t be used in a cursor')
+
+
+def _integer(value):
+    # within SQLite's 64 bit integers, anything bigger fails to bind rather than compare
+    if isinstance(value, bool) or not isinstance(value, int) or not -2 ** 63 <= value < 2 ** 63:
+        raise ValueError
+    return value
+
+
+def _number(value):
+    if isinstance(value, float) and math.isfinite(value):
+        return value
+    return _integer(value)
+
+
+def _string(value):
+    if not isinstance(value, str):
+        raise ValueError
+    return value
+
+
+def _timestamp(value):
+    # cursors hold datetimes as ISO strings, see encode_cursor
+    parsed = parse_datetime(_string(value))
+    if parsed is None or (settings.USE_TZ and timezone.is_naive(parsed)):
+        raise ValueError
+    return parsed
+
+
+# what each field a list can be sorted on holds, for checking the values in a cursor. A field
+# that isn't here can't be paged through with a cursor
+CURSOR_FIELDS = {
+    'id': _integer,
+    'sort_name': _string,
+    'created_at': _timestamp,
+    'playlist_position': _integer,
+    'search_rank': _number,
+}
+
+
+def decode_cursor(cursor, ordering=VIDEO_ORDERING):
+    # returns (direction, values), or None if the cursor is missing or has been tampered with.
+    # The values are checked against the fields in ordering, so whatever is in a cursor can go
+    # straight into a query
+    if not cursor:
+        return None
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        direction, values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (binascii.Error, ValueError, TypeError, UnicodeDecodeError):
+        return None
+    if direction not in (NEXT, PREVIOUS) or not isinstance(values, list) or len(values) != len(ordering):
+        return None
+    try:
+        values = [CURSOR_FIELDS[field.lstrip('-')](value) for field, value in zip(ordering, values)]
+    except (KeyError, ValueError):
+        return None
+    return direction, values
+
+
+def get_page_size(value):
+    # page size from the query string, clamped so nobody can ask for the whole table at once
+    default = getattr(settings, 'VIDEO_LIST_PAGE_SIZE', 25)
+    maximum = getattr(settings, 'VIDEO_LIST_MAX_PAGE_SIZE', 100)
+    try:
+        page_size = int(value)
+    except (TypeError, ValueError):
+        return default
+    return max(1, min(page_size, maximum))
+
+
+def page_query_string(query, cursor):
+    # query string for a next/previous link, keeping the search term and page size the user chose
+    if not cursor:
+        return None
+    query = query.copy()
+    query['cursor'] = cursor
+    return query.urlencode()
+
+
+def video_sort_key(queryset):
+    # adds the lower-cased name the list is sorted on
+    return queryset.annotate(sort_name=Lower('name'))
+
+
+def reverse_field(field):
+    return field[1:] if field.startswith('-') else f'-{field}'
+
+
+def _keyset_filter(ordering, values, after):
+    # builds (a > x) OR (a = x AND b > y) ... for a row-value comparison, which works on every
+    # backend. Descending fields ('-a') compare the other way
+    fields = [field.lstrip('-') for field in ordering]
+    condition = Q()
+    for index, field in enumerate(fields):
+        lookup = 'gt' if after != ordering[index].startswith('-') else 'lt'
+        clause = Q(**{f'{field}__{lookup}': values[index]})
+        for previous_field, previous_value in zip(fields[:index], values[:index]):
+            clause &= Q(**{previous_field: previous_value})
+        condition |= clause
+    # the same bound on the first field alone, redundant but it lets the database start
+    # reading the index at the cursor rather than filtering from the start of it
+    first_lookup = 'gte' if after != ordering[0].startswith('-') else 'lte'
+    return Q(**{f'{fields[0]}__{first_lookup}': values[0]}) & condition
+
+
+def page_queryset(queryset, cursor=None, page_size=None, ordering=VIDEO_ORDERING):
+    """
+    Returns (queryset, decoded cursor) for one page of results. The queryset is sliced to
+    page_size + 1 rows so build_page can tell whether there is another page after this one.
+    Nothing is evaluated here, so the same query can be run by sync or async code.
+    """
+    page_size = page_size or get_page_size(None)
+    decoded = decode_cursor(cursor, ordering)
+
+    if decoded and decoded[0] == PREVIOUS:
+        # walk backwards from the first row of the page the user was on, then flip the rows back
+        queryset = queryset.filter(_keyset_filter(ordering, decoded[1], after=False))
+        queryset = queryset.order_by(*[reverse_field(field) for field in ordering])
+    else:
+        if decoded:
+            queryset = queryset.filter(_keyset_filter(ordering, decoded[1], after=True))
+        queryset = queryset.order_by(*ordering)
+
+    return queryset[:page_size + 1], decoded
+
+
+def build_page(rows, count, decoded, page_size=None, ordering=VIDEO_ORDERING):
+    page_size = page_size or get_page_size(None)
+    rows = list(rows)
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    backwards = bool(decoded) and decoded[0] == PREVIOUS
+    if backwards:
+        rows.reverse()
+
+    def key(row):
+        # rows can be model instances or dicts from .values()
+        if isinstance(row, dict):
+            return [row[field.lstrip('-')] for field in ordering]
+        return [getattr(row, field.lstrip('-')) for field in ordering]
+
+    next_cursor = previous_cursor = None
+    if rows:
+        # going forwards there is a previous page whenever we started from a cursor, and
+        # going backwards there is always a next page (the one we came from)
+        if has_more or backwards:
+            next_cursor = encode_cursor(NEXT, key(rows[-1]))
+        if (has_more and backwards) or (decoded and not backwards):
+            previous_cursor = encode_cursor(PREVIOUS, key(rows[0]))
+
+    return Page(rows, count, next_cursor, previous_cursor)
+
+
+def paginate(queryset, cursor=None, page_size=None, ordering=VIDEO_ORDERING):
+    # the count is a separate query on the filtered but unsorted queryset, so the database
+    # can answer it without sorting or fetching any of the (potentially large) notes columns
+    page_size = page_size or get_page_size(None)
+    count = queryset.order_by().count()
+    page_query, decoded = page_queryset(queryset, cursor, page_size, ordering)
+    return build_page(page_query, count, decoded, page_size, ordering)
+
+
+async def apaginate(queryset, cursor=None, page_size=None, ordering=VIDEO_ORDERING):
+    # the same queries as paginate, run with the async ORM
+    page_size = page_size or get_page_size(None)
+    count = await queryset.order_by().acount()
+    page_query, decoded = page_queryset(queryset, cursor, page_size, ordering)
+    rows = [row async for row in page_query]
+    return build_page(rows, count, decoded, page_size, ordering)
@@ -0,0 +1,90 @@
+from asgiref.sync import async_to_sync, iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.urls import Resolver404, resolve
+from django.utils.cache import patch_cache_control, patch_vary_headers
+
+
+# session-free fast path for the read-only pages
+#
+# views marked with @public_page show the same thing to everybody, so for GET and HEAD requests
+# PublicPageMiddleware calls them directly instead of passing the request down the rest of
+# MIDDLEWARE. That skips loading the session, the user and the messages, and drops any cookies
+# the browser sent, so nothing about the visitor can end up in the page. The response is marked
+# Cache-Control: public with no Vary: Cookie, so a shared cache or reverse proxy in front of
+# the app can serve it to every visitor.
+
+SAFE_METHODS = ('GET', 'HEAD')
+
+
+def public_page(view):
+    # goes outermost, above any other decorators on the view
+    view.public_page = True
+    return view
+
+
+def make_public(response):
+    patch_cache_control(response, public=True, max_age=getattr(settings, 'VIDEO_PUBLIC_MAX_AGE', 60))
+    patch_vary_headers(response, ['Accept-Encoding'])
+    if response.has_header('Vary'):
+        vary = [header.strip() for header in response['Vary'].split(',')]
+        response['Vary'] = ', '.join(header for header in vary if header.lower() != 'cookie')
+    # what XFrameOptionsMiddleware would have added further down the stack
+    response.setdefault('X-Frame-Options', getattr(settings, 'X_FRAME_OPTIONS', 'DENY'))
+    return response
+
+
+class PublicPageMiddleware:
+    """
+    Goes straight after SecurityMiddleware, before SessionMiddleware, so the middleware it skips
+    is everything from sessions onwards.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def public_match(self, request):
+        if not getattr(settings, 'VIDEO_PUBLIC_PAGES', True) or request.method not in SAFE_METHODS:
+            return None
+        try:
+            match = resolve(request.path_info)
+        except Resolver404:
+            return None
+        return match if getattr(match.func, 'public_page', False) else None
+
+    def prepare(self, request, match):
+        # CommonMiddleware, which would check ALLOWED_HOSTS, is skipped too. A disallowed host
+        # raises DisallowedHost here and gets a 400, rather than a page a shared cache could keep
+        request.get_host()
+        # anonymous and cookie-free, whatever the browser sent
+        request.COOKIES = {}
+        request.META.pop('HTTP_COOKIE', None)
+        request.resolver_match = match
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        match = self.public_match(request)
+        if match is None:
+            return self.get_response(request)
+
+        self.prepare(request, match)
+        view = match.func
+        if iscoroutinefunction(view):
+            view = async_to_sync(view)
+        return make_public(view(request, *match.args, **match.kwargs))
+
+    async def __acall__(self, request):
+        match = self.public_match(request)
+        if match is None:
+            return await self.get_response(request)
+
+        self.prepare(request, match)
+        view = match.func
+        if not iscoroutinefunction(view):
+            view = sync_to_async(view, thread_sensitive=True)
+        return make_public(await view(request, *match.args, **match.kwargs))
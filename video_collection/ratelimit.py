@@ -0,0 +1,94 @@
+import math
+import threading
+import time
+from functools import wraps
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+
+
+# rate limiting for the views that add videos
+#
+# every add costs form validation, URL parsing and an INSERT, and SQLite only lets one
+# connection write at a time, so a client posting as fast as it can would keep every other
+# writer (and, while the writes queue up, every reader) waiting. Each limit in
+# VIDEO_WRITE_RATE_LIMITS is a token bucket: it holds up to `requests` tokens, refilled
+# steadily over `seconds`, and each write takes one. Buckets are kept in a Django cache, so
+# with the file based cache (VIDEO_CACHE_DIR) they are shared by every worker process.
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+KEY_PREFIX = 'video_collection:ratelimit:'
+
+# one cache read and write per bucket isn't atomic, so threads in a process take turns. Between
+# processes two writes can occasionally both get the last token, which is close enough
+_lock = threading.Lock()
+
+
+def get_cache():
+    return caches[getattr(settings, 'VIDEO_RATE_LIMIT_CACHE_ALIAS', 'default')]
+
+
+def client_ip(request):
+    # behind a reverse proxy, VIDEO_CLIENT_IP_HEADER names the header it puts the client's address
+    # in. The last address in it is the one the proxy saw, anything before that the client can fake
+    header = getattr(settings, 'VIDEO_CLIENT_IP_HEADER', None)
+    if header and request.headers.get(header):
+        return request.headers[header].split(',')[-1].strip()
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def take_token(buckets, now=None):
+    """
+    Takes a token from every bucket, given as {cache key: (requests, seconds)}. Returns 0 if
+    there was one in all of them, otherwise how many seconds until there will be, in which case
+    nothing is taken.
+    """
+    now = time.time() if now is None else now
+    bucket_cache = get_cache()
+    with _lock:
+        stored = bucket_cache.get_many(list(buckets))
+        levels, wait = {}, 0
+        for key, (requests, seconds) in buckets.items():
+            rate = requests / seconds
+            tokens, updated = stored.get(key, (requests, now))
+            tokens = min(requests, tokens + (now - updated) * rate)
+            if tokens < 1:
+                wait = max(wait, (1 - tokens) / rate)
+            levels[key] = tokens - 1
+        if wait:
+            return wait
+        for key, (requests, seconds) in buckets.items():
+            # a bucket left alone for `seconds` is full again, so it can be forgotten
+            bucket_cache.set(key, (levels[key], now), timeout=math.ceil(seconds))
+    return 0
+
+
+def write_buckets(request):
+    limits = getattr(settings, 'VIDEO_WRITE_RATE_LIMITS', {})
+    keys = {'ip': f'{KEY_PREFIX}ip:{client_ip(request)}', 'global': f'{KEY_PREFIX}global'}
+    return {keys[scope]: limit for scope, limit in limits.items() if limit}
+
+
+def too_many_requests(wait):
+    retry_after = max(1, math.ceil(wait))
+    response = HttpResponse(
+        f'Too many videos added, try again in {retry_after} second{"s" if retry_after != 1 else ""}.',
+        status=429,
+        content_type='text/plain; charset=utf-8',
+    )
+    response['Retry-After'] = str(retry_after)
+    return response
+
+
+def rate_limited(view):
+    # for views that write, only requests that can change something are counted
+    @wraps(view)
+    def limited_view(request, *args, **kwargs):
+        if request.method not in SAFE_METHODS:
+            buckets = write_buckets(request)
+            wait = take_token(buckets) if buckets else 0
+            if wait:
+                return too_many_requests(wait)
+        return view(request, *args, **kwargs)
+    return limited_view
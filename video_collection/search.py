@@ -0,0 +1,208 @@
+import re
+from asgiref.sync import sync_to_async
+from django.db import connection
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from .models import Video
+from .pagination import PREVIOUS, apaginate, build_page, decode_cursor, get_page_size, paginate, video_sort_key
+
+
+# full text search over video names and notes
+#
+# on SQLite the videos are indexed in an FTS5 table that uses the video table as its content,
+# so the index only stores the search terms, not a second copy of every note. Triggers on the
+# video table keep the index up to date on every insert, update and delete, including bulk
+# inserts that don't go through Video.save. Other databases fall back to a LIKE query.
+
+FTS_TABLE = 'video_collection_video_fts'
+VIDEO_TABLE = 'video_collection_video'
+
+# name matches count for more than matches in the notes when ranking results
+NAME_WEIGHT = 10.0
+NOTES_WEIGHT = 1.0
+
+SEARCH_ORDERING = ('search_rank', 'id')
+
+_TRIGGERS = {
+    f'{FTS_TABLE}_insert': f'''
+        CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_insert AFTER INSERT ON {VIDEO_TABLE} BEGIN
+            INSERT INTO {FTS_TABLE} (rowid, name, notes) VALUES (new.id, new.name, new.notes);
+        END''',
+    f'{FTS_TABLE}_delete': f'''
+        CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_delete AFTER DELETE ON {VIDEO_TABLE} BEGIN
+            INSERT INTO {FTS_TABLE} ({FTS_TABLE}, rowid, name, notes) VALUES ('delete', old.id, old.name, old.notes);
+        END''',
+    f'{FTS_TABLE}_update': f'''
+        CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_update AFTER UPDATE OF name, notes ON {VIDEO_TABLE} BEGIN
+            INSERT INTO {FTS_TABLE} ({FTS_TABLE}, rowid, name, notes) VALUES ('delete', old.id, old.name, old.notes);
+            INSERT INTO {FTS_TABLE} (rowid, name, notes) VALUES (new.id, new.name, new.notes);
+        END''',
+}
+
+
+def fts_supported(db_connection=connection):
+    # SQLite can be compiled without FTS5, so check for the module rather than just the vendor.
+    # The answer is remembered on the connection so searches don't pay for an extra query
+    if db_connection.vendor != 'sqlite':
+        return False
+    supported = getattr(db_connection, '_video_fts_supported', None)
+    if supported is None:
+        with db_connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM pragma_module_list WHERE name = 'fts5'")
+            supported = cursor.fetchone() is not None
+        db_connection._video_fts_supported = supported
+    return supported
+
+
+def create_search_index(db_connection=connection):
+    if not fts_supported(db_connection):
+        return
+    with db_connection.cursor() as cursor:
+        cursor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+            f"name, notes, content='{VIDEO_TABLE}', content_rowid='id', "
+            f"tokenize='unicode61 remove_diacritics 2')"
+        )
+        # store the column weights in the index, so ORDER BY rank uses them
+        cursor.execute(
+            f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}, rank) VALUES ('rank', 'bm25({NAME_WEIGHT}, {NOTES_WEIGHT})')"
+        )
+        for trigger_sql in _TRIGGERS.values():
+            cursor.execute(trigger_sql)
+    rebuild_search_index(db_connection)
+
+
+def drop_search_index(db_connection=connection):
+    if db_connection.vendor != 'sqlite':
+        return
+    with db_connection.cursor() as cursor:
+        for trigger_name in _TRIGGERS:
+            cursor.execute(f'DROP TRIGGER IF EXISTS {trigger_name}')
+        cursor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+
+
+def ensure_search_triggers(db_connection=connection):
+    # SQLite migrations that alter the video table copy it into a new table and drop the old one,
+    # which takes the triggers with it - so they are put back after every migrate
+    if not fts_supported(db_connection) or FTS_TABLE not in db_connection.introspection.table_names():
+        return
+    with db_connection.cursor() as cursor:
+        for trigger_sql in _TRIGGERS.values():
+            cursor.execute(trigger_sql)
+
+
+def rebuild_search_index(db_connection=connection):
+    # re-reads every video from the video table, e.g. after the triggers were missing for a while
+    with db_connection.cursor() as cursor:
+        cursor.execute(f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('rebuild')")
+
+
+def optimize_search_index(db_connection=connection):
+    # merges the index b-trees into one, which makes queries faster after lots of small writes
+    with db_connection.cursor() as cursor:
+        cursor.execute(f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('optimize')")
+
+
+def build_match_query(search_term):
+    # every word in the search term has to appear, and any word can be the start of a longer
+    # word, so 'pod' finds 'podcast'. Words are quoted so FTS5 syntax in user input
+    # (AND, OR, NEAR, column filters) is treated as plain text
+    words = re.findall(r'\w+', search_term)
+    if not words:
+        return None
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+def matching_videos(search_term, queryset=None):
+    # unranked queryset of every matching video, for callers that sort or stream the results themselves
+    if queryset is None:
+        queryset = Video.objects.all()
+    if not fts_supported():
+        return queryset.filter(Q(name__icontains=search_term) | Q(notes__icontains=search_term))
+    match_query = build_match_query(search_term)
+    if match_query is None:
+        return queryset.none()
+    return queryset.filter(
+        pk__in=RawSQL(f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s', (match_query,))
+    )
+
+
+def _keyset_sql(decoded):
+    # SQL version of pagination._keyset_filter for (rank, rowid)
+    if not decoded:
+        return '', [], 'rank, rowid'
+    direction, (rank, rowid) = decoded
+    comparison, order = ('<', 'rank DESC, rowid DESC') if direction == PREVIOUS else ('>', 'rank, rowid')
+    return f' AND (rank {comparison} %s OR (rank = %s AND rowid {comparison} %s))', [rank, rank, rowid], order
+
+
+def _ranked_ids(match_query, decoded, page_size):
+    # (total matches, [(video id, rank), ...]) for one page, straight from the index
+    keyset_sql, keyset_params, order_by = _keyset_sql(decoded)
+    with connection.cursor() as db_cursor:
+        db_cursor.execute(f'SELECT count(*) FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s', [match_query])
+        count = db_cursor.fetchone()[0]
+        db_cursor.execute(
+            f'SELECT rowid, rank FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s{keyset_sql} '
+            f'ORDER BY {order_by} LIMIT %s',
+            [match_query, *keyset_params, page_size + 1],
+        )
+        return count, db_cursor.fetchall()
+
+
+def _ranked_videos(videos, ranked_ids):
+    # puts the videos loaded by id back in rank order
+    rows = []
+    for video_id, rank in ranked_ids:
+        video = videos.get(video_id)
+        if video is not None:  # deleted since the index was read
+            video.search_rank = rank
+            rows.append(video)
+    return rows
+
+
+def search_page(search_term, cursor=None, page_size=None, queryset=None):
+    """
+    One page of videos matching search_term, best matches first. The videos are loaded from
+    queryset, so callers can limit the columns fetched with .only().
+
+    Results are paginated with a cursor on (rank, id). Ranks depend on the whole index, so a
+    cursor made before videos were added or edited can skip or repeat a few results - the
+    same trade-off as any ranked search.
+    """
+    page_size = page_size or get_page_size(None)
+    if queryset is None:
+        queryset = Video.objects.all()
+
+    if not fts_supported():
+        # no full text index - filter with LIKE and keep the normal alphabetical list order
+        return paginate(video_sort_key(matching_videos(search_term, queryset)), cursor, page_size)
+
+    match_query = build_match_query(search_term)
+    if match_query is None:
+        return build_page([], 0, None, page_size, SEARCH_ORDERING)
+
+    decoded = decode_cursor(cursor, SEARCH_ORDERING)
+    count, ranked_ids = _ranked_ids(match_query, decoded, page_size)
+    videos = queryset.in_bulk([video_id for video_id, rank in ranked_ids])
+    return build_page(_ranked_videos(videos, ranked_ids), count, decoded, page_size, SEARCH_ORDERING)
+
+
+async def asearch_page(search_term, cursor=None, page_size=None, queryset=None):
+    # async version of search_page. The ORM has no async raw SQL, so only the index query runs
+    # in a worker thread, the videos themselves are loaded with the async ORM
+    page_size = page_size or get_page_size(None)
+    if queryset is None:
+        queryset = Video.objects.all()
+
+    if not await sync_to_async(fts_supported)():
+        return await apaginate(video_sort_key(matching_videos(search_term, queryset)), cursor, page_size)
+
+    match_query = build_match_query(search_term)
+    if match_query is None:
+        return build_page([], 0, None, page_size, SEARCH_ORDERING)
+
+    decoded = decode_cursor(cursor, SEARCH_ORDERING)
+    count, ranked_ids = await sync_to_async(_ranked_ids)(match_query, decoded, page_size)
+    videos = await queryset.ain_bulk([video_id for video_id, rank in ranked_ids])
+    return build_page(_ranked_videos(videos, ranked_ids), count, decoded, page_size, SEARCH_ORDERING)
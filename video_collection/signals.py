@@ -0,0 +1,64 @@
+from django.db.backends.signals import connection_created
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from .caching import bump_version
+from .db import configure_connection
+from .enrichment import enqueue
+from .models import Playlist, PlaylistEntry, Tag, Video
+from .tagging import adjust_tag_counts, tag_links
+
+
+# database settings that have to be applied to each new connection, see db.py
+
+@receiver(connection_created)
+def database_connected(sender, connection, **kwargs):
+    configure_connection(connection)
+
+
+# any change to a video makes every cached page out of date, see caching.py
+
+@receiver(post_save, sender=Video)
+def video_saved(sender, instance, created, **kwargs):
+    bump_version()
+    if created:
+        # title, duration and thumbnail are looked up later by the enrich_videos command
+        enqueue([instance.pk])
+
+
+@receiver(post_delete, sender=Video)
+def video_deleted(sender, **kwargs):
+    bump_version()
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Playlist)
+@receiver(post_save, sender=PlaylistEntry)
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Playlist)
+@receiver(post_delete, sender=PlaylistEntry)
+def collection_changed(sender, **kwargs):
+    # tags and playlists are shown on the cached pages too
+    bump_version()
+
+
+# per-tag video counts, see tagging.py
+
+@receiver(m2m_changed, sender=Video.tags.through)
+def video_tags_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    # instance is a video, or a tag when the change was made from the tag's side (reverse)
+    if action == 'post_add':
+        # pk_set only has the links that were actually new
+        adjust_tag_counts({instance.pk: len(pk_set)} if reverse else dict.fromkeys(pk_set, 1))
+    elif action in ('pre_remove', 'pre_clear'):
+        # pk_set can name links that don't exist, so count the ones about to go first
+        instance._removed_tag_links = tag_links(instance, reverse, pk_set)
+    elif action in ('post_remove', 'post_clear'):
+        adjust_tag_counts({tag_pk: -count for tag_pk, count in instance.__dict__.pop('_removed_tag_links', {}).items()})
+    if action.startswith('post_'):
+        bump_version()
+
+
+@receiver(pre_delete, sender=Video)
+def video_deleting(sender, instance, **kwargs):
+    # the video's links to its tags are deleted with it without an m2m_changed signal
+    adjust_tag_counts({tag_pk: -count for tag_pk, count in tag_links(instance, reverse=False).items()})
@@ -0,0 +1,16 @@
+// Replaces a video thumbnail with the YouTube player the first time it is clicked,
+// so a page of videos doesn't start up one embedded player per video as it loads
+document.addEventListener('click', function (event) {
+    var facade = event.target.closest('.video-facade');
+    if (!facade) {
+        return;
+    }
+
+    var iframe = document.createElement('iframe');
+    iframe.width = 420;
+    iframe.height = 315;
+    iframe.allow = 'autoplay; encrypted-media; picture-in-picture';
+    iframe.allowFullscreen = true;
+    iframe.src = 'https://youtube.com/embed/' + encodeURIComponent(facade.dataset.videoId) + '?autoplay=1';
+    facade.replaceWith(iframe);
+});
@@ -0,0 +1,252 @@
+import gzip
+import json
+import logging
+import mimetypes
+import os
+from functools import lru_cache
+from urllib import request as urlrequest
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage, staticfiles_storage
+from django.core.files.base import ContentFile
+from django.http import FileResponse, HttpResponseNotModified
+from django.utils.http import http_date
+
+try:
+    import brotli
+except ImportError:  # optional, only gzip variants are made without it
+    brotli = None
+
+
+# static files: one CSS bundle, fingerprinted names, precompressed variants, served by the app
+#
+# collectstatic (with CompressedManifestStaticFilesStorage) concatenates the stylesheets in
+# VIDEO_CSS_BUNDLE into css/bundle.css, gives every file a name containing a hash of its
+# contents (css/bundle.3f2a1c9b0e4d.css), and writes a .gz (and .br, if the brotli package is
+# installed) copy of each text file next to it. StaticFilesMiddleware then serves STATIC_ROOT
+# itself: the smallest variant the browser accepts, and for hashed names a one year
+# Cache-Control, since a changed file always gets a new name.
+#
+# third party stylesheets are meant to be vendored into static/css/vendor by
+# `manage.py vendor_static`, from the URLs in VIDEO_VENDORED_STATIC, and committed. Water CSS
+# hasn't been yet, so for now pages still link it from the CDN, next to the bundle of our own CSS.
+
+logger = logging.getLogger('video_collection.staticfiles')
+
+BUNDLE_NAME = 'css/bundle.css'
+
+COMPRESSIBLE_EXTENSIONS = ('.css', '.js', '.svg', '.json', '.txt', '.html', '.xml', '.map')
+
+MIN_COMPRESS_SIZE = 200  # bytes, smaller files aren't worth it
+
+FOREVER = 60 * 60 * 24 * 365
+
+
+# the bundle
+
+@lru_cache(maxsize=None)
+def bundle_sources():
+    """
+    (local files, fallback URLs): the VIDEO_CSS_BUNDLE files that exist, and the remote URLs to
+    link to for vendored files that haven't been downloaded yet.
+    """
+    local, remote = [], []
+    vendored = getattr(settings, 'VIDEO_VENDORED_STATIC', {})
+    for path in settings.VIDEO_CSS_BUNDLE:
+        if finders.find(path):
+            local.append(path)
+        elif path in vendored:
+            remote.append(vendored[path])
+        else:
+            logger.warning('%s is in VIDEO_CSS_BUNDLE but was not found', path)
+    return local, remote
+
+
+def build_bundle():
+    local, remote = bundle_sources()
+    parts = []
+    for path in local:
+        with open(finders.find(path), encoding='utf-8') as source:
+            parts.append(f'/* {path} */\n{source.read().strip()}\n')
+    return '\n'.join(parts)
+
+
+def uses_bundle():
+    # only worth it with fingerprinted names, during development each file is linked separately
+    return isinstance(staticfiles_storage, ManifestStaticFilesStorage)
+
+
+# compression
+
+def compressed_variants(content):
+    # [(extension, bytes), ...] for the encodings worth keeping, smallest first
+    variants = [('.gz', gzip.compress(content, compresslevel=9, mtime=0))]
+    if brotli is not None:
+        variants.append(('.br', brotli.compress(content)))
+    # not worth the Content-Encoding if it doesn't save at least 5%
+    variants = [(extension, data) for extension, data in variants if len(data) < len(content) * 0.95]
+    return sorted(variants, key=lambda variant: len(variant[1]))
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """
+    ManifestStaticFilesStorage that also builds the CSS bundle and writes compressed copies of
+    every text file, under both the original and the hashed name.
+    """
+
+    def post_process(self, paths, dry_run=False, **options):
+        if dry_run:
+            yield from super().post_process(paths, dry_run, **options)
+            return
+
+        if self.exists(BUNDLE_NAME):
+            self.delete(BUNDLE_NAME)
+        self.save(BUNDLE_NAME, ContentFile(build_bundle().encode()))
+        paths = dict(paths, **{BUNDLE_NAME: (self, BUNDLE_NAME)})
+
+        written = set()
+        for name, hashed_name, processed in super().post_process(paths, dry_run, **options):
+            yield name, hashed_name, processed
+            if isinstance(processed, Exception):
+                continue
+            for path in (name, hashed_name):
+                if path and path not in written and path.endswith(COMPRESSIBLE_EXTENSIONS):
+                    self.compress(path)
+                    written.add(path)
+
+    def compress(self, path):
+        with self.open(path) as original:
+            content = original.read()
+        if len(content) < MIN_COMPRESS_SIZE:
+            return
+        for extension, data in compressed_variants(content):
+            if self.exists(path + extension):
+                self.delete(path + extension)
+            self.save(path + extension, ContentFile(data))
+
+
+# serving
+
+class StaticFile:
+
+    def __init__(self, path, immutable):
+        self.path = path
+        stat = os.stat(path)
+        self.size = stat.st_size
+        self.last_modified = http_date(stat.st_mtime)
+        self.etag = f'"{int(stat.st_mtime):x}-{stat.st_size:x}"'
+        self.content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        if self.content_type.startswith('text/') or self.content_type in ('application/javascript', 'image/svg+xml'):
+            self.content_type += '; charset=utf-8'
+        self.immutable = immutable
+        self.encodings = {
+            encoding: path + extension
+            for encoding, extension in (('br', '.br'), ('gzip', '.gz'))
+            if os.path.exists(path + extension)
+        }
+
+    def pick(self, accept_encoding):
+        # (path, Content-Encoding) for the best variant the client accepts
+        accepted = {part.split(';')[0].strip() for part in accept_encoding.split(',')}
+        for encoding, path in self.encodings.items():
+            if encoding in accepted:
+                return path, encoding
+        return self.path, None
+
+
+def load_static_files(root):
+    """
+    {url path: StaticFile} for everything under STATIC_ROOT, read once when the server starts.
+    Files named in the manifest with a hash are cached by browsers forever.
+    """
+    hashed = set()
+    manifest_path = os.path.join(root, ManifestStaticFilesStorage.manifest_name)
+    if os.path.exists(manifest_path):
+        with open(manifest_path, encoding='utf-8') as manifest:
+            hashed = set(json.load(manifest).get('paths', {}).values())
+
+    files = {}
+    for directory, _, filenames in os.walk(root):
+        for filename in filenames:
+            if filename.endswith(('.gz', '.br')):
+                continue
+            path = os.path.join(directory, filename)
+            name = os.path.relpath(path, root).replace(os.sep, '/')
+            files[name] = StaticFile(path, immutable=name in hashed)
+    return files
+
+
+class StaticFilesMiddleware:
+    """
+    Serves collected static files from STATIC_ROOT, so no separate web server is needed for
+    them. Goes straight after SecurityMiddleware. Does nothing when STATIC_ROOT hasn't been
+    collected, e.g. during development, where runserver serves them instead.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+        self.prefix = '/' + settings.STATIC_URL.lstrip('/')
+        root = getattr(settings, 'STATIC_ROOT', None)
+        self.files = load_static_files(root) if root and os.path.isdir(root) else {}
+
+    def find(self, request):
+        if request.method not in ('GET', 'HEAD') or not request.path_info.startswith(self.prefix):
+            return None
+        return self.files.get(request.path_info[len(self.prefix):])
+
+    def serve(self, request, static_file):
+        if request.headers.get('If-None-Match') == static_file.etag:
+            response = HttpResponseNotModified()
+        else:
+            path, encoding = static_file.pick(request.headers.get('Accept-Encoding', ''))
+            response = FileResponse(open(path, 'rb'), content_type=static_file.content_type)
+            response.headers.pop('Content-Disposition', None)  # FileResponse adds one, browsers don't need it
+            if encoding:
+                response['Content-Encoding'] = encoding
+        response['ETag'] = static_file.etag
+        response['Last-Modified'] = static_file.last_modified
+        response['Vary'] = 'Accept-Encoding'
+        max_age = FOREVER if static_file.immutable else getattr(settings, 'VIDEO_PUBLIC_MAX_AGE', 60)
+        response['Cache-Control'] = f'public, max-age={max_age}' + (', immutable' if static_file.immutable else '')
+        response['Access-Control-Allow-Origin'] = '*'
+        return response
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        static_file = self.find(request)
+        if static_file is None:
+            return self.get_response(request)
+        return self.serve(request, static_file)
+
+    async def __acall__(self, request):
+        static_file = self.find(request)
+        if static_file is None:
+            return await self.get_response(request)
+        return self.serve(request, static_file)
+
+
+# vendoring
+
+def vendor_files(directory, timeout=30):
+    """
+    Downloads each VIDEO_VENDORED_STATIC URL to its path under directory, the app's static
+    folder. Returns the paths written.
+    """
+    written = []
+    for path, url in settings.VIDEO_VENDORED_STATIC.items():
+        with urlrequest.urlopen(url, timeout=timeout) as response:
+            content = response.read()
+        target = os.path.join(directory, *path.split('/'))
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with open(target, 'wb') as vendored:
+            vendored.write(content)
+        written.append(path)
+    bundle_sources.cache_clear()
+    return written
@@ -0,0 +1,87 @@
+from collections import Counter, defaultdict
+from django.conf import settings
+from django.db.models import Count, F
+from django.utils.text import slugify
+from .models import Tag, Video
+from .pagination import RECENT_ORDERING, VIDEO_ORDERING, video_sort_key
+
+
+# tags and playlists
+#
+# the video list can be narrowed to one tag (?tag=slug) and/or one playlist (?playlist=slug).
+# Playlists keep their own order, so their pages use a cursor on (position, id) instead of the
+# usual (name, id). Each tag keeps a count of its videos, adjusted by signals.py whenever tags
+# are added or removed, so the tag cloud never has to count the whole collection.
+
+PLAYLIST_ORDERING = ('playlist_position', 'id')
+
+
+def parse_tag_names(text):
+    # 'Comedy, news ,,interviews' -> ['Comedy', 'news', 'interviews'], one per slug
+    names = {}
+    for name in text.split(','):
+        name = name.strip()[:50]
+        if name and slugify(name) and slugify(name) not in names:
+            names[slugify(name)] = name
+    return list(names.values())
+
+
+def get_or_create_tags(names):
+    # tags for the names, matched by slug so 'News' and 'news' are the same tag
+    slugs = {slugify(name): name for name in names}
+    Tag.objects.bulk_create([Tag(name=name, slug=slug) for slug, name in slugs.items()], ignore_conflicts=True)
+    return list(Tag.objects.filter(slug__in=slugs))
+
+
+def filtered_videos(tag=None, playlist=None, sort=None):
+    """
+    (queryset, ordering) for the videos with a tag and/or in a playlist, ready for paginate().
+    Playlists are in playlist order, everything else by name, or newest first if sort is 'recent'.
+    """
+    videos = Video.objects.all()
+    if tag is not None:
+        videos = videos.filter(tags=tag)
+    if playlist is not None:
+        # the annotation reuses the join made by the filter, so each video appears once
+        videos = videos.filter(playlist_entries__playlist=playlist).annotate(playlist_position=F('playlist_entries__position'))
+        return videos, PLAYLIST_ORDERING
+    if sort == 'recent':
+        return videos, RECENT_ORDERING
+    return video_sort_key(videos), VIDEO_ORDERING
+
+
+def tag_cloud(limit=None):
+    # the most used tags, read straight off the tag_cloud_idx index
+    limit = limit or settings.VIDEO_TAG_CLOUD_SIZE
+    return Tag.objects.filter(video_count__gt=0).order_by('-video_count', 'name')[:limit]
+
+
+def adjust_tag_counts(changes):
+    # changes is {tag pk: videos added (or removed, if negative)}. Tags changing by the same
+    # amount are updated together, so tagging a video takes one query rather than one per tag
+    by_amount = defaultdict(list)
+    for tag_pk, amount in changes.items():
+        if amount:
+            by_amount[amount].append(tag_pk)
+    for amount, tag_pks in by_amount.items():
+        Tag.objects.filter(pk__in=tag_pks).update(video_count=F('video_count') + amount)
+
+
+def tag_links(instance, reverse, pk_set=None):
+    # Counter of tag pk: how many of the instance's video/tag links there are, limited to pk_set
+    links = Video.tags.through.objects.filter(**{'tag' if reverse else 'video': instance})
+    if pk_set is not None:
+        links = links.filter(**{'video__in' if reverse else 'tag__in': pk_set})
+    return Counter(links.values_list('tag_id', flat=True))
+
+
+def recount_tags():
+    # recounts every tag from scratch, in case the counts were changed behind the signals' back
+    # (raw SQL, or bulk deletes of the link table). Returns how many tags were wrong
+    counts = dict(Video.tags.through.objects.values('tag_id').annotate(videos=Count('pk')).values_list('tag_id', 'videos'))
+    fixed = 0
+    for tag in Tag.objects.only('pk', 'video_count'):
+        if tag.video_count != counts.get(tag.pk, 0):
+            Tag.objects.filter(pk=tag.pk).update(video_count=counts.get(tag.pk, 0))
+            fixed += 1
+    return fixed
@@ -0,0 +1,19 @@
+from django import template
+from django.templatetags.static import static
+from django.utils.html import format_html_join
+from ..staticfiles import BUNDLE_NAME, bundle_sources, uses_bundle
+
+register = template.Library()
+
+
+@register.simple_tag
+def css_bundle():
+    # <link> tags for VIDEO_CSS_BUNDLE: the single fingerprinted bundle after collectstatic,
+    # each file on its own during development, and the original URL of anything not vendored yet
+    local, remote = bundle_sources()
+    hrefs = list(remote)
+    if uses_bundle():
+        hrefs.append(static(BUNDLE_NAME))
+    else:
+        hrefs.extend(static(path) for path in local)
+    return format_html_join('\n    ', '<link rel="stylesheet" href="{}">', ((href,) for href in hrefs))
@@ -1,10 +1,50 @@
+import csv
+import gzip
+import http.client
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import tracemalloc
+from datetime import timedelta
+from io import StringIO
 from sqlite3 import IntegrityError
-from django.test import TestCase
+from django.apps import apps
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection, connections
+from django.core.cache import cache
+from django.http import Http404
+from django.test import AsyncRequestFactory, SimpleTestCase, TestCase as DjangoTestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from unittest import mock, skipUnless
+from django.template import engines
+from django.template.loaders.cached import Loader as CachedLoader
+from django.template.loader import render_to_string
 from django.urls import reverse
-from .models import Video
-from django.db import IntegrityError
+from django.utils import timezone
+from . import caching, dedupe, enrichment, exporter, instrumentation, ratelimit, staticfiles, tagging, viewcounts, views, warmup, writes, youtube
+from .forms import VideoForm
+from .db import sqlite_pragma
+from .pagination import NEXT, RECENT_ORDERING, decode_cursor, encode_cursor, page_queryset, paginate
+from .models import EnrichmentJob, Playlist, PlaylistEntry, Tag, Video, VideoStats
+from .youtube import parse_youtube_url
+from django.db import IntegrityError, OperationalError
 from django.core.exceptions import ValidationError
 
+
+# the coalescing thread has its own database connection, which can't see what a test has
+# written inside its transaction, see TestCoalescedAdd for adds made through it
+@override_settings(VIDEO_COALESCE_WRITES=False)
+class TestCase(DjangoTestCase):
+
+    # cached pages outlive each test's database transaction, so every test starts with an empty cache
+    def setUp(self):
+        cache.clear()
+        super().setUp()
+
 class TestHomePageMessage(TestCase):
 
     # checks title of the page
@@ -120,6 +160,107 @@ class TestVideoList(TestCase):
         self.assertContains(response, '2 videos')
 
 
+class TestVideoListPagination(TestCase):
+
+    def create_videos(self, count):
+        # names are zero padded so alphabetical order matches creation order
+        return [
+            Video.objects.create(name=f'video {number:03}', notes='example', url=f'https://www.youtube.com/watch?v={number}')
+            for number in range(count)
+        ]
+
+    def test_first_page_limited_to_page_size_and_count_is_total(self):
+        videos = self.create_videos(5)
+        response = self.client.get(reverse('video_list') + '?page_size=2')
+
+        self.assertEqual(list(response.context['videos']), videos[:2])
+        self.assertContains(response, '5 videos')  # count covers every video, not just this page
+        self.assertIsNone(response.context['previous_page_query'])
+        self.assertIsNotNone(response.context['next_page_query'])
+
+    def test_next_and_previous_cursors_walk_the_list(self):
+        videos = self.create_videos(5)
+        url = reverse('video_list')
+
+        # follow the next links to the end of the list
+        seen = []
+        query = 'page_size=2'
+        while query:
+            response = self.client.get(url + '?' + query)
+            seen.extend(response.context['videos'])
+            query = response.context['next_page_query']
+
+        self.assertEqual(seen, videos)
+
+        # and one step back from the last page
+        response = self.client.get(url + '?' + response.context['previous_page_query'])
+        self.assertEqual(list(response.context['videos']), videos[2:4])
+
+    def test_videos_with_same_name_are_not_skipped(self):
+        # ties on the name are broken by primary key so no video is lost between pages
+        videos = [
+            Video.objects.create(name='Same', notes='example', url=f'https://www.youtube.com/watch?v={number}')
+            for number in range(3)
+        ]
+        response = self.client.get(reverse('video_list') + '?page_size=2')
+        response = self.client.get(reverse('video_list') + '?' + response.context['next_page_query'])
+        self.assertEqual(list(response.context['videos']), videos[2:])
+
+    def test_next_link_keeps_search_term(self):
+        self.create_videos(3)
+        response = self.client.get(reverse('video_list') + '?search_term=video&page_size=1')
+        self.assertIn('search_term=video', response.context['next_page_query'])
+
+    def test_invalid_cursor_shows_first_page(self):
+        videos = self.create_videos(2)
+        response = self.client.get(reverse('video_list') + '?cursor=not-a-real-cursor')
+        self.assertEqual(list(response.context['videos']), videos)
+
+    def test_tampered_cursor_shows_first_page(self):
+        videos = self.create_videos(2)
+        # well formed, but with values that aren't a name and a primary key
+        for values in [['a', {'k': 1}], ['a', 'x'], [1, 1], ['a', True], ['a', 2 ** 64], ['a', None]]:
+            cursor = encode_cursor(NEXT, values)
+            with self.subTest(values=values):
+                self.assertIsNone(decode_cursor(cursor))
+                response = self.client.get(reverse('video_list'), {'cursor': cursor})
+                self.assertEqual(list(response.context['videos']), videos)
+                response = self.client.get(reverse('api_video_list'), {'cursor': cursor})
+                self.assertEqual(200, response.status_code)
+
+
+class TestVideoEmbeds(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.video = Video.objects.create(name='abc', notes='example', url='https://www.youtube.com/watch?v=123')
+
+    def test_list_shows_thumbnails_instead_of_players(self):
+        response = self.client.get(reverse('video_list'))
+        self.assertContains(response, 'https://i.ytimg.com/vi/123/hqdefault.jpg')
+        self.assertContains(response, 'data-video-id="123"')
+        self.assertContains(response, 'js/facade.js')
+        self.assertNotContains(response, '<iframe')
+
+    def test_list_can_embed_players(self):
+        response = self.client.get(reverse('video_list'), {'embed': 'iframe'})
+        self.assertContains(response, 'src="https://youtube.com/embed/123"')
+        self.assertNotContains(response, 'js/facade.js')
+
+    def test_details_embed_mode_option(self):
+        url = reverse('video_details', kwargs={'video_pk': self.video.pk})
+        self.assertContains(self.client.get(url), '<iframe')
+
+        response = self.client.get(url, {'embed': 'facade'})
+        self.assertContains(response, 'data-video-id="123"')
+        self.assertNotContains(response, '<iframe')
+
+    @override_settings(VIDEO_LIST_EMBED='iframe')
+    def test_unknown_embed_mode_uses_default(self):
+        response = self.client.get(reverse('video_list'), {'embed': 'autoplay'})
+        self.assertContains(response, '<iframe')
+
+
 class TestVideoSearch(TestCase):
     def test_video_search_matches(self):
         v1 = Video.objects.create(name='ABC', notes='example', url='https://www.youtube.com/watch?v=456')
@@ -145,6 +286,1372 @@ class TestVideoSearch(TestCase):
         self.assertEqual(expected_video_order, videos_in_template)
         self.assertContains(response, 'No videos found.')
 
+class TestVideoSearchIndex(TestCase):
+
+    def search(self, search_term, **params):
+        response = self.client.get(reverse('video_list'), {'search_term': search_term, **params})
+        return list(response.context['videos'])
+
+    def test_search_matches_notes_and_word_prefixes(self):
+        v1 = Video.objects.create(name='Episode one', notes='An interview about podcasting', url='https://www.youtube.com/watch?v=123')
+        Video.objects.create(name='Episode two', notes='example', url='https://www.youtube.com/watch?v=456')
+
+        self.assertEqual([v1], self.search('interview'))
+        self.assertEqual([v1], self.search('podcast'))  # prefix of podcasting
+
+    def test_name_matches_ranked_above_notes_matches(self):
+        in_notes = Video.objects.create(name='Something else', notes='all about cats', url='https://www.youtube.com/watch?v=123')
+        in_name = Video.objects.create(name='Cats', notes='example', url='https://www.youtube.com/watch?v=456')
+
+        self.assertEqual([in_name, in_notes], self.search('cats'))
+
+    def test_index_follows_edits_and_deletes(self):
+        video = Video.objects.create(name='Before', notes='example', url='https://www.youtube.com/watch?v=123')
+        video.name = 'After'
+        video.save()
+
+        self.assertEqual([], self.search('before'))
+        self.assertEqual([video], self.search('after'))
+
+        video.delete()
+        self.assertEqual([], self.search('after'))
+
+    def test_search_syntax_in_search_term_is_treated_as_text(self):
+        video = Video.objects.create(name='Cats NEAR dogs', notes='example', url='https://www.youtube.com/watch?v=123')
+        self.assertEqual([video], self.search('"cats" NEAR('))
+        self.assertEqual([], self.search('!!!'))
+
+    def test_search_results_are_paginated(self):
+        videos = [
+            Video.objects.create(name=f'talk {number}', notes='example', url=f'https://www.youtube.com/watch?v={number}')
+            for number in range(3)
+        ]
+        response = self.client.get(reverse('video_list'), {'search_term': 'talk', 'page_size': 2})
+        first_page = list(response.context['videos'])
+        self.assertContains(response, '3 videos')
+
+        response = self.client.get(reverse('video_list') + '?' + response.context['next_page_query'])
+        second_page = list(response.context['videos'])
+
+        self.assertEqual(sorted(first_page + second_page, key=lambda video: video.pk), videos)
+
+    def test_rebuild_search_index_command(self):
+        video = Video.objects.create(name='Rebuilt', notes='example', url='https://www.youtube.com/watch?v=123')
+        call_command('rebuild_search_index', '--optimize', stdout=StringIO())
+        self.assertEqual([video], self.search('rebuilt'))
+
+
+class TestBulkImport(TestCase):
+
+    def test_bulk_add_csv_body_reports_each_rejected_row(self):
+        Video.objects.create(name='existing', notes='example', url='https://www.youtube.com/watch?v=123')
+        body = (
+            'name,url,notes\n'
+            'first,https://www.youtube.com/watch?v=456,some notes\n'
+            'already added,https://www.youtube.com/watch?v=123,\n'
+            'not youtube,https://minneapolis.edu?v=123456,\n'
+            'repeated,https://www.youtube.com/watch?v=456,\n'
+            ',https://www.youtube.com/watch?v=789,missing name\n'
+        )
+        response = self.client.post(reverse('bulk_add_videos'), data=body, content_type='text/csv')
+        report = response.json()
+
+        self.assertEqual(1, report['created'])
+        self.assertEqual(2, report['duplicates'])
+        self.assertEqual(2, report['invalid'])
+        self.assertEqual([3, 4, 5, 6], [error['line'] for error in report['errors']])
+
+        video = Video.objects.get(video_id='456')
+        self.assertEqual('first', video.name)
+        self.assertEqual('some notes', video.notes)
+        self.assertEqual(2, Video.objects.count())
+
+    def test_bulk_add_jsonl_upload(self):
+        lines = (
+            '{"name": "one", "url": "https://www.youtube.com/watch?v=111"}\n'
+            'not json\n'
+            '{"name": "two", "url": "https://www.youtube.com/watch?v=222", "notes": "example"}\n'
+        )
+        upload = SimpleUploadedFile('playlist.jsonl', lines.encode())
+        response = self.client.post(reverse('bulk_add_videos'), {'file': upload})
+        report = response.json()
+
+        self.assertEqual(2, report['created'])
+        self.assertEqual('invalid', report['errors'][0]['status'])
+        self.assertEqual(['111', '222'], list(Video.objects.order_by('video_id').values_list('video_id', flat=True)))
+
+    def test_bulk_add_jsonl_rows_with_values_that_arent_text(self):
+        lines = (
+            '{"name": 5, "url": "https://www.youtube.com/watch?v=111"}\n'
+            '{"name": "two", "url": ["https://www.youtube.com/watch?v=222"]}\n'
+            '{"name": "three", "url": "https://www.youtube.com/watch?v=333", "notes": null}\n'
+        )
+        response = self.client.post(reverse('bulk_add_videos') + '?format=jsonl', data=lines, content_type='application/octet-stream')
+        report = response.json()
+
+        self.assertEqual(1, report['created'])
+        self.assertEqual(2, report['invalid'])
+        self.assertEqual(['name must be text', 'url must be text'], [error['message'] for error in report['errors']])
+
+    def test_bulk_add_file_that_isnt_utf8(self):
+        body = (
+            'name,url,notes\n'
+            'first,https://www.youtube.com/watch?v=111,\n'
+        ).encode() + b'caf\xe9,https://www.youtube.com/watch?v=222,\n'
+        upload = SimpleUploadedFile('playlist.csv', body)
+        response = self.client.post(reverse('bulk_add_videos'), {'file': upload})
+        report = response.json()
+
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(1, report['created'])
+        self.assertEqual(1, report['invalid'])
+        self.assertEqual(3, report['errors'][0]['line'])
+        self.assertIn('utf-8', report['errors'][0]['message'])
+
+    def test_bulk_add_unknown_format_rejected(self):
+        response = self.client.post(reverse('bulk_add_videos'), data='hello', content_type='text/plain')
+        self.assertEqual(400, response.status_code)
+        self.assertEqual(0, Video.objects.count())
+
+    def test_import_videos_command_uses_batches(self):
+        rows = ''.join(f'video {number},https://www.youtube.com/watch?v={number},\n' for number in range(5))
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as import_file:
+            import_file.write('name,url,notes\n' + rows)
+        self.addCleanup(os.remove, import_file.name)
+
+        with CaptureQueriesContext(connection) as queries:
+            call_command('import_videos', import_file.name, '--batch-size', '2', stdout=StringIO())
+        self.assertEqual(5, Video.objects.count())
+
+        # 2 videos per batch: 3 batches, each with one duplicate check, one insert of videos
+        # and one insert of enrichment jobs
+        statements = [query['sql'].split()[0] for query in queries.captured_queries]
+        self.assertEqual(3, statements.count('SELECT'))
+        self.assertEqual(6, statements.count('INSERT'))
+        self.assertEqual(5, EnrichmentJob.objects.count())
+
+
+class TestPageCache(TestCase):
+
+    def test_repeat_request_served_from_cache(self):
+        Video.objects.create(name='abc', notes='example', url='https://www.youtube.com/watch?v=123')
+        url = reverse('video_list')
+        self.client.get(url)
+
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertContains(response, 'abc')
+
+    def test_each_search_cached_separately(self):
+        Video.objects.create(name='abc', notes='example', url='https://www.youtube.com/watch?v=123')
+        self.client.get(reverse('video_list'), {'search_term': 'abc'})
+
+        response = self.client.get(reverse('video_list'), {'search_term': 'kittens'})
+        self.assertContains(response, 'No videos found')
+
+    def test_saving_and_deleting_a_video_invalidates_pages(self):
+        video = Video.objects.create(name='abc', notes='example', url='https://www.youtube.com/watch?v=123')
+        list_url = reverse('video_list')
+        details_url = reverse('video_details', kwargs={'video_pk': video.pk})
+        self.client.get(list_url)
+        self.client.get(details_url)
+
+        video.name = 'renamed'
+        video.save()
+        self.assertContains(self.client.get(list_url), 'renamed')
+        self.assertContains(self.client.get(details_url), 'renamed')
+
+        video.delete()
+        self.assertContains(self.client.get(list_url), 'No videos found')
+        self.assertEqual(404, self.client.get(details_url).status_code)
+
+    def test_bulk_import_invalidates_pages(self):
+        self.client.get(reverse('video_list'))
+        body = 'name,url,notes\nimported,https://www.youtube.com/watch?v=456,\n'
+        self.client.post(reverse('bulk_add_videos'), data=body, content_type='text/csv')
+
+        self.assertContains(self.client.get(reverse('video_list')), 'imported')
+
+    def test_missing_video_not_cached(self):
+        url = reverse('video_details', kwargs={'video_pk': 1})
+        self.assertEqual(404, self.client.get(url).status_code)
+        Video.objects.create(name='abc', notes='example', url='https://www.youtube.com/watch?v=123')
+        cache.delete(caching.VERSION_KEY)  # even if the version is lost, the 404 was never stored
+
+        self.assertEqual(200, self.client.get(url).status_code)
+
+
+class TestVideoAPI(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.v1 = Video.objects.create(name='abc', notes='example', url='https://www.youtube.com/watch?v=123')
+        self.v2 = Video.objects.create(name='def', notes='cats', url='https://www.youtube.com/watch?v=456')
+
+    def test_list_is_paginated(self):
+        response = self.client.get(reverse('api_video_list'), {'page_size': 1})
+        data = response.json()
+
+        self.assertEqual(2, data['count'])
+        self.assertEqual([{'id': self.v1.pk, 'name': 'abc', 'url': 'https://www.youtube.com/watch?v=123', 'notes': 'example', 'video_id': '123'}], data['results'])
+        self.assertIsNone(data['previous'])
+
+        data = self.client.get(data['next']).json()
+        self.assertEqual(['def'], [video['name'] for video in data['results']])
+        self.assertIsNone(data['next'])
+
+    def test_list_search(self):
+        data = self.client.get(reverse('api_video_list'), {'search_term': 'cats'}).json()
+        self.assertEqual(1, data['count'])
+        self.assertEqual('456', data['results'][0]['video_id'])
+
+    def test_details_by_pk_and_video_id(self):
+        data = self.client.get(reverse('api_video_details', kwargs={'video_pk': self.v2.pk})).json()
+        self.assertEqual('def', data['name'])
+
+        data = self.client.get(reverse('api_video_details_by_video_id', kwargs={'video_id': '123'})).json()
+        self.assertEqual(self.v1.pk, data['id'])
+
+        response = self.client.get(reverse('api_video_details_by_video_id', kwargs={'video_id': 'nope'}))
+        self.assertEqual(404, response.status_code)
+
+    def test_conditional_get_returns_304_until_collection_changes(self):
+        url = reverse('api_video_list')
+        response = self.client.get(url)
+        self.assertTrue(response.has_header('Last-Modified'))
+        etag = response['ETag']
+
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(304, response.status_code)
+
+        Video.objects.create(name='ghi', notes='example', url='https://www.youtube.com/watch?v=789')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(3, response.json()['count'])
+
+    def test_api_is_read_only(self):
+        response = self.client.post(reverse('api_video_list'), {'name': 'new'})
+        self.assertEqual(405, response.status_code)
+
+
+class TestAsyncViews(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.factory = AsyncRequestFactory()
+        self.v1 = Video.objects.create(name='abc', notes='example', url='https://www.youtube.com/watch?v=123')
+        self.v2 = Video.objects.create(name='xyz', notes='about cats', url='https://www.youtube.com/watch?v=456')
+
+    async def test_async_video_list_is_paginated(self):
+        response = await views.async_video_list(self.factory.get('/video_list', {'page_size': 1}))
+        self.assertContains(response, '2 videos')
+        self.assertContains(response, 'abc')
+        self.assertNotContains(response, 'xyz')
+
+    async def test_async_search(self):
+        response = await views.async_video_list(self.factory.get('/video_list', {'search_term': 'cats'}))
+        self.assertContains(response, '1 video')
+        self.assertContains(response, 'xyz')
+
+    async def test_async_video_details(self):
+        response = await views.async_video_details(self.factory.get(f'/video_details/{self.v1.pk}'), video_pk=self.v1.pk)
+        self.assertContains(response, 'abc')
+
+        with self.assertRaises(Http404):
+            await views.async_video_details(self.factory.get('/video_details/999'), video_pk=999)
+
+    async def test_async_video_list_by_tag(self):
+        tag = await Tag.objects.acreate(name='Cats')
+        await self.v2.tags.aadd(tag)
+        response = await views.async_video_list(self.factory.get('/video_list', {'tag': 'cats'}))
+        self.assertContains(response, '1 video')
+        self.assertContains(response, '#Cats')
+        self.assertNotContains(response, '<h3>abc</h3>')
+
+
+@override_settings(SQLITE_PRAGMAS={'journal_mode': 'WAL', 'synchronous': 'NORMAL'})
+class TestDatabaseTuning(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        # a new connection, so it is set up with the pragmas above. The test database is in
+        # memory, which has no journal, so it is a scratch file instead
+        scratch = tempfile.TemporaryDirectory()
+        self.addCleanup(scratch.cleanup)
+        wrapper = type(connections['default'])
+        self.db_connection = wrapper({**connection.settings_dict, 'NAME': os.path.join(scratch.name, 'tuned.sqlite3')}, alias='tuned')
+        self.addCleanup(self.db_connection.close)
+
+    @skipUnless(connection.vendor == 'sqlite', 'SQLite pragmas')
+    def test_sqlite_pragmas_applied_to_connection(self):
+        self.assertEqual(1, sqlite_pragma(self.db_connection, 'synchronous'))  # 1 is NORMAL
+        # from the driver's timeout option, in milliseconds
+        self.assertEqual(20000, sqlite_pragma(self.db_connection, 'busy_timeout'))
+
+    @skipUnless(connection.vendor == 'sqlite', 'SQLite pragmas')
+    def test_wal_mode_on_database_file(self):
+        self.assertEqual('wal', sqlite_pragma(self.db_connection, 'journal_mode'))
+
+
+class TestRequestMetrics(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        instrumentation.registry.clear()
+        Video.objects.create(name='abc', notes='example', url='https://www.youtube.com/watch?v=123')
+
+    def test_server_timing_header(self):
+        response = self.client.get(reverse('video_list'))
+        server_timing = response['Server-Timing']
+
+        self.assertIn('desc="4 queries"', server_timing)  # the count, the page of videos, their tags and the tag cloud
+        self.assertIn('tpl;dur=', server_timing)
+        self.assertIn('total;dur=', server_timing)
+
+    def test_track_measures_queries_and_templates(self):
+        with instrumentation.track() as metrics:
+            list(Video.objects.all())
+            render_to_string('video_collection/home.html', {'app_name': 'Podcasts'})
+
+        self.assertEqual(1, metrics.queries)
+        self.assertGreater(metrics.template_seconds, 0)
+        self.assertIsNone(metrics.peak_memory)
+
+    def test_instrumented_engine_keeps_the_django_alias(self):
+        # code that looks the engine up as engines['django'] still finds it
+        self.assertIsInstance(engines['django'], instrumentation.InstrumentedDjangoTemplates)
+
+    @override_settings(VIDEO_METRICS_ALLOWED_IPS=['127.0.0.1']) # the test client's address
+    def test_metrics_endpoint_totals_per_view(self):
+        self.client.get(reverse('video_list'))
+        self.client.get(reverse('video_list'))
+
+        response = self.client.get(reverse('metrics'))
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        self.assertContains(response, 'video_request_duration_seconds_count{view="video_list"} 2')
+        self.assertContains(response, 'video_db_queries_total{view="video_list"} 4')  # second request came from the page cache
+
+    @override_settings(VIDEO_METRICS_ALLOWED_IPS=['10.0.0.5'])
+    def test_metrics_endpoint_only_for_allowed_ips_and_staff(self):
+        self.assertEqual(403, self.client.get(reverse('metrics'), REMOTE_ADDR='203.0.113.7').status_code)
+        self.assertEqual(200, self.client.get(reverse('metrics'), REMOTE_ADDR='10.0.0.5').status_code)
+
+        from django.contrib.auth.models import User
+        self.client.force_login(User.objects.create_user('someone', password='password'))
+        self.assertEqual(403, self.client.get(reverse('metrics'), REMOTE_ADDR='203.0.113.7').status_code)
+        self.client.force_login(User.objects.create_user('staff', password='password', is_staff=True))
+        self.assertEqual(200, self.client.get(reverse('metrics'), REMOTE_ADDR='203.0.113.7').status_code)
+
+    @override_settings(VIDEO_SLOW_REQUEST_MS=0, VIDEO_METRICS_TRACE_MEMORY=True)
+    def test_slow_requests_logged_with_peak_memory(self):
+        self.addCleanup(tracemalloc.stop)
+        with self.assertLogs('video_collection.requests', 'WARNING') as logs:
+            self.client.get(reverse('home'))
+
+        self.assertIn('Slow request GET / (home)', logs.output[0])
+        self.assertNotIn('not traced', logs.output[0])
+
+
+@override_settings(VIDEO_PUBLIC_PAGES=True)
+class TestPublicPages(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.video = Video.objects.create(name='abc', notes='example', url='https://www.youtube.com/watch?v=123')
+        self.client.cookies['sessionid'] = 'someone-elses-session'
+
+    def test_read_pages_are_publicly_cacheable(self):
+        urls = [
+            reverse('home'),
+            reverse('video_list'),
+            reverse('video_details', kwargs={'video_pk': self.video.pk}),
+            reverse('api_video_list'),
+        ]
+        for url in urls:
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(200, response.status_code)
+                self.assertIn('public', response['Cache-Control'])
+                self.assertIn('max-age=60', response['Cache-Control'])
+                self.assertIn('Accept-Encoding', response['Vary'])
+                self.assertNotIn('Cookie', response['Vary'])
+                self.assertEqual(0, len(response.cookies))
+
+    def test_session_and_auth_middleware_skipped(self):
+        with self.assertNumQueries(4):  # the count, the page, its tags and the tag cloud, no session lookup
+            response = self.client.get(reverse('video_list'))
+        self.assertFalse(hasattr(response.wsgi_request, 'session'))
+        self.assertFalse(hasattr(response.wsgi_request, 'user'))
+        self.assertEqual({}, response.wsgi_request.COOKIES)
+
+    def test_disallowed_host_rejected(self):
+        for url in [reverse('video_list'), reverse('api_video_list')]:
+            with self.subTest(url=url):
+                response = self.client.get(url, HTTP_HOST='evil.example')
+                self.assertEqual(400, response.status_code)
+                self.assertNotIn('public', response.get('Cache-Control', ''))
+
+    def test_write_pages_still_use_sessions(self):
+        response = self.client.get(reverse('add_video'))
+        self.assertTrue(hasattr(response.wsgi_request, 'session'))
+        self.assertNotIn('public', response.get('Cache-Control', ''))
+
+    @override_settings(VIDEO_PUBLIC_PAGES=False)
+    def test_public_pages_can_be_turned_off(self):
+        response = self.client.get(reverse('video_list'))
+        self.assertTrue(hasattr(response.wsgi_request, 'session'))
+
+
+class FlakyFetcher(enrichment.StubFetcher):
+    # fails the first few lookups, like YouTube being unreachable for a while
+
+    def __init__(self, failures, error=None):
+        super().__init__()
+        self.failures = failures
+        self.error = error or enrichment.FetchError('YouTube is down')
+
+    def fetch(self, video_ids):
+        if self.failures:
+            self.failures -= 1
+            raise self.error
+        return super().fetch(video_ids)
+
+
+@override_settings(VIDEO_ENRICHMENT_RETRY_SECONDS=0)
+class TestVideoEnrichment(TestCase):
+
+    def test_adding_a_video_queues_it_without_fetching(self):
+        self.client.post(reverse('add_video'), data={'name': 'example', 'url': 'https://www.youtube.com/watch?v=abc'})
+        video = Video.objects.get()
+        self.assertEqual(EnrichmentJob.PENDING, video.enrichment_job.status)
+        self.assertIsNone(video.title)
+
+    def test_worker_enriches_queued_videos_in_batches(self):
+        for number in range(5):
+            Video.objects.create(name=f'video {number}', url=f'https://www.youtube.com/watch?v=id{number}')
+        fetcher = enrichment.StubFetcher()
+
+        totals = enrichment.run(fetcher, batch_size=2, once=True)
+
+        self.assertEqual({'enriched': 5, 'retrying': 0, 'failed': 0}, totals)
+        self.assertEqual([2, 2, 1], [len(call) for call in fetcher.calls])
+        video = Video.objects.get(video_id='id3')
+        self.assertEqual('Video id3', video.title)
+        self.assertEqual(180, video.duration)
+        self.assertEqual('https://i.ytimg.com/vi/id3/hqdefault.jpg', video.thumbnail_url)
+        self.assertIsNotNone(video.enriched_at)
+        self.assertFalse(EnrichmentJob.objects.exclude(status=EnrichmentJob.DONE).exists())
+
+    def test_failed_lookups_are_retried_then_given_up(self):
+        Video.objects.create(name='example', url='https://www.youtube.com/watch?v=abc')
+
+        with override_settings(VIDEO_ENRICHMENT_MAX_ATTEMPTS=3), self.assertLogs('video_collection.enrichment', 'WARNING'):
+            self.assertEqual({'enriched': 1, 'retrying': 2, 'failed': 0}, enrichment.run(FlakyFetcher(2), once=True))
+            self.assertEqual(3, EnrichmentJob.objects.get().attempts)
+
+            Video.objects.create(name='another', url='https://www.youtube.com/watch?v=def')
+            self.assertEqual({'enriched': 0, 'retrying': 2, 'failed': 1}, enrichment.run(FlakyFetcher(5), once=True))
+
+        job = EnrichmentJob.objects.get(video__video_id='def')
+        self.assertEqual(EnrichmentJob.FAILED, job.status)
+        self.assertEqual('YouTube is down', job.last_error)
+
+    def test_unexpected_errors_retry_the_batch_without_stopping_the_worker(self):
+        Video.objects.create(name='example', url='https://www.youtube.com/watch?v=abc')
+        fetcher = FlakyFetcher(1, ConnectionResetError('Connection reset by peer'))
+
+        with self.assertLogs('video_collection.enrichment', 'ERROR'):
+            self.assertEqual({'enriched': 1, 'retrying': 1, 'failed': 0}, enrichment.run(fetcher, once=True))
+        job = EnrichmentJob.objects.get()
+        self.assertEqual((EnrichmentJob.DONE, 2), (job.status, job.attempts))
+
+    def test_api_fetcher_wraps_dropped_connections(self):
+        fetcher = enrichment.YouTubeDataAPIFetcher(api_key='key')
+        for error in [ConnectionResetError('Connection reset by peer'), http.client.RemoteDisconnected('closed'), http.client.IncompleteRead(b'')]:
+            with self.subTest(error=error), mock.patch.object(enrichment.request, 'urlopen', side_effect=error):
+                with self.assertRaises(enrichment.FetchError):
+                    fetcher.fetch(['abc'])
+
+    def test_retries_wait_for_the_backoff(self):
+        Video.objects.create(name='example', url='https://www.youtube.com/watch?v=abc')
+        with override_settings(VIDEO_ENRICHMENT_RETRY_SECONDS=600), self.assertLogs('video_collection.enrichment', 'WARNING'):
+            self.assertEqual({'enriched': 0, 'retrying': 1, 'failed': 0}, enrichment.run(FlakyFetcher(1), once=True))
+        self.assertEqual(EnrichmentJob.PENDING, EnrichmentJob.objects.get().status)
+
+    def test_videos_unknown_to_youtube_are_not_retried(self):
+        Video.objects.create(name='gone', url='https://www.youtube.com/watch?v=missing1')
+        self.assertEqual({'enriched': 0, 'retrying': 0, 'failed': 1}, enrichment.run(enrichment.StubFetcher(), once=True))
+        self.assertEqual(EnrichmentJob.FAILED, EnrichmentJob.objects.get().status)
+
+    def test_claimed_jobs_are_not_claimed_twice_until_stale(self):
+        Video.objects.create(name='example', url='https://www.youtube.com/watch?v=abc')
+        self.assertEqual(1, len(enrichment.claim_jobs(10)))
+        self.assertEqual([], enrichment.claim_jobs(10))
+        with override_settings(VIDEO_ENRICHMENT_LOCK_SECONDS=-1):
+            self.assertEqual(1, len(enrichment.claim_jobs(10)))
+
+    def test_enrich_videos_command_queues_missing_videos(self):
+        Video.objects.create(name='example', url='https://www.youtube.com/watch?v=abc')
+        EnrichmentJob.objects.all().delete()  # as if added before enrichment existed
+
+        with override_settings(VIDEO_METADATA_FETCHER='video_collection.enrichment.StubFetcher'):
+            out = StringIO()
+            call_command('enrich_videos', '--once', '--enqueue-missing', stdout=out)
+
+        self.assertIn('Enriched 1 videos', out.getvalue())
+        self.assertEqual('Video abc', Video.objects.get().title)
+
+    def test_details_page_shows_title_and_duration(self):
+        video = Video.objects.create(name='example', url='https://www.youtube.com/watch?v=abc', title='A title', duration=3723)
+        response = self.client.get(reverse('video_details', args=[video.pk]))
+        self.assertContains(response, 'A title')
+        self.assertContains(response, '1:02:03')
+
+    def test_parse_duration(self):
+        self.assertEqual(3723, enrichment.parse_duration('PT1H2M3S'))
+        self.assertEqual(90000, enrichment.parse_duration('P1DT1H'))
+        self.assertEqual(0, enrichment.parse_duration('P0D'))
+        self.assertIsNone(enrichment.parse_duration('soon'))
+
+
+class TestVideoDeduplication(TestCase):
+
+    def make_legacy_video(self, name, url, video_id, notes=''):
+        # a video stored before canonical URLs existed, with whatever video id was taken from it then
+        video = Video.objects.create(name=name, url='https://youtu.be/placeholder' + name)
+        Video.objects.filter(pk=video.pk).update(url=url, video_id=video_id, canonical_url=None, notes=notes)
+        return video
+
+    def test_save_sets_canonical_url(self):
+        video = Video.objects.create(name='example', url='https://youtu.be/abc?t=30')
+        self.assertEqual('https://www.youtube.com/watch?v=abc', video.canonical_url)
+
+    def test_form_rejects_same_video_with_other_parameters_before_insert(self):
+        Video.objects.create(name='example', url='https://www.youtube.com/watch?v=abc')
+        data = {'name': 'again', 'url': 'https://www.youtube.com/watch?v=abc&t=30s&list=PL1'}
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('add_video'), data=data, follow=True)
+
+        self.assertContains(response, 'That video has already been added')
+        self.assertFalse([query for query in queries.captured_queries if query['sql'].startswith('INSERT')])
+        self.assertEqual(1, Video.objects.count())
+
+    def test_import_rejects_same_video_with_other_parameters(self):
+        Video.objects.create(name='example', url='https://www.youtube.com/watch?v=abc')
+        body = 'name,url,notes\nagain,https://www.youtube.com/watch?v=abc&t=30s,\n'
+        report = self.client.post(reverse('bulk_add_videos'), data=body, content_type='text/csv').json()
+        self.assertEqual(1, report['duplicates'])
+        self.assertEqual(1, Video.objects.count())
+
+    def test_fill_canonical_urls_skips_unparseable_links(self):
+        old = self.make_legacy_video('old', 'https://www.youtube.com/watch?v=abc&t=30s', 'abc')
+        broken = self.make_legacy_video('broken', 'https://www.youtube.com/watch?v=a%20b', 'a b')
+
+        self.assertEqual(1, dedupe.fill_canonical_urls())
+
+        old.refresh_from_db()
+        broken.refresh_from_db()
+        self.assertEqual('https://www.youtube.com/watch?v=abc', old.canonical_url)
+        self.assertIsNone(broken.canonical_url)
+
+    def test_dedupe_command_merges_into_oldest_video(self):
+        oldest = self.make_legacy_video('oldest', 'https://www.youtube.com/watch?v=abc', 'abc;t=1')
+        newer = Video.objects.create(name='newer', url='https://www.youtube.com/watch?v=abc&t=30s', notes='keep me')
+        other = Video.objects.create(name='other', url='https://www.youtube.com/watch?v=def')
+
+        out = StringIO()
+        call_command('dedupe_videos', '--batch-size', '1', stdout=out)
+
+        self.assertIn('Merged 1 duplicated videos, deleted 1 videos', out.getvalue())
+        self.assertEqual([oldest.pk, other.pk], list(Video.objects.order_by('pk').values_list('pk', flat=True)))
+        oldest.refresh_from_db()
+        self.assertEqual('abc', oldest.video_id)
+        self.assertEqual('keep me', oldest.notes)
+        self.assertFalse(Video.objects.filter(pk=newer.pk).exists())
+
+    def test_merge_keeps_tags_and_playlist_places_of_duplicates(self):
+        oldest = self.make_legacy_video('oldest', 'https://www.youtube.com/watch?v=abc', 'abc;t=1')
+        newer = self.make_legacy_video('newer', 'https://youtu.be/abc?t=30', 'abc?t=30')
+        newest = self.make_legacy_video('newest', 'https://youtu.be/abc?t=60', 'abc?t=60')
+        dedupe.fill_canonical_urls()
+        shared, only_newer = Tag.objects.create(name='shared'), Tag.objects.create(name='only newer')
+        oldest.tags.add(shared)
+        newer.tags.add(shared, only_newer)
+        both, not_oldest = Playlist.objects.create(name='Both', slug='both'), Playlist.objects.create(name='Not oldest', slug='not-oldest')
+        PlaylistEntry.objects.create(playlist=both, video=oldest, position=5)
+        PlaylistEntry.objects.create(playlist=both, video=newer, position=1)
+        PlaylistEntry.objects.create(playlist=not_oldest, video=newest, position=3)
+        PlaylistEntry.objects.create(playlist=not_oldest, video=newer, position=7)
+
+        self.assertEqual(2, dedupe.merge_group('https://www.youtube.com/watch?v=abc'))
+
+        self.assertEqual({'shared', 'only newer'}, set(oldest.tags.values_list('name', flat=True)))
+        self.assertEqual([1, 1], [Tag.objects.get(pk=tag.pk).video_count for tag in (shared, only_newer)])
+        entries = PlaylistEntry.objects.filter(video=oldest).order_by('playlist__slug')
+        self.assertEqual([('both', 5), ('not-oldest', 3)], [(entry.playlist.slug, entry.position) for entry in entries])
+        self.assertEqual(2, PlaylistEntry.objects.count())
+
+    def test_dedupe_dry_run_changes_nothing(self):
+        Video.objects.create(name='one', url='https://www.youtube.com/watch?v=abc')
+        self.make_legacy_video('two', 'https://youtu.be/abc', 'abc?si=x')
+        self.make_legacy_video('three', 'https://youtu.be/abc?t=1', 'abc?si=y')
+        dedupe.fill_canonical_urls()
+
+        self.assertEqual((1, 2), dedupe.merge_duplicates(batch_size=1, dry_run=True))
+        self.assertEqual(3, Video.objects.count())
+
+
+class TestExport(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.videos = [
+            Video.objects.create(name=f'video {number}', url=f'https://www.youtube.com/watch?v=id{number}', notes='cats, "quoted"\nand more' if number == 1 else None)
+            for number in range(4)
+        ]
+
+    def test_export_streams_csv_in_id_order(self):
+        response = self.client.get(reverse('export_videos'))
+        self.assertTrue(response.streaming)
+        self.assertEqual('attachment; filename="videos.csv"', response['Content-Disposition'])
+
+        rows = list(csv.DictReader(StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual([video.pk for video in self.videos], [int(row['id']) for row in rows])
+        self.assertEqual('cats, "quoted"\nand more', rows[1]['notes'])
+
+    def test_export_jsonl_filtered_by_search_and_id_range(self):
+        response = self.client.get(reverse('export_videos'), {'format': 'jsonl', 'search_term': 'cats'})
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual(['id1'], [row['video_id'] for row in rows])
+
+        response = self.client.get(reverse('export_videos'), {'format': 'jsonl', 'after': self.videos[0].pk, 'until': self.videos[2].pk})
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual(['id1', 'id2'], [row['video_id'] for row in rows])
+
+    def test_export_rejects_bad_parameters(self):
+        self.assertEqual(400, self.client.get(reverse('export_videos'), {'format': 'xml'}).status_code)
+        self.assertEqual(400, self.client.get(reverse('export_videos'), {'after': 'yesterday'}).status_code)
+
+    def test_export_reads_rows_in_chunks(self):
+        lines = exporter.export_lines(exporter.export_queryset(), 'jsonl', chunk_size=2)
+        with CaptureQueriesContext(connection) as queries:
+            first = next(lines)
+            # nothing past the first chunk has been read yet
+            self.assertEqual(1, len(queries.captured_queries))
+            self.assertEqual('id0', json.loads(first)['video_id'])
+            self.assertEqual(3, len(list(lines)))
+
+    def test_exported_file_imports_back(self):
+        with tempfile.TemporaryDirectory() as scratch:
+            export_path = os.path.join(scratch, 'videos.csv')
+            err = StringIO()
+            call_command('export_videos', '--output', export_path, '--chunk-size', '1', stderr=err)
+            self.assertIn('Exported 4 videos', err.getvalue())
+
+            Video.objects.all().delete()
+            call_command('import_videos', export_path, stdout=StringIO())
+
+        self.assertEqual(['id0', 'id1', 'id2', 'id3'], list(Video.objects.order_by('video_id').values_list('video_id', flat=True)))
+        self.assertEqual('cats, "quoted"\nand more', Video.objects.get(video_id='id1').notes)
+
+
+class TestStaticPipeline(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        staticfiles.bundle_sources.cache_clear()
+        self.addCleanup(staticfiles.bundle_sources.cache_clear)
+
+    def vendor_water_css(self, directory):
+        # stands in for the file manage.py vendor_static downloads
+        os.makedirs(os.path.join(directory, 'css', 'vendor'))
+        with open(os.path.join(directory, 'css', 'vendor', 'water.css'), 'w') as vendored:
+            vendored.write('body { background: #202b38; color: #dbdbdb; }\n' * 40)
+
+    def test_unvendored_stylesheet_falls_back_to_its_url(self):
+        response = self.client.get(reverse('home'))
+        self.assertContains(response, 'https://cdn.jsdelivr.net/npm/water.css@2.1.1/out/dark.css')
+        self.assertContains(response, '/static/css/style.css')
+
+    def test_collectstatic_bundles_fingerprints_and_compresses(self):
+        with tempfile.TemporaryDirectory() as vendor_dir, tempfile.TemporaryDirectory() as static_root:
+            self.vendor_water_css(vendor_dir)
+            storages = {
+                'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+                'staticfiles': {'BACKEND': 'video_collection.staticfiles.CompressedManifestStaticFilesStorage'},
+            }
+            with override_settings(STATICFILES_DIRS=[vendor_dir], STATIC_ROOT=static_root, STORAGES=storages):
+                call_command('collectstatic', interactive=False, verbosity=0)
+
+                # one fingerprinted stylesheet, nothing from the CDN
+                page = self.client.get(reverse('home')).content.decode()
+                self.assertNotIn('cdn.jsdelivr.net', page)
+                self.assertRegex(page, r'href="/static/css/bundle\.[0-9a-f]{12}\.css"')
+                bundle_url = page.split('href="')[1].split('"')[0]
+
+                bundle_path = os.path.join(static_root, bundle_url[len('/static/'):])
+                with open(bundle_path, 'rb') as bundle, open(bundle_path + '.gz', 'rb') as compressed:
+                    content, compressed_content = bundle.read(), compressed.read()
+                self.assertIn(b'#202b38', content)
+                self.assertIn(b'.video-facade', content)
+                self.assertEqual(content, gzip.decompress(compressed_content))
+                self.assertLess(len(compressed_content), len(content) / 2)
+
+                # served by the app, compressed and cached for a year
+                response = self.client.get(bundle_url, HTTP_ACCEPT_ENCODING='gzip, deflate')
+                self.assertEqual(200, response.status_code)
+                self.assertEqual('gzip', response['Content-Encoding'])
+                self.assertEqual(compressed_content, b''.join(response.streaming_content))
+                self.assertIn('immutable', response['Cache-Control'])
+                self.assertIn('max-age=31536000', response['Cache-Control'])
+                self.assertEqual('Accept-Encoding', response['Vary'])
+
+                response = self.client.get(bundle_url, HTTP_IF_NONE_MATCH=response['ETag'])
+                self.assertEqual(304, response.status_code)
+
+                # names without a hash can change, so they are only cached briefly
+                response = self.client.get('/static/css/style.css')
+                self.assertEqual('public, max-age=60', response['Cache-Control'])
+                self.assertNotIn('Content-Encoding', response)
+
+
+class TestVideoListRendering(TestCase):
+
+    def test_details_urls_are_worked_out_once_per_page(self):
+        videos = [Video(pk=pk, name='example') for pk in (1, 20, 300)]
+        views.with_details_urls(videos)
+        self.assertEqual([reverse('video_details', args=[video.pk]) for video in videos], [video.details_url for video in videos])
+
+    def test_templates_compiled_once_by_cached_loader(self):
+        loader, = engines.all()[0].engine.template_loaders
+        self.assertIsInstance(loader, CachedLoader)
+        self.assertIs(loader.get_template('video_collection/base.html'), loader.get_template('video_collection/base.html'))
+
+    def test_list_links_to_each_video(self):
+        first = Video.objects.create(name='first', url='https://www.youtube.com/watch?v=abc')
+        second = Video.objects.create(name='second', url='https://www.youtube.com/watch?v=def')
+        response = self.client.get(reverse('video_list'))
+        self.assertContains(response, f'href="{reverse("video_details", args=[first.pk])}"')
+        self.assertContains(response, f'href="{reverse("video_details", args=[second.pk])}"')
+
+
+class TestTagsAndPlaylists(TestCase):
+
+    def make_videos(self, count):
+        return [Video.objects.create(name=f'video {number}', url=f'https://www.youtube.com/watch?v=id{number}') for number in range(count)]
+
+    def assertTagCounts(self, expected):
+        self.assertEqual(expected, dict(Tag.objects.values_list('slug', 'video_count')))
+
+    def test_add_form_tags_the_video(self):
+        data = {'name': 'example', 'url': 'https://www.youtube.com/watch?v=abc', 'tags': 'Comedy, news,, comedy '}
+        self.client.post(reverse('add_video'), data=data)
+        video = Video.objects.get()
+        self.assertEqual(['comedy', 'news'], sorted(video.tags.values_list('slug', flat=True)))
+        self.assertTagCounts({'comedy': 1, 'news': 1})
+
+    def test_tag_counts_follow_every_kind_of_change(self):
+        first, second, third = self.make_videos(3)
+        comedy, news = Tag.objects.create(name='comedy'), Tag.objects.create(name='news')
+
+        first.tags.add(comedy, news)
+        first.tags.add(comedy)  # already there, not counted twice
+        second.tags.add(comedy)
+        news.videos.add(second, third)
+        self.assertTagCounts({'comedy': 2, 'news': 3})
+
+        first.tags.remove(news)
+        third.tags.remove(comedy)  # was never tagged with it
+        self.assertTagCounts({'comedy': 2, 'news': 2})
+
+        second.tags.clear()
+        self.assertTagCounts({'comedy': 1, 'news': 1})
+
+        first.delete()
+        self.assertTagCounts({'comedy': 0, 'news': 1})
+
+        news.videos.clear()
+        self.assertTagCounts({'comedy': 0, 'news': 0})
+        self.assertEqual(0, tagging.recount_tags())
+
+    def test_recount_tags_repairs_counts(self):
+        video, = self.make_videos(1)
+        video.tags.add(Tag.objects.create(name='comedy'))
+        Tag.objects.update(video_count=7)
+        self.assertEqual(1, tagging.recount_tags())
+        self.assertTagCounts({'comedy': 1})
+
+    def test_list_filtered_by_tag_without_a_query_per_video(self):
+        videos = self.make_videos(6)
+        comedy, news = Tag.objects.create(name='comedy'), Tag.objects.create(name='news')
+        for video in videos[:4]:
+            video.tags.add(comedy, news)
+
+        # tag lookup, count, page, the page's tags and the tag cloud, however many videos
+        with self.assertNumQueries(5):
+            response = self.client.get(reverse('video_list'), {'tag': 'comedy'})
+        self.assertContains(response, '4 videos')
+        self.assertContains(response, 'Tagged comedy')
+        self.assertContains(response, '#news', count=4)
+        self.assertNotContains(response, 'video 5')
+        self.assertContains(response, 'comedy (4)')
+
+    def test_search_within_tag(self):
+        cats = Video.objects.create(name='cats', url='https://www.youtube.com/watch?v=abc')
+        Video.objects.create(name='more cats', url='https://www.youtube.com/watch?v=def')
+        cats.tags.add(Tag.objects.create(name='pets'))
+        response = self.client.get(reverse('video_list'), {'tag': 'pets', 'search_term': 'cats'})
+        self.assertContains(response, '1 video')
+        self.assertNotContains(response, 'more cats')
+
+    def test_unknown_tag_or_playlist_is_404(self):
+        self.assertEqual(404, self.client.get(reverse('video_list'), {'tag': 'nope'}).status_code)
+        self.assertEqual(404, self.client.get(reverse('video_list'), {'playlist': 'nope'}).status_code)
+
+    def test_playlist_pages_keep_playlist_order(self):
+        videos = self.make_videos(5)
+        playlist = Playlist.objects.create(name='Best of', description='The good ones')
+        for position, video in zip((30, 10, 50, 20), videos):
+            PlaylistEntry.objects.create(playlist=playlist, video=video, position=position)
+
+        names, query = [], 'playlist=best-of&page_size=2'
+        while query:
+            response = self.client.get(f'{reverse("video_list")}?{query}')
+            names += [video.name for video in response.context['videos']]
+            query = response.context['next_page_query']
+        self.assertEqual(['video 1', 'video 3', 'video 0', 'video 2'], names)
+        self.assertContains(response, 'Playlist: Best of')
+
+    def test_tagging_a_video_refreshes_cached_pages(self):
+        video, = self.make_videos(1)
+        self.client.get(reverse('video_list'))
+        video.tags.add(Tag.objects.create(name='comedy'))
+        self.assertContains(self.client.get(reverse('video_list')), '#comedy')
+
+
+@skipUnless(apps.is_installed('django.contrib.admin'), 'the admin is left out with VIDEO_PUBLIC_ONLY=1')
+class TestVideoAdmin(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        from django.contrib.auth.models import User
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'password'))
+        self.changelist_url = reverse('admin:video_collection_video_changelist')
+
+    def make_videos(self, count):
+        Video.objects.bulk_create([
+            Video(name=f'video {index}', url=f'https://www.youtube.com/watch?v=id{index}', video_id=f'id{index}',
+                  canonical_url=f'https://www.youtube.com/watch?v=id{index}')
+            for index in range(count)
+        ])
+        return list(Video.objects.order_by('-pk'))
+
+    def run_action(self, action, videos, **data):
+        data = {'action': action, 'post': 'yes', '_selected_action': [video.pk for video in videos], **data}
+        return self.client.post(self.changelist_url, data, follow=True)
+
+    def test_str_with_null_notes(self):
+        video = Video.objects.create(name='example', url='https://www.youtube.com/watch?v=abc', notes=None)
+        self.assertIn('Notes: ', str(video))
+        response = self.client.get(reverse('admin:video_collection_video_change', args=[video.pk]))
+        self.assertEqual(200, response.status_code)
+
+    def test_changelist_shows_videos_without_counting_whole_table(self):
+        Video.objects.create(name='no notes', url='https://www.youtube.com/watch?v=abc', notes=None)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.changelist_url)
+        self.assertContains(response, 'no notes')
+        counts = [query['sql'] for query in queries.captured_queries if 'COUNT(' in query['sql']]
+        # a small table is counted exactly, but never without a LIMIT
+        self.assertTrue(counts)
+        self.assertTrue(all('LIMIT' in sql for sql in counts))
+
+    @override_settings(VIDEO_ADMIN_COUNT_LIMIT=5)
+    def test_unfiltered_count_is_estimated(self):
+        self.make_videos(8)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.changelist_url)
+        self.assertFalse([query for query in queries.captured_queries if 'COUNT(' in query['sql']])
+        self.assertContains(response, 'about 8 videos')
+
+    @override_settings(VIDEO_ADMIN_COUNT_LIMIT=5)
+    def test_filtered_count_stops_at_limit(self):
+        self.make_videos(8)
+        response = self.client.get(self.changelist_url, {'q': 'video'})
+        self.assertContains(response, 'over 5 videos')
+
+    def test_cursor_pages(self):
+        from .admin import VideoAdmin
+        videos = self.make_videos(5)
+        with mock.patch.object(VideoAdmin, 'list_per_page', 3):
+            first = self.client.get(self.changelist_url)
+            self.assertEqual(videos[:3], list(first.context['cl'].result_list))
+            next_url = first.context['cl'].next_page_url
+            self.assertEqual(f'?cursor={videos[2].pk}', next_url)
+
+            second = self.client.get(self.changelist_url + next_url)
+            self.assertEqual(videos[3:], list(second.context['cl'].result_list))
+            self.assertIsNone(second.context['cl'].next_page_url)
+            self.assertContains(second, 'First page')
+
+    def test_sorting_by_column_uses_page_numbers(self):
+        self.make_videos(3)
+        response = self.client.get(self.changelist_url, {'o': '2'})
+        self.assertFalse(response.context['cl'].cursor_mode)
+        self.assertEqual(['video 0', 'video 1', 'video 2'], [video.name for video in response.context['cl'].result_list])
+
+    def test_bad_cursor(self):
+        response = self.client.get(self.changelist_url, {'cursor': 'abc'})
+        self.assertRedirects(response, self.changelist_url + '?e=1')
+
+    def test_search_uses_index_video_id_and_link(self):
+        Video.objects.create(name='Ocean documentary', url='https://www.youtube.com/watch?v=ocean1')
+        Video.objects.create(name='Cooking show', url='https://www.youtube.com/watch?v=cook1', notes='pasta')
+
+        for term, expected in [('pasta', 'Cooking show'), ('ocean1', 'Ocean documentary'), ('https://youtu.be/cook1', 'Cooking show')]:
+            response = self.client.get(self.changelist_url, {'q': term})
+            self.assertEqual([expected], [video.name for video in response.context['cl'].result_list])
+
+    @override_settings(VIDEO_ADMIN_CHUNK_SIZE=2)
+    def test_delete_videos_in_chunks(self):
+        videos = self.make_videos(5)
+        confirm = self.client.post(self.changelist_url, {'action': 'delete_videos', '_selected_action': [video.pk for video in videos[:3]]})
+        self.assertContains(confirm, 'delete the 3 selected videos')
+        self.assertEqual(5, Video.objects.count())
+
+        response = self.run_action('delete_videos', videos[:3])
+        self.assertContains(response, 'Deleted 3 videos')
+        self.assertEqual(set(videos[3:]), set(Video.objects.all()))
+
+    def test_built_in_delete_is_replaced(self):
+        response = self.client.get(self.changelist_url)
+        actions = [choice[0] for choice in response.context['action_form'].fields['action'].choices]
+        self.assertIn('delete_videos', actions)
+        self.assertNotIn('delete_selected', actions)
+
+    @override_settings(VIDEO_ADMIN_CHUNK_SIZE=2)
+    def test_add_and_remove_tags(self):
+        videos = self.make_videos(5)
+
+        self.run_action('add_tags', videos, tags='News, Comedy')
+        news = Tag.objects.get(slug='news')
+        self.assertEqual(5, news.videos.count())
+        self.assertEqual(5, news.video_count)
+
+        self.run_action('remove_tags', videos[:2], tags='news')
+        news.refresh_from_db()
+        self.assertEqual(3, news.video_count)
+        self.assertEqual(0, tagging.recount_tags())
+
+    def test_tag_actions_need_tags(self):
+        videos = self.make_videos(1)
+        response = self.run_action('add_tags', videos)
+        self.assertContains(response, 'Enter the tags')
+        self.assertFalse(Tag.objects.exists())
+
+    def test_revalidate_urls(self):
+        good, mangled, broken, duplicate = self.make_videos(4)
+        Video.objects.filter(pk=mangled.pk).update(url='https://youtu.be/fixed?t=3', video_id='fixed?t=3', canonical_url=None)
+        Video.objects.filter(pk=broken.pk).update(url='https://example.com/video')
+        Video.objects.filter(pk=duplicate.pk).update(url=f'https://youtu.be/{good.video_id}')
+
+        response = self.run_action('revalidate_urls', [good, mangled, broken, duplicate])
+
+        self.assertContains(response, 'Fixed 1 video.')
+        self.assertContains(response, f'1 not a valid YouTube link: ids {broken.pk}')
+        self.assertContains(response, f'1 already added under another id, run manage.py dedupe_videos: ids {duplicate.pk}')
+        mangled.refresh_from_db()
+        self.assertEqual(('fixed', 'https://www.youtube.com/watch?v=fixed'), (mangled.video_id, mangled.canonical_url))
+
+
+    def test_revalidate_urls_reports_videos_corrected_to_the_same_id(self):
+        first, second, third = self.make_videos(3)[::-1]
+        for video, suffix in [(first, '?t=1'), (second, '?t=2')]:
+            Video.objects.filter(pk=video.pk).update(url=f'https://youtu.be/same{suffix}', video_id=f'same{suffix}', canonical_url=None)
+        # already has the id a corrected link in the chunk would get
+        Video.objects.filter(pk=third.pk).update(url='https://youtu.be/taken?t=3', video_id='taken?t=3')
+        Video.objects.create(name='taken', url='https://www.youtube.com/watch?v=taken')
+
+        response = self.run_action('revalidate_urls', [first, second, third])
+
+        self.assertContains(response, 'Fixed 1 video.')
+        self.assertContains(response, f'2 already added under another id, run manage.py dedupe_videos: ids {second.pk}, {third.pk}')
+        self.assertEqual('same', Video.objects.get(pk=first.pk).video_id)
+        self.assertEqual('same?t=2', Video.objects.get(pk=second.pk).video_id)
+
+    def test_revalidate_urls_falls_back_to_one_video_at_a_time(self):
+        first, second = self.make_videos(2)[::-1]
+        # first is corrected to the id second has now, and second to a new one, which one
+        # UPDATE of both can fail at
+        Video.objects.filter(pk=first.pk).update(url='https://youtu.be/bbb', video_id='aaa')
+        Video.objects.filter(pk=second.pk).update(url='https://youtu.be/ccc', video_id='bbb')
+
+        response = self.run_action('revalidate_urls', [first, second])
+
+        self.assertContains(response, 'Fixed 2 videos.')
+        self.assertEqual(['bbb', 'ccc'], [Video.objects.get(pk=video.pk).video_id for video in (first, second)])
+
+class TestVideoIndexes(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        Video.objects.bulk_create([
+            Video(name=f'Video {index}', url=f'https://www.youtube.com/watch?v=id{index}', video_id=f'id{index}')
+            for index in range(30)
+        ])
+
+    def assertUsesIndex(self, queryset, index_name):
+        plan = queryset.explain()
+        self.assertIn(f'USING INDEX {index_name}', plan)
+        self.assertNotIn('TEMP B-TREE', plan) # rows come out of the index already sorted
+
+    def pages(self, sort=None):
+        videos, ordering = tagging.filtered_videos(sort=sort)
+        first = paginate(videos, None, 10, ordering)
+        return videos, ordering, [
+            page_queryset(videos, cursor, 10, ordering)[0]
+            for cursor in (None, first.next_cursor, first.next_cursor and paginate(videos, first.next_cursor, 10, ordering).previous_cursor)
+        ]
+
+    @skipUnless(connection.vendor == 'sqlite', 'SQLite query plans')
+    def test_list_pages_read_sort_name_index(self):
+        for page in self.pages()[2]:
+            self.assertUsesIndex(page, 'video_sort_name_idx')
+
+    @skipUnless(connection.vendor == 'sqlite', 'SQLite query plans')
+    def test_recent_pages_read_created_at_index(self):
+        for page in self.pages('recent')[2]:
+            self.assertUsesIndex(page, 'video_recent_idx')
+
+    @skipUnless(connection.vendor == 'sqlite', 'SQLite query plans')
+    def test_later_pages_start_from_the_cursor(self):
+        second_page = self.pages()[2][1]
+        self.assertIn('SEARCH', second_page.explain()) # not a SCAN from the first row
+
+    @skipUnless(connection.vendor == 'sqlite', 'SQLite query plans')
+    def test_sorting_by_name_reads_name_index(self):
+        self.assertUsesIndex(Video.objects.order_by('name')[:10], 'video_name_idx')
+
+    def test_timestamps(self):
+        video = Video.objects.create(name='example', url='https://www.youtube.com/watch?v=abc')
+        created_at = video.created_at
+        video.notes = 'changed'
+        video.save()
+        video.refresh_from_db()
+        self.assertEqual(created_at, video.created_at)
+        self.assertGreater(video.updated_at, created_at)
+
+    def test_recent_pages_walk_the_collection_newest_first(self):
+        videos, ordering = tagging.filtered_videos(sort='recent')
+        seen, cursor = [], None
+        while True:
+            page = paginate(videos, cursor, 7, ordering)
+            seen += [video.pk for video in page]
+            if not page.next_cursor:
+                break
+            cursor = page.next_cursor
+        newest_first = list(Video.objects.order_by('-created_at', '-id').values_list('pk', flat=True))
+        self.assertEqual(newest_first, seen)
+
+        back = paginate(videos, paginate(videos, cursor, 7, ordering).previous_cursor, 7, ordering)
+        self.assertEqual(newest_first[-9:-2], [video.pk for video in back])
+
+    def test_tampered_recent_cursor_shows_first_page(self):
+        newest_first = list(Video.objects.order_by('-created_at', '-id')[:25])
+        for values in [['garbage', 1], [None, None], ['2024-01-01T00:00:00', 1], [timezone.now(), None]]:
+            cursor = encode_cursor(NEXT, values)
+            with self.subTest(values=values):
+                self.assertIsNone(decode_cursor(cursor, RECENT_ORDERING))
+                response = self.client.get(reverse('video_list'), {'sort': 'recent', 'cursor': cursor})
+                self.assertEqual(newest_first, list(response.context['videos']))
+
+    def test_list_sorted_by_recently_added(self):
+        Video.objects.create(name='Aardvarks', url='https://www.youtube.com/watch?v=newest')
+        by_name = self.client.get(reverse('video_list'))
+        recent = self.client.get(reverse('video_list'), {'sort': 'recent'})
+        self.assertEqual('Aardvarks', by_name.context['videos'][0].name)
+        self.assertEqual('Aardvarks', recent.context['videos'][0].name)
+        self.assertEqual('Video 3', by_name.context['videos'][-1].name) # 0, 1, 10-19, 2, 20-29, 3
+        self.assertEqual('Video 6', recent.context['videos'][-1].name) # 29 down to 6
+        self.assertContains(by_name, 'href="?sort=recent"')
+
+class TestWriteThrottling(TestCase):
+
+    def add(self, index, **extra):
+        data = {'name': f'video {index}', 'url': f'https://www.youtube.com/watch?v=id{index}'}
+        return self.client.post(reverse('add_video'), data, **extra)
+
+    @override_settings(VIDEO_WRITE_RATE_LIMITS={'ip': (2, 60), 'global': None})
+    def test_add_limited_per_client(self):
+        self.assertEqual(302, self.add(1).status_code)
+        self.assertEqual(302, self.add(2).status_code)
+
+        response = self.add(3)
+        self.assertEqual(429, response.status_code)
+        self.assertEqual('30', response['Retry-After']) # one token comes back every 30 seconds
+        self.assertEqual(2, Video.objects.count())
+
+        # other clients have their own bucket, and just looking at the form is never limited
+        self.assertEqual(302, self.add(4, REMOTE_ADDR='10.0.0.2').status_code)
+        self.assertEqual(200, self.client.get(reverse('add_video')).status_code)
+
+    @override_settings(VIDEO_WRITE_RATE_LIMITS={'ip': None, 'global': (2, 60)})
+    def test_add_limited_across_clients(self):
+        self.add(1, REMOTE_ADDR='10.0.0.1')
+        self.add(2, REMOTE_ADDR='10.0.0.2')
+        self.assertEqual(429, self.add(3, REMOTE_ADDR='10.0.0.3').status_code)
+
+    @override_settings(VIDEO_WRITE_RATE_LIMITS={'ip': (1, 60)}, VIDEO_CLIENT_IP_HEADER='X-Forwarded-For')
+    def test_client_address_from_proxy_header(self):
+        self.add(1, HTTP_X_FORWARDED_FOR='1.2.3.4, 10.0.0.1')
+        # the address the proxy saw is used, not the one the client made up
+        self.assertEqual(429, self.add(2, HTTP_X_FORWARDED_FOR='5.6.7.8, 10.0.0.1').status_code)
+        self.assertEqual(302, self.add(3, HTTP_X_FORWARDED_FOR='10.0.0.2').status_code)
+
+    @override_settings(VIDEO_WRITE_RATE_LIMITS={'ip': (1, 60)})
+    def test_bulk_add_limited(self):
+        body = 'name,url,notes\nexample,https://www.youtube.com/watch?v=abc,\n'
+        self.assertEqual(200, self.client.post(reverse('bulk_add_videos'), data=body, content_type='text/csv').status_code)
+        response = self.client.post(reverse('bulk_add_videos'), data=body, content_type='text/csv')
+        self.assertEqual(429, response.status_code)
+        self.assertIn('Retry-After', response)
+
+    def test_buckets_refill_over_time(self):
+        buckets = {'bucket': (2, 10), 'other': (10, 10)}
+        self.assertEqual(0, ratelimit.take_token(buckets, now=100))
+        self.assertEqual(0, ratelimit.take_token(buckets, now=100))
+        self.assertAlmostEqual(5, ratelimit.take_token(buckets, now=100))
+        # a refused write takes nothing from the buckets that did have a token
+        self.assertEqual(8, cache.get('other')[0])
+        self.assertAlmostEqual(1, ratelimit.take_token(buckets, now=104))
+        self.assertEqual(0, ratelimit.take_token(buckets, now=105))
+
+    def test_coalesced_batch_commits_together_and_keeps_going_after_a_failure(self):
+        coalescer = writes.WriteCoalescer(max_batch=10, max_wait=0)
+        Video.objects.create(name='taken', url='https://www.youtube.com/watch?v=taken')
+        futures = []
+        for url in ('https://youtu.be/one', 'https://youtu.be/taken', 'https://youtu.be/two'):
+            future = writes.Future()
+            futures.append(future)
+            coalescer.queue.put((lambda url=url: Video.objects.create(name='new', url=url), future))
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(3, coalescer.run_batch(coalescer.next_batch()))
+
+        self.assertEqual('one', futures[0].result().video_id)
+        self.assertIsInstance(futures[1].exception(), IntegrityError)
+        self.assertEqual('two', futures[2].result().video_id)
+        self.assertEqual(3, Video.objects.count())
+        savepoints = [query for query in queries.captured_queries if query['sql'].startswith('SAVEPOINT')]
+        self.assertEqual(4, len(savepoints)) # the batch (inside the test's transaction) and one per write
+
+    def test_batch_that_cant_start_fails_every_write(self):
+        coalescer = writes.WriteCoalescer(max_batch=10, max_wait=0)
+        futures = [writes.Future() for _ in range(2)]
+        for future in futures:
+            coalescer.queue.put((lambda: self.fail('should not run'), future))
+
+        locked = mock.patch.object(writes.transaction, 'atomic', side_effect=OperationalError('database is locked'))
+        with locked, self.assertLogs('video_collection.writes', 'ERROR'):
+            self.assertEqual(2, coalescer.run_batch(coalescer.next_batch()))
+
+        for future in futures:
+            self.assertIsInstance(future.exception(timeout=0), OperationalError)
+
+    def test_next_batch_stops_at_max_batch(self):
+        coalescer = writes.WriteCoalescer(max_batch=2, max_wait=0.05)
+        for _ in range(3):
+            coalescer.queue.put((None, None))
+        self.assertEqual(2, len(coalescer.next_batch()))
+        self.assertEqual(1, len(coalescer.next_batch()))
+
+
+class TestCoalescedAdd(TransactionTestCase):
+
+    @override_settings(VIDEO_COALESCE_WRITES=True)
+    def test_add_saved_by_coalescing_thread(self):
+        with mock.patch.object(writes, '_coalescer', None):
+            response = self.client.post(reverse('add_video'), {'name': 'example', 'url': 'https://www.youtube.com/watch?v=abc'})
+            self.assertEqual(302, response.status_code)
+            self.assertTrue(Video.objects.filter(video_id='abc').exists())
+
+            # duplicates are still reported, the error comes back from the thread
+            response = self.client.post(reverse('add_video'), {'name': 'example', 'url': 'https://youtu.be/abc'}, follow=True)
+            self.assertContains(response, 'That video has already been added')
+            self.assertEqual('video-write-coalescer', writes._coalescer.thread.name)
+
+
+class TestViewCounts(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        viewcounts.take_pending() # views counted by other tests
+        self.v1 = Video.objects.create(name='abc', url='https://www.youtube.com/watch?v=123')
+        self.v2 = Video.objects.create(name='xyz', url='https://www.youtube.com/watch?v=456')
+
+    def view(self, video, times=1):
+        for _ in range(times):
+            self.assertEqual(200, self.client.get(reverse('video_details', args=[video.pk])).status_code)
+
+    def test_views_counted_in_memory_including_cached_pages(self):
+        self.view(self.v1) # renders and caches the page
+        with CaptureQueriesContext(connection) as queries:
+            self.view(self.v1, times=2) # served from the page cache
+        self.assertFalse(queries.captured_queries)
+        self.assertFalse(VideoStats.objects.exists())
+
+        self.assertEqual(3, viewcounts.flush())
+        self.assertEqual(3, VideoStats.objects.get(video=self.v1).views)
+
+    def test_only_successful_gets_counted(self):
+        self.client.head(reverse('video_details', args=[self.v1.pk]))
+        self.client.get(reverse('video_details', args=[999]))
+        self.assertEqual(0, viewcounts.flush())
+
+    def test_flush_adds_to_existing_counts_in_a_few_queries(self):
+        self.view(self.v1, times=2)
+        viewcounts.flush()
+        with mock.patch.object(viewcounts.timezone, 'now', return_value=timezone.now()):
+            self.view(self.v1, times=2)
+            self.view(self.v2, times=1)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(3, viewcounts.flush())
+        writes = [query for query in queries.captured_queries if query['sql'].startswith(('INSERT', 'UPDATE'))]
+        self.assertEqual(3, len(writes)) # one insert for new rows, one update per distinct count and second
+        self.assertEqual({self.v1.pk: 4, self.v2.pk: 1}, dict(VideoStats.objects.values_list('video', 'views')))
+
+    def test_flush_of_thousands_of_videos_in_chunks(self):
+        Video.objects.bulk_create([
+            Video(name=f'video {index}', url=f'https://www.youtube.com/watch?v=many{index}', video_id=f'many{index}')
+            for index in range(3000)
+        ])
+        video_pks = list(Video.objects.filter(video_id__startswith='many').values_list('pk', flat=True))
+        started = timezone.now()
+        for index, video_pk in enumerate(video_pks):
+            # spread over a few seconds, with some videos viewed twice
+            with mock.patch.object(viewcounts.timezone, 'now', return_value=started + timedelta(seconds=index % 3)):
+                for _ in range(1 + index % 2):
+                    viewcounts.record_view(video_pk)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(4500, viewcounts.flush())
+        updates = [query for query in queries.captured_queries if query['sql'].startswith('UPDATE')]
+        self.assertEqual(6, len(updates)) # one per count and second, each of 500 videos
+        self.assertEqual(4500, sum(VideoStats.objects.values_list('views', flat=True)))
+        self.assertEqual(
+            (started + timedelta(seconds=2)).replace(microsecond=0),
+            VideoStats.objects.get(video=video_pks[5]).last_viewed_at,
+        )
+
+    def test_deleted_videos_skipped(self):
+        self.view(self.v1)
+        self.v1.delete()
+        self.assertEqual(0, viewcounts.flush())
+        self.assertFalse(VideoStats.objects.exists())
+
+    def test_failed_flush_keeps_counts(self):
+        self.view(self.v1)
+        with mock.patch.object(VideoStats.objects, 'bulk_create', side_effect=IntegrityError('locked')):
+            with self.assertRaises(IntegrityError):
+                viewcounts.flush()
+        self.assertEqual(1, viewcounts.flush())
+
+    def test_last_viewed_is_when_each_video_was_viewed(self):
+        with mock.patch.object(viewcounts.timezone, 'now', return_value=timezone.now() - timedelta(minutes=5)):
+            self.view(self.v1)
+            self.view(self.v2, times=2)
+        self.view(self.v1)
+        viewcounts.flush()
+
+        stats = {stats.video: stats.last_viewed_at for stats in VideoStats.objects.all()}
+        self.assertGreater(stats[self.v1], stats[self.v2])
+        self.assertEqual([self.v1, self.v2], [stats.video for stats in viewcounts.recently_viewed()])
+
+        # a flush from another process with an earlier view doesn't move it back
+        with mock.patch.object(viewcounts.timezone, 'now', return_value=timezone.now() - timedelta(minutes=10)):
+            self.view(self.v1)
+        viewcounts.flush()
+        self.assertEqual(stats[self.v1], VideoStats.objects.get(video=self.v1).last_viewed_at)
+
+    @override_settings(VIDEO_VIEW_FLUSH_SECONDS=0)
+    def test_flushed_by_request_when_due(self):
+        self.view(self.v1)
+        self.assertEqual(1, VideoStats.objects.get(video=self.v1).views)
+
+    def test_popular_page(self):
+        self.view(self.v1, times=1)
+        self.view(self.v2, times=3)
+        viewcounts.flush()
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('popular_videos'))
+        self.assertEqual(2, len(queries.captured_queries)) # one per list, videos joined in
+        self.assertEqual([self.v2, self.v1], [stats.video for stats in response.context['most_viewed']])
+        self.assertContains(response, '3 views')
+        self.assertContains(response, f'href="/video_details/{self.v1.pk}"')
+
+    @skipUnless(connection.vendor == 'sqlite', 'SQLite query plans')
+    def test_lists_read_stats_indexes(self):
+        for queryset, index_name in [(viewcounts.most_viewed(), 'video_stats_popular_idx'), (viewcounts.recently_viewed(), 'video_stats_recent_idx')]:
+            plan = queryset.explain()
+            self.assertIn(index_name, plan)
+            self.assertNotIn('TEMP B-TREE', plan)
+
+    async def test_async_details_views_counted(self):
+        factory = AsyncRequestFactory()
+        await views.async_video_details(factory.get(f'/video_details/{self.v2.pk}'), video_pk=str(self.v2.pk))
+        self.assertEqual({self.v2.pk: 1}, dict(viewcounts.take_pending()[0]))
+
+
+class TestWarmStart(TestCase):
+
+    def test_templates_compiled_into_cached_loader(self):
+        # with the TEMPLATES from video.settings, as the workers run them
+        loader = engines['django'].engine.template_loaders[0]
+        loader.reset()
+        names = list(warmup.app_template_names())
+        self.assertIn('video_collection/video_list.html', names)
+        self.assertFalse([name for name in names if not name.startswith('video_collection/')])
+
+        self.assertEqual(len(names), warmup.compile_templates())
+        self.assertIn('video_collection/base.html', [template.name for template in loader.get_template_cache.values()])
+
+    def test_nothing_compiled_without_cached_loader(self):
+        options = dict(settings.TEMPLATES[0]['OPTIONS'], loaders=settings.TEMPLATE_LOADERS)
+        with self.settings(TEMPLATES=[dict(settings.TEMPLATES[0], OPTIONS=options)]):
+            self.assertEqual(0, warmup.compile_templates())
+
+    def test_warm_up_touches_no_database(self):
+        with CaptureQueriesContext(connection) as queries:
+            warmup.warm_up()
+        self.assertFalse(queries.captured_queries)
+        self.assertLessEqual({'templates', 'urls', 'static'}, set(warmup.boot_timings))
+
+    def test_ready_warms_up_when_turned_on(self):
+        config = apps.get_app_config('video_collection')
+        with mock.patch.object(warmup, 'warm_up') as warm_up:
+            config.ready()
+            warm_up.assert_not_called()
+            with self.settings(VIDEO_WARM_START=True):
+                config.ready()
+            warm_up.assert_called_once()
+
+    def test_public_only_worker_leaves_admin_out(self):
+        script = (
+            'import django, sys; django.setup()\n'
+            'from django.urls import Resolver404, resolve, reverse\n'
+            'reverse("video_list")\n'
+            'try:\n    resolve("/admin/")\nexcept Resolver404:\n    pass\nelse:\n    sys.exit("admin is routed")\n'
+            'sys.exit([name for name in sys.modules if name.startswith("django.contrib.admin")] or None)\n'
+        )
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE='video.settings', VIDEO_PUBLIC_ONLY='1')
+        result = subprocess.run([sys.executable, '-c', script], cwd=settings.BASE_DIR, env=env, capture_output=True, text=True)
+        self.assertEqual(0, result.returncode, result.stderr)
+
+
 class TestVideoModel(TestCase):
     
     # test that ensures a ValidationError is raised if an invalid url is used
@@ -172,6 +1679,58 @@ class TestVideoModel(TestCase):
         with self.assertRaises(IntegrityError):
             Video.objects.create(name='abc', notes='example', url='https://www.youtube.com/watch?v=123')
 
+class TestYouTubeURLParser(SimpleTestCase):
+
+    def test_accepted_url_forms(self):
+        urls = [
+            'https://www.youtube.com/watch?v=uASzNUFT5Dk',
+            'https://www.youtube.com/watch?v=uASzNUFT5Dk&t=30s',
+            'https://www.youtube.com/watch?list=PL123&v=uASzNUFT5Dk&index=2',
+            'https://www.youtube.com/watch?v=uASzNUFT5Dk#t=30',
+            'https://youtube.com/watch?v=uASzNUFT5Dk',
+            'https://m.youtube.com/watch?v=uASzNUFT5Dk',
+            'https://youtu.be/uASzNUFT5Dk',
+            'https://youtu.be/uASzNUFT5Dk?t=30',
+            'https://www.youtube.com/shorts/uASzNUFT5Dk',
+            'https://www.youtube.com/embed/uASzNUFT5Dk',
+        ]
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertEqual(
+                    ('uASzNUFT5Dk', 'https://www.youtube.com/watch?v=uASzNUFT5Dk'),
+                    parse_youtube_url(url),
+                )
+
+    def test_rejected_urls(self):
+        urls = [
+            'https://www.youtube.com/watch',
+            'https://www.youtube.com/watch?',
+            'https://www.youtube.com/watch?abc=123',
+            'https://www.youtube.com/watch?v=',
+            'https://www.youtube.com/shorts/',
+            'https://www.youtube.com.example.com/watch?v=123',
+            'https://minneapolis.edu?v=123456',
+            'http://www.youtube.com/watch?v=123',
+            'http://youtu.be/123',
+        ]
+        for url in urls:
+            with self.subTest(url=url):
+                with self.assertRaises(ValidationError):
+                    parse_youtube_url(url)
+
+    def test_invalid_urls_are_cached_too(self):
+        youtube.clear_cache()
+        for _ in range(2):
+            with self.assertRaises(ValidationError):
+                parse_youtube_url('https://minneapolis.edu')
+        self.assertEqual(1, youtube._parse.cache_info().hits)
+
+    def test_form_rejects_invalid_url_without_saving(self):
+        form = VideoForm({'name': 'example', 'url': 'https://minneapolis.edu', 'notes': ''})
+        self.assertFalse(form.is_valid())
+        self.assertEqual(['Invalid YouTube URL'], form.errors['url'])
+
+
 class TestVideoDetails(TestCase):
 
     # import fixture to populate database for tests
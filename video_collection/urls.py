@@ -1,9 +1,26 @@
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import api, instrumentation, views
+
+if settings.VIDEO_ASYNC_VIEWS:
+    video_list, video_details = views.async_video_list, views.async_video_details
+else:
+    video_list, video_details = views.video_list, views.video_details
 
 urlpatterns = [
     path('', views.home, name="home"),
     path('add', views.add, name="add_video"),
-    path('video_list', views.video_list, name="video_list"),
-    path('video_details/<str:video_pk>', views.video_details, name="video_details")
-]
\ No newline at end of file
+    path('add/bulk', views.bulk_add, name="bulk_add_videos"),
+    path('export', views.export, name="export_videos"),
+    path('video_list', video_list, name="video_list"),
+    path('video_details/<str:video_pk>', video_details, name="video_details"),
+    path('popular', views.popular, name="popular_videos"),
+
+    # read-only JSON API
+    path('api/videos', api.video_list, name="api_video_list"),
+    path('api/videos/<int:video_pk>', api.video_details, name="api_video_details"),
+    path('api/videos/by_video_id/<str:video_id>', api.video_details_by_video_id, name="api_video_details_by_video_id"),
+
+    # request metrics in Prometheus text format
+    path('metrics', instrumentation.metrics_view, name="metrics"),
+]
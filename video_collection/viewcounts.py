@@ -0,0 +1,152 @@
+import inspect
+import logging
+import threading
+import time
+from collections import Counter, defaultdict
+from functools import wraps
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.db.models import DateTimeField, F, Value
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+from .models import Video, VideoStats
+
+
+# view counts for the video details page
+#
+# an UPDATE per page view would have every visitor queue for SQLite's writer lock, so views are
+# counted in memory and added to VideoStats in one transaction every VIDEO_VIEW_FLUSH_SECONDS,
+# by whichever request comes along once that time is up. Each worker process keeps its own
+# counts, which add up in the table. Counts not yet flushed when a process stops are lost,
+# which is fine for a popularity list. The most viewed and recently viewed lists are plain
+# indexed reads of VideoStats.
+
+logger = logging.getLogger('video_collection.viewcounts')
+
+CHUNK_SIZE = 500 # videos per query, well under SQLite's limit on query parameters
+
+_lock = threading.Lock()
+_pending = Counter()
+_last_viewed = {} # video pk: when its latest counted view was
+_last_flush = time.monotonic()
+
+
+def record_view(video_pk):
+    # counts one view, and returns whether it is time to flush. Times are kept to the second,
+    # so the videos viewed in the same second can be updated together
+    now = timezone.now().replace(microsecond=0)
+    with _lock:
+        _pending[video_pk] += 1
+        _last_viewed[video_pk] = now
+        return time.monotonic() - _last_flush >= settings.VIDEO_VIEW_FLUSH_SECONDS
+
+
+def take_pending():
+    # (counts, last viewed times) of the views counted so far, which are forgotten here so other
+    # requests can go on counting
+    global _pending, _last_viewed, _last_flush
+    with _lock:
+        pending, _pending = _pending, Counter()
+        last_viewed, _last_viewed = _last_viewed, {}
+        _last_flush = time.monotonic()
+    return pending, last_viewed
+
+
+def put_back(pending, last_viewed):
+    with _lock:
+        _pending.update(pending)
+        for video_pk, viewed_at in last_viewed.items():
+            _last_viewed[video_pk] = max(viewed_at, _last_viewed.get(video_pk, viewed_at))
+
+
+def latest_view(viewed_at):
+    # viewed_at, unless another process has already stored a later time
+    viewed_at = Value(viewed_at, output_field=DateTimeField())
+    return Greatest(Coalesce('last_viewed_at', viewed_at), viewed_at)
+
+
+def chunks(items, size=CHUNK_SIZE):
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def flush():
+    """
+    Adds the views counted since the last flush to VideoStats and returns how many there were.
+    Videos deleted in the meantime are skipped.
+    """
+    pending, last_viewed = take_pending()
+    if not pending:
+        return 0
+    try:
+        existing = set()
+        for video_pks in chunks(pending):
+            existing.update(Video.objects.filter(pk__in=video_pks).values_list('pk', flat=True))
+        # videos viewed the same number of times, last in the same second, are updated
+        # together, as in tagging.adjust_tag_counts. There are only so many different counts
+        # and seconds in one flush, so the number of updates doesn't grow with the videos
+        groups = defaultdict(list)
+        for video_pk in existing:
+            groups[pending[video_pk], last_viewed[video_pk]].append(video_pk)
+        with transaction.atomic():
+            VideoStats.objects.bulk_create([VideoStats(video_id=video_pk) for video_pk in existing], ignore_conflicts=True)
+            for (count, viewed_at), group in groups.items():
+                for video_pks in chunks(group):
+                    VideoStats.objects.filter(video_id__in=video_pks).update(
+                        views=F('views') + count, last_viewed_at=latest_view(viewed_at),
+                    )
+    except Exception:
+        # put them back for next time rather than lose them
+        put_back(pending, last_viewed)
+        raise
+    return sum(pending[video_pk] for video_pk in existing)
+
+
+def flush_quietly():
+    # for flushing from a request, which shouldn't fail because the counts couldn't be saved
+    try:
+        flush()
+    except Exception:
+        logger.exception('Could not save view counts, will try again')
+
+
+def _counted(request, response):
+    return request.method == 'GET' and response.status_code == 200
+
+
+def counts_views(view):
+    """
+    Counts a view of the video_pk the view was called with for every successful GET. Goes above
+    cache_page_by_version, so views of cached pages are counted too. Works with both sync and
+    async views.
+    """
+    if inspect.iscoroutinefunction(view):
+        @wraps(view)
+        async def counted_async_view(request, video_pk, *args, **kwargs):
+            response = await view(request, video_pk, *args, **kwargs)
+            if _counted(request, response) and record_view(int(video_pk)):
+                await sync_to_async(flush_quietly)()
+            return response
+
+        return counted_async_view
+
+    @wraps(view)
+    def counted_view(request, video_pk, *args, **kwargs):
+        response = view(request, video_pk, *args, **kwargs)
+        if _counted(request, response) and record_view(int(video_pk)):
+            flush_quietly()
+        return response
+
+    return counted_view
+
+
+def most_viewed(limit=None):
+    limit = limit or settings.VIDEO_POPULAR_LIST_SIZE
+    return VideoStats.objects.filter(views__gt=0).select_related('video').order_by('-views', 'video')[:limit]
+
+
+def recently_viewed(limit=None):
+    limit = limit or settings.VIDEO_POPULAR_LIST_SIZE
+    return VideoStats.objects.filter(last_viewed_at__isnull=False).select_related('video').order_by('-last_viewed_at', 'video')[:limit]
@@ -1,16 +1,36 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import Http404, JsonResponse, StreamingHttpResponse
 from django.shortcuts import render, redirect, get_object_or_404
+from django.urls import reverse
+from django.views.decorators.http import require_POST, require_safe
 from django.contrib import messages
 from django.core.exceptions import ValidationError
 from django.db import IntegrityError
-from django.db.models.functions import Lower
+from django.db.models import prefetch_related_objects
+from . import exporter, importer, viewcounts, writes
+from .caching import cache_page_by_version
 from .forms import VideoForm, SearchForm
-from .models import Video
+from .models import Playlist, Tag, Video
+from .pagination import apaginate, get_page_size, page_query_string, paginate
+from .public import public_page
+from .ratelimit import rate_limited
+from .search import asearch_page, matching_videos, search_page
+from .tagging import filtered_videos, tag_cloud
 
 
+# 'iframe' embeds the YouTube player for each video, 'facade' shows a thumbnail that turns
+# into the player when it is clicked, which keeps long lists light to load
+EMBED_MODES = ('iframe', 'facade')
+
+
+@public_page
+@cache_page_by_version
 def home(request):
     app_name = 'Podcasts'
     return render(request, 'video_collection/home.html', {'app_name': app_name})
 
+@rate_limited
 def add(request):
     if request.method == 'POST':
         new_video_form = VideoForm(request.POST)
@@ -18,12 +38,16 @@ def add(request):
             
             # try-except to ensure that the video form is valid, otherwise errors will be raised
             try:
-                new_video_form.save()
+                writes.run_write(new_video_form.save) # saved with other adds if VIDEO_COALESCE_WRITES is on
                 return redirect('video_list')
             except ValidationError:
                 messages.warning(request, 'Invalid YouTube URL')
             except IntegrityError:
                 messages.warning(request, 'That video has already been added')
+        elif new_video_form.has_error('url', 'duplicate'): # the form checks for duplicates before saving
+            messages.warning(request, 'That video has already been added')
+        elif 'url' in new_video_form.errors: # the form checks the URL before trying to save it
+            messages.warning(request, 'Invalid YouTube URL')
     # if the request method is POST and the new video form is valid, it will be saved to the database
     # otherwise, the page will reload
         
@@ -33,24 +57,193 @@ def add(request):
     new_video_form = VideoForm()
     return render(request, 'video_collection/add.html', {'new_video_form': new_video_form})
 
+@require_POST
+@rate_limited
+def bulk_add(request):
+    # add many videos at once from an uploaded file, or from the request body itself,
+    # in CSV (name,url,notes columns) or JSON lines, and report what happened to each row
+    upload = request.FILES.get('file')
+    if upload is not None:
+        input_format = request.POST.get('format') or importer.guess_format(upload.name, upload.content_type or '')
+        lines = upload
+    else:
+        input_format = request.GET.get('format') or importer.guess_format('', request.content_type)
+        lines = request  # the request body is read line by line rather than all at once
+
+    if input_format not in importer.FORMATS:
+        return JsonResponse({'error': f'Send a CSV or JSON lines file, format must be one of {", ".join(importer.FORMATS)}'}, status=400)
+
+    rows = importer.read_rows(importer.decode_lines(lines), input_format)
+    report = importer.import_videos(rows)
+    return JsonResponse(report.as_dict())
+
+@public_page
+@require_safe
+def export(request):
+    # the whole collection, or the part matching ?search_term= and/or with ids in ?after= / ?until=,
+    # streamed as CSV or JSON lines without loading it into memory
+    output_format = request.GET.get('format', 'csv')
+    if output_format not in exporter.FORMATS:
+        return JsonResponse({'error': f'format must be one of {", ".join(exporter.FORMATS)}'}, status=400)
+    try:
+        after = int(request.GET['after']) if request.GET.get('after') else None
+        until = int(request.GET['until']) if request.GET.get('until') else None
+    except ValueError:
+        return JsonResponse({'error': 'after and until must be video ids'}, status=400)
+
+    videos = exporter.export_queryset(request.GET.get('search_term', '').strip(), after, until)
+    response = StreamingHttpResponse(exporter.export_lines(videos, output_format), content_type=exporter.CONTENT_TYPES[output_format])
+    response['Content-Disposition'] = f'attachment; filename="videos.{output_format}"'
+    return response
+
+@public_page
+@cache_page_by_version
 def video_list(request):
 
     search_form = SearchForm(request.GET) # build form from data user has sent to app
+    page_size = get_page_size(request.GET.get('page_size'))
+    cursor = request.GET.get('cursor')
+    # ?tag= and ?playlist= narrow the list down, 404 if there is no such tag or playlist
+    tag = _get_by_slug(Tag, request.GET.get('tag'))
+    playlist = _get_by_slug(Playlist, request.GET.get('playlist'))
+    sort = request.GET.get('sort') # ?sort=recent lists the newest videos first
 
     if search_form.is_valid():
         search_term = search_form.cleaned_data['search_term']
-        videos = Video.objects.filter(name__icontains=search_term).order_by(Lower('name'))
-        # searches for a video that contains the search term, orders it alphabetically and ignores case
+        if tag or playlist:
+            videos, ordering = filtered_videos(tag, playlist, sort)
+            page = paginate(matching_videos(search_term, videos), cursor, page_size, ordering)
+            # searches only the tag's or playlist's videos, which stay in list order
+        else:
+            page = search_page(search_term, cursor, page_size)
+            # searches the names and notes of the videos using the full text index, best matches first
     else: # form not valid, not filled in, user has not had chance to enter anything
         search_form = SearchForm()
-        videos = Video.objects.order_by('name')
+        videos, ordering = filtered_videos(tag, playlist, sort)
+        page = paginate(videos, cursor, page_size, ordering)
+        # all videos (or the tag's or playlist's), ordered alphabetically ignoring case, newest first or in playlist order
 
-    return render(request, 'video_collection/video_list.html', {'videos': videos, 'search_form': search_form})
+    prefetch_related_objects(page.items, 'tags') # the tags of every video on the page in one query
+    return _render_video_list(request, page, search_form, tag, playlist, list(tag_cloud()))
 
+@public_page
+@viewcounts.counts_views
+@cache_page_by_version
 def video_details(request, video_pk):
 
     video = get_object_or_404(Video, pk=video_pk) # grabs the video's primary key value to display which will be used to display only the video that has that primary key
                                                   # will 404 if no video with that primary key exists
     
-    return render(request, 'video_collection/video_details.html', {'video': video})
-    
\ No newline at end of file
+    return _render_video_details(request, video)
+
+@public_page
+@require_safe
+def popular(request):
+    # not page cached, view counts don't change the collection version. Both lists are short
+    # indexed reads of the video stats table
+    most_viewed = list(viewcounts.most_viewed())
+    recently_viewed = list(viewcounts.recently_viewed())
+    with_details_urls([stats.video for stats in most_viewed + recently_viewed])
+    return render(request, 'video_collection/popular.html', {
+        'most_viewed': most_viewed,
+        'recently_viewed': recently_viewed,
+    })
+
+# async versions of the read pages, used instead of the ones above when VIDEO_ASYNC_VIEWS is on
+# (see video/asgi.py). They run the same queries through the async ORM, so under an ASGI server
+# a worker isn't tied up while the database answers
+
+@public_page
+@cache_page_by_version
+async def async_video_list(request):
+
+    search_form = SearchForm(request.GET)
+    page_size = get_page_size(request.GET.get('page_size'))
+    cursor = request.GET.get('cursor')
+    tag = await _aget_by_slug(Tag, request.GET.get('tag'))
+    playlist = await _aget_by_slug(Playlist, request.GET.get('playlist'))
+    sort = request.GET.get('sort')
+
+    if search_form.is_valid():
+        search_term = search_form.cleaned_data['search_term']
+        if tag or playlist:
+            videos, ordering = filtered_videos(tag, playlist, sort)
+            # matching_videos may check the database for the search index the first time
+            videos = await sync_to_async(matching_videos)(search_term, videos)
+            page = await apaginate(videos, cursor, page_size, ordering)
+        else:
+            page = await asearch_page(search_term, cursor, page_size)
+    else:
+        search_form = SearchForm()
+        videos, ordering = filtered_videos(tag, playlist, sort)
+        page = await apaginate(videos, cursor, page_size, ordering)
+
+    await sync_to_async(prefetch_related_objects)(page.items, 'tags')
+    tags = [cloud_tag async for cloud_tag in tag_cloud()]
+    # everything the template needs has been loaded, so rendering doesn't touch the database
+    return _render_video_list(request, page, search_form, tag, playlist, tags)
+
+@public_page
+@viewcounts.counts_views
+@cache_page_by_version
+async def async_video_details(request, video_pk):
+
+    try:
+        video = await Video.objects.aget(pk=video_pk)
+    except Video.DoesNotExist:
+        raise Http404('No Video matches the given query.')
+
+    return _render_video_details(request, video)
+
+def _get_by_slug(model, slug):
+    return get_object_or_404(model, slug=slug) if slug else None
+
+async def _aget_by_slug(model, slug):
+    if not slug:
+        return None
+    try:
+        return await model.objects.aget(slug=slug)
+    except model.DoesNotExist:
+        raise Http404(f'No {model._meta.verbose_name} matches the given query.')
+
+def _render_video_list(request, page, search_form, tag=None, playlist=None, tags=()):
+    return render(request, 'video_collection/video_list.html', {
+        'tag': tag,
+        'playlist': playlist,
+        'tags': tags,
+        'sort_query': _sort_query_strings(request.GET),
+        'videos': with_details_urls(page.items),
+        'video_count': page.count,
+        'search_form': search_form,
+        'next_page_query': page_query_string(request.GET, page.next_cursor),
+        'previous_page_query': page_query_string(request.GET, page.previous_cursor),
+        'embed_mode': _embed_mode(request, settings.VIDEO_LIST_EMBED),
+    })
+
+def _render_video_details(request, video):
+    return render(request, 'video_collection/video_details.html', {
+        'video': video,
+        'embed_mode': _embed_mode(request, settings.VIDEO_DETAILS_EMBED),
+    })
+
+def with_details_urls(videos):
+    # sets details_url on each video with one reverse() for the whole page, rather than the
+    # template reversing the URL again for every row
+    prefix, suffix = reverse('video_details', args=[0]).rsplit('0', 1)
+    for video in videos:
+        video.details_url = f'{prefix}{video.pk}{suffix}'
+    return videos
+
+def _sort_query_strings(query):
+    # query strings for listing the same videos by name or newest first, starting from the first page
+    query = query.copy()
+    query.pop('cursor', None)
+    query.pop('sort', None)
+    by_name = query.urlencode()
+    query['sort'] = 'recent'
+    return {'name': by_name, 'recent': query.urlencode()}
+
+def _embed_mode(request, default):
+    # ?embed=iframe or ?embed=facade overrides how videos are shown on the page
+    embed_mode = request.GET.get('embed', default)
+    return embed_mode if embed_mode in EMBED_MODES else default
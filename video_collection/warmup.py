@@ -0,0 +1,95 @@
+import logging
+import os
+import time
+from contextlib import contextmanager
+from django.apps import apps
+from django.template import engines
+from django.template.loaders.cached import Loader as CachedLoader
+from django.urls import get_resolver, reverse
+from .staticfiles import bundle_sources, uses_bundle
+
+
+# warm start for web workers
+#
+# a new worker process would otherwise compile each template, build the URL resolver's
+# lookup tables and find the static files for the first request that needs them, so the first
+# visitors after a deploy or restart wait for all of that. With VIDEO_WARM_START on (the
+# default in video/wsgi.py and video/asgi.py, not for manage.py commands) it is done once in
+# VideoCollectionConfig.ready() instead. Run under a preloading server such as
+# `gunicorn --preload`, the work is shared by every forked worker. Nothing here touches the
+# database, connections made before a fork would be shared between the workers.
+
+logger = logging.getLogger('video_collection.warmup')
+
+TEMPLATE_PREFIX = 'video_collection/' # the site's pages, the admin's are compiled on first use
+
+# seconds spent on each part of starting up, for log_boot
+boot_timings = {}
+
+
+@contextmanager
+def timed_phase(name):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        boot_timings[name] = time.perf_counter() - started
+
+
+def app_template_names(prefix=TEMPLATE_PREFIX):
+    # names of the templates in video_collection/templates starting with prefix
+    root = os.path.join(apps.get_app_config('video_collection').path, 'templates')
+    for directory, _, filenames in os.walk(root):
+        for filename in filenames:
+            name = os.path.relpath(os.path.join(directory, filename), root).replace(os.sep, '/')
+            if name.startswith(prefix) and name.endswith('.html'):
+                yield name
+
+
+def uses_cached_loader(engine):
+    return any(isinstance(loader, CachedLoader) for loader in getattr(engine, 'engine', engine).template_loaders)
+
+
+def compile_templates():
+    """
+    Compiles the site's templates, and everything they extend or include, into the cached
+    loader. Returns how many were compiled, none if TEMPLATES has been set up without the
+    cached loader.
+    """
+    compiled = 0
+    for engine in engines.all():
+        if not uses_cached_loader(engine):
+            continue
+        for name in app_template_names():
+            engine.get_template(name)
+            compiled += 1
+    return compiled
+
+
+def warm_urls():
+    # reversing any name builds the resolver's lookup tables for all of them
+    reverse('home')
+    get_resolver().resolve('/')
+
+
+def warm_static_files():
+    # which stylesheets are local and, after collectstatic, the manifest of hashed names
+    bundle_sources()
+    uses_bundle()
+
+
+def warm_up():
+    with timed_phase('templates'):
+        compiled = compile_templates()
+    with timed_phase('urls'):
+        warm_urls()
+    with timed_phase('static'):
+        warm_static_files()
+    return compiled
+
+
+def log_boot(setup_seconds):
+    # called by video/wsgi.py and video/asgi.py once the application has been built
+    boot_timings['setup'] = setup_seconds
+    phases = ', '.join(f'{name} {seconds * 1000:.1f}ms' for name, seconds in boot_timings.items() if name != 'setup')
+    logger.info('Worker ready in %.1fms%s', setup_seconds * 1000, f' (warm start: {phases})' if phases else '')
@@ -0,0 +1,104 @@
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from django.conf import settings
+from django.db import close_old_connections, transaction
+
+
+# write coalescing for videos added one at a time
+#
+# with VIDEO_COALESCE_WRITES on, views.add hands each save to a background thread instead of
+# running it itself. The thread waits up to VIDEO_COALESCE_WAIT_MS for other saves to arrive
+# and runs up to VIDEO_COALESCE_MAX_BATCH of them in one transaction, so a burst of adds takes
+# SQLite's writer lock (and syncs the file) once rather than once per video. Each save still
+# runs in its own savepoint, so one duplicate doesn't undo the rest of the batch, and each
+# request waits for its own save to be committed before it answers.
+
+logger = logging.getLogger('video_collection.writes')
+
+RESULT_TIMEOUT = 30 # seconds a request waits for its save
+
+
+class WriteCoalescer:
+
+    def __init__(self, max_batch, max_wait):
+        self.max_batch = max_batch
+        self.max_wait = max_wait # seconds
+        self.queue = queue.Queue()
+        self.thread = None
+        self.lock = threading.Lock()
+
+    def submit(self, write):
+        # runs write() on the background thread, the returned future has its result or exception
+        future = Future()
+        self.queue.put((write, future))
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self.run, name='video-write-coalescer', daemon=True)
+                self.thread.start()
+        return future
+
+    def next_batch(self):
+        batch = [self.queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            # after the deadline, only what is already waiting
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self.queue.get(timeout=remaining) if remaining > 0 else self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def run(self):
+        while True:
+            self.run_batch(self.next_batch())
+            close_old_connections()
+
+    def run_batch(self, batch):
+        # futures are only finished once the transaction has committed, so nobody is told
+        # their video was added before it really is
+        outcomes = []
+        try:
+            with transaction.atomic():
+                for write, future in batch:
+                    if not future.set_running_or_notify_cancel():
+                        continue
+                    try:
+                        with transaction.atomic():
+                            outcomes.append((future, write(), None))
+                    except Exception as error:
+                        outcomes.append((future, None, error))
+        except Exception as error:
+            # not committed, or the transaction couldn't even be started (the database is
+            # locked, say), so every write in the batch failed, not just those that had run
+            logger.exception('Batch of %d writes failed to commit', len(batch))
+            outcomes = [(future, None, error) for _, future in batch if not future.cancelled()]
+        for future, result, error in outcomes:
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+        return len(outcomes)
+
+
+_coalescer = None
+_coalescer_lock = threading.Lock()
+
+
+def get_coalescer():
+    global _coalescer
+    with _coalescer_lock:
+        if _coalescer is None:
+            _coalescer = WriteCoalescer(settings.VIDEO_COALESCE_MAX_BATCH, settings.VIDEO_COALESCE_WAIT_MS / 1000)
+        return _coalescer
+
+
+def run_write(write):
+    # write() straight away, or on the coalescing thread when VIDEO_COALESCE_WRITES is on.
+    # Either way returns what it returned or raises what it raised
+    if not getattr(settings, 'VIDEO_COALESCE_WRITES', False):
+        return write()
+    return get_coalescer().submit(write).result(timeout=RESULT_TIMEOUT)
@@ -0,0 +1,85 @@
+import re
+from collections import namedtuple
+from functools import lru_cache
+from django.core.exceptions import ValidationError
+
+
+# YouTube URL parsing, shared by the Video model, the add form and the bulk importer
+#
+# these are pure functions - nothing here touches the database - so a URL can be checked
+# before anything is saved. Accepted forms, all https only:
+#
+#   https://www.youtube.com/watch?v=ID   (also youtube.com, m.youtube.com, music.youtube.com)
+#   https://www.youtube.com/shorts/ID
+#   https://www.youtube.com/embed/ID
+#   https://www.youtube.com/live/ID
+#   https://youtu.be/ID
+
+YouTubeURL = namedtuple('YouTubeURL', ['video_id', 'url'])
+
+# the same URLs get parsed repeatedly - once by the form, again by Video.save, and over and
+# over in imported playlists - so results are cached, including the URLs that are invalid
+CACHE_SIZE = 4096
+
+CANONICAL_URL = 'https://www.youtube.com/watch?v={}'
+
+# video ids are short strings of letters, digits, - and _ (real ones are 11 characters, the
+# database column allows up to 40)
+_VIDEO_ID = r'[A-Za-z0-9_-]{1,40}'
+
+_URL_PATTERN = re.compile(
+    r'https://(?:'
+    r'(?:(?:www|m|music)\.)?youtube\.com/(?:'
+    r'watch/?\?(?P<query>[^#]*)(?:#.*)?'
+    r'|(?:shorts|embed|live)/(?P<path_id>' + _VIDEO_ID + r')/?(?:[?#].*)?'
+    r')'
+    r'|youtu\.be/(?P<short_id>' + _VIDEO_ID + r')/?(?:[?#].*)?'
+    r')'
+)
+
+_YOUTUBE_PREFIX = re.compile(r'https://(?:(?:(?:www|m|music)\.)?youtube\.com|youtu\.be)/')
+
+_VIDEO_ID_PARAMETER = re.compile(r'(?:^|&)v=(' + _VIDEO_ID + r')(?:&|$)')
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _parse(url):
+    # returns a YouTubeURL, or an error message string (exceptions aren't cached by lru_cache)
+    match = _URL_PATTERN.fullmatch(url)
+    if match is None:
+        if _YOUTUBE_PREFIX.match(url):
+            return f'Invalid YouTube URL {url}'
+        return f'Not a YouTube URL {url}'
+
+    video_id = match.group('path_id') or match.group('short_id')
+    if video_id is None:
+        id_match = _VIDEO_ID_PARAMETER.search(match.group('query'))
+        if id_match is None:
+            return f'Invalid YouTube URL {url}'
+        video_id = id_match.group(1)
+
+    return YouTubeURL(video_id, CANONICAL_URL.format(video_id))
+
+
+def parse_youtube_url(url):
+    """
+    Returns (video_id, url) for a YouTube video URL, where url is the canonical
+    https://www.youtube.com/watch?v=ID form with any timestamps, playlists and tracking
+    parameters dropped. Raises ValidationError if the URL isn't a link to a YouTube video.
+    """
+    result = _parse(url)
+    if isinstance(result, str):
+        raise ValidationError(result)
+    return result
+
+
+def extract_video_id(url):
+    return parse_youtube_url(url).video_id
+
+
+def normalize_url(url):
+    return parse_youtube_url(url).url
+
+
+def clear_cache():
+    _parse.cache_clear()